@@ -5,12 +5,13 @@ ESP32S3 SuperMini API功能测试程序
 基于ttkbootstrap的现代化GUI测试工具
 
 功能特性：
-1. 设备发现和连接管理
+1. 设备发现和连接管理（启动时恢复并校验已知设备）
 2. RGB灯光控制测试
 3. HSV调光板测试
 4. UDP广播测试
-5. 设备状态监控
+5. 设备状态监控（后台自适应轮询，设备列表显示健康状态）
 6. 测试报告生成
+7. 设备操作在引擎的asyncio事件循环中运行，可取消，界面从不等待网络
 
 作者: ESP32开发团队
 版本: 1.0.0
@@ -18,18 +19,48 @@ ESP32S3 SuperMini API功能测试程序
 """
 
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext
+from tkinter import ttk, messagebox, scrolledtext, filedialog
 import ttkbootstrap as ttkb
 from ttkbootstrap.constants import *
-import requests
-import socket
-import threading
-import json
+import queue
 import time
 from datetime import datetime
 import os
 import math
-import random
+
+import esp32_color
+from esp32_trace import get_tracer, traced
+from esp32_async import UiBridge
+from esp32_bench import ENDPOINTS as BENCH_ENDPOINTS, LoadGenerator
+from esp32_bench import compare_results as compare_bench_results, load_result as load_bench_result
+from esp32_bench import export_result as export_bench_result, format_result as format_bench_result
+from esp32_core import TesterEngine
+from esp32_discovery import AnnouncementListener
+from esp32_fleet import summarize
+from esp32_palette import get_cache_dir, load_color_picker, load_hsv_wheel
+from esp32_monitor import DOWN, FLAPPING, HEALTHY, SLOW, UNKNOWN
+from esp32_registry import OFFLINE, default_registry_path
+from esp32_scenario import ScenarioError, load_scenario
+from esp32_results import Outcome
+
+# UDP广播界面刷新
+UDP_FLUSH_FPS = 10
+UDP_FLUSH_INTERVAL_MS = 1000 // UDP_FLUSH_FPS
+UDP_MESSAGES_PER_FLUSH = 20
+UDP_MAX_LINES = 1000
+UDP_OFFLINE_AFTER = 15.0  # 固件每5秒广播一次，连续3次未收到视为离线
+
+# 事件循环中的任务结果回到界面线程的周期
+UI_TICK_MS = 20
+SEQUENCE_GROUP = "sequence"   # 测试序列和灯效任务的分组（停止按钮取消）
+
+# 测试结果界面刷新
+RESULTS_TICK_MS = 100
+RESULTS_MAX_LINES = 2000
+STATE_SYNC_INTERVAL_MS = 10000  # 设备状态镜像校准周期
+HEALTH_FLUSH_MS = 1000          # 设备列表健康列刷新周期
+HEALTH_TEXT = {UNKNOWN: "-", HEALTHY: "健康", SLOW: "缓慢", FLAPPING: "不稳定", DOWN: "离线"}
+RESULT_ICONS = {Outcome.SUCCESS: "✅", Outcome.FAILURE: "❌", Outcome.INFO: "ℹ️"}
 
 class ESP32APITester:
     def __init__(self):
@@ -41,19 +72,96 @@ class ESP32APITester:
         )
         self.root.iconbitmap(default="")
         
-        # 设备连接状态
-        self.device_ip = ""
-        self.connected = False
-        self.device_info = {}
+        # 测试引擎（设备连接、控制、测试序列和结果记录），界面只负责展示
+        self.engine = TesterEngine(results_path=self.results_log_path(),
+                                   registry_path=default_registry_path())
+        # 测试线程只把结果放入队列，由主线程按固定间隔批量显示
+        self.result_queue = queue.SimpleQueue()
+        self.engine.result_listeners.append(self.result_queue.put)
+        # 设备操作都是引擎事件循环中的协程，完成回调经队列回到主线程，界面从不等待网络
+        self.ui_bridge = UiBridge()
         
-        # UDP广播监听
-        self.udp_listening = False
-        self.udp_thread = None
+        # UDP广播监听（后台接收，界面按固定帧率批量刷新）
+        self.discovery = AnnouncementListener()
+        self.udp_flush_job = None
+        self.udp_flush_count = 0
         
-        # 测试结果记录
-        self.test_results = []
+        # 设备信息面板中每个字段所在的行
+        self.info_lines = {}
+        self.state_syncing = False
+        
+        # 设备列表健康列当前显示的文本（只更新变化的单元格）
+        self.health_cells = {}
+        
+        # 正在运行的基准测试和最近一次的结果（用于与基线对比）
+        self.bench_generator = None
+        self.last_bench_result = None
         
         self.setup_ui()
+        self.engine.start_monitor()
+        self.load_known_devices()
+        self.root.after(UI_TICK_MS, self.drain_ui)
+        self.root.after(RESULTS_TICK_MS, self.drain_results)
+        self.root.after(HEALTH_FLUSH_MS, self.flush_health)
+        self.root.after(STATE_SYNC_INTERVAL_MS, self.sync_device_state)
+    
+    @staticmethod
+    def results_log_path():
+        """本次会话完整测试结果的JSONL文件（在缓存目录中）"""
+        directory = os.path.join(get_cache_dir(), "results")
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError:
+            return None  # 不能写入时只保留内存中的记录
+        return os.path.join(directory, f"results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl")
+    
+    # 设备连接状态和测试结果由引擎维护
+    
+    @property
+    def connected(self):
+        return self.engine.connected
+    
+    @property
+    def device_ip(self):
+        return self.engine.device_ip
+    
+    @property
+    def device_info(self):
+        return self.engine.device_info
+    
+    @property
+    def test_results(self):
+        return self.engine.test_results
+    
+    # ========== 后台任务 ==========
+    
+    def run_task(self, coro, on_done=None, on_error=None, group=None):
+        """在引擎事件循环中运行协程，完成后在主线程调用 on_done(结果) 或 on_error(异常)"""
+        future = self.engine.io_loop.submit(coro, group)
+        return self.ui_bridge.watch(future, on_done, on_error)
+    
+    def run_blocking(self, func, *args, on_done=None, on_error=None):
+        """在引擎的有界线程池中运行同步长任务（基准测试、回放、导出报告）
+
+        取消只停止等待，任务本身由 stop_sequences 通过各自的停止方法结束。
+        """
+        return self.run_task(self.engine.io_loop.run_blocking(func, *args), on_done, on_error)
+    
+    def drain_ui(self):
+        """执行事件循环和工作线程交给主线程的回调"""
+        try:
+            self.ui_bridge.drain()
+        finally:
+            self.root.after(UI_TICK_MS, self.drain_ui)
+    
+    def stop_sequences(self):
+        """停止测试序列、灯效、回放和基准测试"""
+        self.engine.stop_effect()
+        self.engine.io_loop.cancel(SEQUENCE_GROUP)
+        self.engine.stop_replay()
+        generator = self.bench_generator
+        if generator is not None:
+            generator.stop()
         
     def setup_ui(self):
         """设置用户界面"""
@@ -91,6 +199,8 @@ class ESP32APITester:
         
         ttkb.Button(discovery_frame, text="扫描局域网设备", 
                     command=self.scan_network, bootstyle=PRIMARY).pack(side=LEFT, padx=5)
+        ttkb.Button(discovery_frame, text="主动发现", 
+                    command=self.discover_devices, bootstyle=INFO).pack(side=LEFT, padx=5)
         ttkb.Button(discovery_frame, text="开始UDP监听", 
                     command=self.start_udp_listener, bootstyle=SUCCESS).pack(side=LEFT, padx=5)
         ttkb.Button(discovery_frame, text="停止UDP监听", 
@@ -101,7 +211,7 @@ class ESP32APITester:
         devices_frame.pack(fill=BOTH, expand=True, pady=5)
         
         # 设备列表树状视图
-        columns = ("IP地址", "设备ID", "设备名称", "状态")
+        columns = ("IP地址", "设备ID", "设备名称", "状态", "健康")
         self.device_tree = ttkb.Treeview(devices_frame, columns=columns, show="headings", height=8)
         
         for col in columns:
@@ -115,6 +225,45 @@ class ESP32APITester:
         scrollbar.pack(side=RIGHT, fill=Y)
         self.device_tree.configure(yscrollcommand=scrollbar.set)
         
+        # 批量控制区域（在设备列表中多选设备）
+        fleet_frame = ttkb.Labelframe(connection_frame, text="批量控制（多选设备）", padding=10)
+        fleet_frame.pack(fill=X, pady=5)
+        
+        fleet_buttons = ttkb.Frame(fleet_frame)
+        fleet_buttons.pack(fill=X)
+        
+        ttkb.Button(fleet_buttons, text="全部开灯", bootstyle=SUCCESS,
+                   command=lambda: self.fleet_command("电源ON", power="on")).pack(side=LEFT, padx=5)
+        ttkb.Button(fleet_buttons, text="全部关灯", bootstyle=DANGER,
+                   command=lambda: self.fleet_command("电源OFF", power="off")).pack(side=LEFT, padx=5)
+        
+        self.fleet_color_var = tk.IntVar(value=1)
+        ttkb.Spinbox(fleet_buttons, from_=0, to=7, width=3, 
+                    textvariable=self.fleet_color_var).pack(side=LEFT, padx=(15, 2))
+        ttkb.Button(fleet_buttons, text="设置颜色", bootstyle=INFO,
+                   command=self.fleet_set_color).pack(side=LEFT, padx=5)
+        ttkb.Button(fleet_buttons, text="同步亮度", bootstyle=WARNING,
+                   command=self.fleet_sync_brightness).pack(side=LEFT, padx=5)
+        ttkb.Button(fleet_buttons, text="同步HSV", bootstyle=PRIMARY,
+                   command=self.fleet_sync_hsv).pack(side=LEFT, padx=5)
+        ttkb.Button(fleet_buttons, text="批量完整测试", bootstyle="outline-success",
+                   command=self.fleet_full_test).pack(side=LEFT, padx=(15, 5))
+        ttkb.Button(fleet_buttons, text="运行场景...", bootstyle="outline-info",
+                   command=self.fleet_run_scenario).pack(side=LEFT, padx=5)
+        ttkb.Button(fleet_buttons, text="停止", bootstyle="outline-danger",
+                   command=self.engine.stop_fleet_test).pack(side=LEFT, padx=5)
+        
+        self.fleet_summary_label = ttkb.Label(fleet_buttons, text="")
+        self.fleet_summary_label.pack(side=RIGHT, padx=5)
+        
+        # 每个设备的执行结果
+        fleet_columns = ("IP地址", "结果", "状态码", "延迟(ms)", "错误")
+        self.fleet_tree = ttkb.Treeview(fleet_frame, columns=fleet_columns, show="headings", height=4)
+        for col in fleet_columns:
+            self.fleet_tree.heading(col, text=col)
+            self.fleet_tree.column(col, width=120)
+        self.fleet_tree.pack(fill=X, pady=(5, 0))
+        
         # 设备连接区域
         connect_frame = ttkb.Labelframe(connection_frame, text="设备连接", padding=10)
         connect_frame.pack(fill=X, pady=5)
@@ -225,9 +374,24 @@ class ESP32APITester:
                    command=self.hsv_gradient_test, bootstyle="outline-primary").pack(side=LEFT, padx=5)
         ttkb.Button(top_bar, text="🎲 随机颜色", 
                    command=self.random_color_test, bootstyle="outline-success").pack(side=LEFT, padx=5)
+        ttkb.Button(top_bar, text="⏹ 停止", 
+                   command=self.stop_sequences, bootstyle="outline-danger").pack(side=LEFT, padx=5)
         ttkb.Button(top_bar, text="🔄 重置", 
                    command=self.reset_hsv_params, bootstyle="outline-warning").pack(side=LEFT, padx=5)
         
+        # 发送频率限制和合并统计
+        self.send_stats_label = ttkb.Label(top_bar, text="已发送 0 | 已合并 0", 
+                                          font=("Consolas", 9), foreground="#7f8c8d")
+        self.send_stats_label.pack(side=RIGHT, padx=5)
+        
+        self.send_rate_var = tk.IntVar(value=self.engine.max_send_rate)
+        send_rate_spinbox = ttkb.Spinbox(top_bar, from_=1, to=100, width=4, 
+                                        textvariable=self.send_rate_var, command=self.update_send_rate)
+        send_rate_spinbox.pack(side=RIGHT, padx=5)
+        send_rate_spinbox.bind("<Return>", lambda e: self.update_send_rate())
+        send_rate_spinbox.bind("<FocusOut>", lambda e: self.update_send_rate())
+        ttkb.Label(top_bar, text="最大发送频率(次/秒):").pack(side=RIGHT)
+        
         # 主内容区域
         content_frame = ttkb.Frame(main_container)
         content_frame.pack(fill=BOTH, expand=True)
@@ -410,13 +574,57 @@ class ESP32APITester:
                    command=self.run_full_test, bootstyle=PRIMARY).pack(side=LEFT, padx=5)
         ttkb.Button(control_frame, text="生成测试报告", 
                    command=self.generate_report, bootstyle=SUCCESS).pack(side=LEFT, padx=5)
+        ttkb.Button(control_frame, text="导出JSON/CSV/JUnit", 
+                   command=self.export_reports, bootstyle=INFO).pack(side=LEFT, padx=5)
+        self.record_button = ttkb.Button(control_frame, text="⏺ 录制流量",
+                                         command=self.toggle_recording, bootstyle="outline-warning")
+        self.record_button.pack(side=LEFT, padx=5)
+        self.trace_button = ttkb.Button(control_frame, text="⏺ 性能追踪",
+                                        command=self.toggle_tracing, bootstyle="outline-secondary")
+        self.trace_button.pack(side=LEFT, padx=5)
+        ttkb.Button(control_frame, text="回放录制...", 
+                   command=self.replay_recording, bootstyle="outline-info").pack(side=LEFT, padx=5)
+        ttkb.Button(control_frame, text="停止",
+                   command=self.stop_sequences, bootstyle="outline-danger").pack(side=LEFT, padx=5)
         ttkb.Button(control_frame, text="清空测试记录", 
                    command=self.clear_test_results, bootstyle=DANGER).pack(side=LEFT, padx=5)
         
+        # 性能基准测试
+        bench_frame = ttkb.Labelframe(report_frame, text="性能基准测试", padding=10)
+        bench_frame.pack(fill=X, pady=5)
+        
+        ttkb.Label(bench_frame, text="接口:").pack(side=LEFT, padx=(0, 2))
+        self.bench_endpoint_var = tk.StringVar(value="info")
+        ttkb.Combobox(bench_frame, textvariable=self.bench_endpoint_var, width=10, state="readonly",
+                     values=list(BENCH_ENDPOINTS)).pack(side=LEFT, padx=(0, 10))
+        
+        ttkb.Label(bench_frame, text="速率(次/秒, 0=闭环):").pack(side=LEFT, padx=(0, 2))
+        self.bench_rate_var = tk.IntVar(value=20)
+        ttkb.Spinbox(bench_frame, from_=0, to=10000, width=6, 
+                    textvariable=self.bench_rate_var).pack(side=LEFT, padx=(0, 10))
+        
+        ttkb.Label(bench_frame, text="并发:").pack(side=LEFT, padx=(0, 2))
+        self.bench_concurrency_var = tk.IntVar(value=4)
+        ttkb.Spinbox(bench_frame, from_=1, to=256, width=4, 
+                    textvariable=self.bench_concurrency_var).pack(side=LEFT, padx=(0, 10))
+        
+        ttkb.Label(bench_frame, text="时长(秒):").pack(side=LEFT, padx=(0, 2))
+        self.bench_duration_var = tk.IntVar(value=10)
+        ttkb.Spinbox(bench_frame, from_=1, to=3600, width=5, 
+                    textvariable=self.bench_duration_var).pack(side=LEFT, padx=(0, 10))
+        
+        ttkb.Button(bench_frame, text="开始基准测试", 
+                   command=self.run_benchmark, bootstyle=INFO).pack(side=LEFT, padx=5)
+        ttkb.Button(bench_frame, text="与基线对比",
+                   command=self.compare_benchmark, bootstyle=SECONDARY).pack(side=LEFT, padx=5)
+        
         # 测试结果
         results_frame = ttkb.Labelframe(report_frame, text="测试结果", padding=10)
         results_frame.pack(fill=BOTH, expand=True, pady=5)
         
+        self.results_summary_label = ttkb.Label(results_frame, text="总测试数: 0 | 成功: 0 | 失败: 0")
+        self.results_summary_label.pack(anchor=W, pady=(0, 5))
+        
         self.results_text = scrolledtext.ScrolledText(results_frame, height=20, width=80)
         self.results_text.pack(fill=BOTH, expand=True)
         
@@ -424,166 +632,275 @@ class ESP32APITester:
     
     def scan_network(self):
         """扫描局域网设备"""
-        self.add_test_result("开始扫描局域网设备", "信息")
-        
         # 清空设备列表
         for item in self.device_tree.get_children():
             self.device_tree.delete(item)
+        self.health_cells.clear()
         
-        # 使用ARP扫描当前网段设备
-        def arp_scan():
-            import subprocess
-            import re
-            
-            try:
-                # 获取本机IP和子网掩码
-                result = subprocess.run(['ipconfig'], capture_output=True, text=True)
-                
-                # 解析IP地址和子网掩码
-                ip_match = re.search(r'IPv4 Address[^\d]*(\d+\.\d+\.\d+\.\d+)', result.stdout)
-                subnet_match = re.search(r'Subnet Mask[^\d]*(\d+\.\d+\.\d+\.\d+)', result.stdout)
-                
-                if ip_match and subnet_match:
-                    ip = ip_match.group(1)
-                    subnet = subnet_match.group(1)
-                    
-                    # 计算网段
-                    ip_parts = ip.split('.')
-                    subnet_parts = subnet.split('.')
-                    
-                    # 确定网段范围
-                    network_parts = []
-                    for i in range(4):
-                        if subnet_parts[i] == '255':
-                            network_parts.append(ip_parts[i])
-                        else:
-                            network_parts.append('0')
-                    
-                    network_base = '.'.join(network_parts)
-                    
-                    # 扫描当前网段
-                    devices_found = []
-                    
-                    # 扫描当前网段的前20个IP地址
-                    for i in range(1, 21):
-                        target_ip = f"{network_parts[0]}.{network_parts[1]}.{network_parts[2]}.{i}"
-                        
-                        # 跳过本机IP
-                        if target_ip == ip:
-                            continue
-                        
-                        try:
-                            # 使用ping检测设备是否在线
-                            result = subprocess.run(['ping', '-n', '1', '-w', '1000', target_ip], 
-                                                   capture_output=True, text=True)
-                            
-                            if result.returncode == 0:
-                                # 尝试获取设备信息
-                                try:
-                                    response = requests.get(f"http://{target_ip}/api/info", timeout=2)
-                                    if response.status_code == 200:
-                                        device_info = response.json()
-                                        devices_found.append((
-                                            target_ip,
-                                            device_info.get('device_id', '未知'),
-                                            device_info.get('device_name', '未知设备'),
-                                            "在线"
-                                        ))
-                                except:
-                                    # 不是ESP32设备，但显示为普通设备
-                                    devices_found.append((target_ip, "未知", "网络设备", "在线"))
-                                    
-                        except:
-                            pass
-                    
-                    # 在主线程中更新设备列表
-                    self.root.after(0, lambda d=devices_found: self.update_device_list(d))
-                    
-            except Exception as e:
-                self.root.after(0, lambda: self.add_test_result(f"网络扫描失败: {str(e)}", "失败"))
+        # 并发扫描本机所在的全部网段，结果流式加入设备列表（失败原因已记录到测试结果）
+        self.run_task(self.engine.scan_async(lambda r: self.ui_bridge.post(self.add_scanned_device, r)))
+    
+    def discover_devices(self):
+        """主动发现设备（/api/discover），保留列表中已有的设备，缓存未过期的地址不重新探测"""
+        self.run_task(self.engine.discover_async(lambda r: self.ui_bridge.post(self.add_scanned_device, r)))
+    
+    def load_known_devices(self):
+        """把注册表中的已知设备立即加入设备列表，再在后台并发校验是否在线"""
+        entries = self.engine.registry.entries()
+        if not entries:
+            return
+        for entry in entries:
+            self.upsert_device_row(entry.ip, (entry.ip, entry.device_id, entry.device_name, "校验中"))
+            self.engine.monitor.add(entry.ip, entry.device_id)
         
-        # 在后台线程中执行扫描
-        threading.Thread(target=arp_scan, daemon=True).start()
+        self.run_task(self.engine.validate_registry_async(
+            lambda r: self.ui_bridge.post(self.show_known_device, r)))
     
-    def update_device_list(self, devices):
-        """更新设备列表"""
-        for item in self.device_tree.get_children():
-            self.device_tree.delete(item)
+    @traced()
+    def show_known_device(self, result):
+        """显示已知设备的校验结果（地址变化时替换原来的行）"""
+        entry = result.entry
+        status = "离线" if result.status == OFFLINE else "在线"
+        if result.ip != result.old_ip:
+            self.engine.monitor.remove(result.old_ip)
+            self.engine.monitor.add(result.ip, entry.device_id)
+        self.upsert_device_row(result.ip, (result.ip, entry.device_id, entry.device_name, status),
+                               result.old_ip)
+    
+    @traced()
+    def add_scanned_device(self, result):
+        """添加扫描到的设备到列表"""
+        if result.info is not None:
+            device = (
+                result.ip,
+                result.info.get('device_id', '未知'),
+                result.info.get('device_name', '未知设备'),
+                "在线"
+            )
+            if 'device_id' in result.info:
+                self.engine.monitor.add(result.ip, str(result.info['device_id']))
+        else:
+            # 不是ESP32设备，但显示为普通设备
+            device = (result.ip, "未知", "网络设备", "在线")
         
-        for device in devices:
-            self.device_tree.insert("", "end", values=device)
+        self.upsert_device_row(result.ip, device)
+    
+    def upsert_device_row(self, ip, values, old_ip=None):
+        """按IP更新设备列表行（行ID即IP，无需遍历列表）"""
+        tree = self.device_tree
+        if old_ip and old_ip != ip and tree.exists(old_ip):
+            tree.delete(old_ip)
+            self.health_cells.pop(old_ip, None)
+        if tree.exists(ip):
+            # 保留 values 之后的列（健康列由 flush_health 更新）
+            values = tuple(values) + tuple(tree.item(ip, 'values'))[len(values):]
+            tree.item(ip, values=values)
+        else:
+            tree.insert("", "end", iid=ip, values=values)
+    
+    @traced()
+    def flush_health(self):
+        """把健康监控的结果刷新到设备列表的健康列（只改变化的单元格）"""
+        tree = self.device_tree
+        for health in self.engine.monitor.devices():
+            if not tree.exists(health.address):
+                continue
+            text = HEALTH_TEXT[health.state]
+            if health.state != UNKNOWN:
+                median = health.series.median_rtt()
+                if median is not None:
+                    text += f" {median * 1000:.0f}ms"
+                if health.series.count:
+                    text += f" {health.series.availability() * 100:.0f}%"
+            if self.health_cells.get(health.address) != text:
+                self.health_cells[health.address] = text
+                tree.set(health.address, "健康", text)
+        
+        self.root.after(HEALTH_FLUSH_MS, self.flush_health)
+    
+    def get_selected_ips(self):
+        """设备列表中所有选中设备的IP"""
+        return [self.device_tree.item(item, 'values')[0] for item in self.device_tree.selection()]
+    
+    def fleet_command(self, name, **params):
+        """向选中的所有设备并发发送控制命令"""
+        ips = self.get_selected_ips()
+        if not ips:
+            messagebox.showerror("错误", "请在设备列表中选择设备（可按住Ctrl/Shift多选）")
+            return
         
-        self.add_test_result(f"发现 {len(devices)} 个设备", "成功")
+        self.add_test_result(f"批量{name} ({len(ips)}台)", "开始")
+        start = time.perf_counter()
+        self.run_task(self.engine.fleet.control_async(ips, **params),
+                      lambda results: self.show_fleet_results(name, results,
+                                                              time.perf_counter() - start))
+    
+    def fleet_set_color(self):
+        """批量设置预设颜色"""
+        try:
+            color = int(self.fleet_color_var.get())
+        except (tk.TclError, ValueError):
+            messagebox.showerror("错误", "颜色编号应为0-7")
+            return
+        self.fleet_command(f"设置颜色 {color}", color=color)
+    
+    def fleet_sync_brightness(self):
+        """批量设置为RGB控制页的亮度"""
+        brightness = int(self.brightness_var.get())
+        self.fleet_command(f"设置亮度 {brightness}%", brightness=brightness)
+    
+    def fleet_sync_hsv(self):
+        """批量设置为HSV调光板的当前参数"""
+        hue = self.hue_var.get()
+        saturation = self.saturation_var.get()
+        value_val = self.value_var.get()
+        brightness = self.hsv_brightness_var.get()
+        self.fleet_command(f"HSV设置 H{hue}° S{saturation}% V{value_val}% B{brightness}%",
+                           hue=hue, saturation=saturation, value=value_val, brightness=brightness)
+    
+    def fleet_full_test(self):
+        """在选中的所有设备上并发运行完整测试"""
+        ips = self.get_selected_ips()
+        if not ips:
+            messagebox.showerror("错误", "请在设备列表中选择设备（可按住Ctrl/Shift多选）")
+            return
+        self.start_suite(ips, lambda on_device: self.engine.run_fleet_test_async(ips, on_device=on_device))
+    
+    def fleet_run_scenario(self):
+        """在选中的设备（未选择时为当前连接的设备）上运行场景文件"""
+        ips = self.get_selected_ips() or ([self.device_ip] if self.connected else [])
+        if not ips:
+            messagebox.showerror("错误", "请在设备列表中选择设备或先连接设备")
+            return
+        
+        path = filedialog.askopenfilename(
+            title="选择场景文件",
+            filetypes=[("场景文件", "*.json *.yaml *.yml"), ("所有文件", "*.*")])
+        if not path:
+            return
+        try:
+            scenario = load_scenario(path)
+        except (OSError, ScenarioError) as e:
+            messagebox.showerror("错误", f"场景文件无效: {str(e)}")
+            return
+        
+        self.start_suite(ips, lambda on_device: self.engine.run_scenario_async(
+            scenario, ips, on_device=on_device))
+    
+    def start_suite(self, ips, run_suite):
+        """在引擎事件循环中运行批量测试（run_suite(on_device) 返回协程），每台设备完成时更新结果列表
+
+        “停止”按钮调用 engine.stop_fleet_test，在途请求立即中断，已完成的设备仍显示结果。
+        """
+        for item in self.fleet_tree.get_children():
+            self.fleet_tree.delete(item)
+        self.fleet_summary_label.config(text=f"测试进行中 (0/{len(ips)})")
+        
+        finished = []
+        
+        def on_device(run):
+            finished.append(run)
+            self.ui_bridge.post(self.show_suite_run, run, len(finished), len(ips))
+        
+        def done(runs):
+            passed = sum(1 for run in runs if run.ok)
+            self.fleet_summary_label.config(
+                text=f"通过 {passed} | 失败 {len(runs) - passed} | "
+                     f"耗时 {time.perf_counter() - start:.1f}s")
+        
+        start = time.perf_counter()
+        self.run_task(run_suite(on_device), on_done=done)
+    
+    @traced()
+    def show_suite_run(self, run, finished, total):
+        """显示一台设备的完整测试结果"""
+        latency = run.latency.percentile(99) / 1000 if run.latency.count else 0.0
+        self.fleet_tree.insert("", "end", values=(
+            run.ip, "通过" if run.ok else "失败", f"{run.passed}/{run.total_steps}",
+            f"{latency:.1f}", run.first_error()))
+        self.fleet_summary_label.config(text=f"测试进行中 ({finished}/{total})")
+    
+    @traced()
+    def show_fleet_results(self, name, results, elapsed):
+        """显示批量命令的每设备结果"""
+        for item in self.fleet_tree.get_children():
+            self.fleet_tree.delete(item)
+        
+        for r in results:
+            self.fleet_tree.insert("", "end", values=(
+                r.ip, "成功" if r.ok else "失败", r.status if r.status is not None else "-",
+                f"{r.latency * 1000:.1f}", r.error))
+        
+        success, failed, max_latency = summarize(results)
+        summary = f"成功 {success} | 失败 {failed} | 耗时 {elapsed * 1000:.0f}ms"
+        self.fleet_summary_label.config(text=summary)
+        self.add_test_result(f"批量{name} ({len(results)}台) {summary}", 
+                             "成功" if failed == 0 else f"失败: {failed}台")
     
     def start_udp_listener(self):
         """启动UDP监听"""
-        if self.udp_listening:
+        if self.discovery.running:
             messagebox.showwarning("警告", "UDP监听器已在运行中")
             return
         
-        self.udp_listening = True
-        self.udp_thread = threading.Thread(target=self.udp_listener, daemon=True)
-        self.udp_thread.start()
+        try:
+            self.discovery.start()
+        except OSError as e:
+            self.add_udp_message(f"UDP监听错误: {str(e)}")
+            self.add_test_result("启动UDP监听器", f"失败: {str(e)}")
+            return
         
-        self.add_udp_message("UDP监听器已启动")
+        self.udp_flush_job = self.root.after(UDP_FLUSH_INTERVAL_MS, self.flush_discovery)
+        self.add_udp_message(f"UDP监听器已启动 (网卡: {', '.join(self.discovery.joined)})")
         self.add_test_result("启动UDP监听器", "成功")
     
     def stop_udp_listener(self):
         """停止UDP监听"""
-        self.udp_listening = False
+        self.discovery.stop()
+        if self.udp_flush_job is not None:
+            self.root.after_cancel(self.udp_flush_job)
+            self.udp_flush_job = None
+        self.flush_discovery(reschedule=False)
         self.add_udp_message("UDP监听器已停止")
         self.add_test_result("停止UDP监听器", "成功")
     
-    def udp_listener(self):
-        """UDP监听线程"""
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        
-        try:
-            # 绑定到组播地址和端口
-            sock.bind(('0.0.0.0', 8888))
-            
-            # 加入组播组
-            mreq = socket.inet_aton("224.0.0.1") + socket.inet_aton("0.0.0.0")
-            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
-            
-            sock.settimeout(1.0)  # 设置超时以便检查停止标志
-            
-            while self.udp_listening:
-                try:
-                    data, addr = sock.recvfrom(1024)
-                    message = data.decode('utf-8')
-                    
-                    # 在主线程中更新UI
-                    self.root.after(0, lambda a=addr[0], m=message: self.add_udp_message(f"来自 {a}: {m}"))
-                    
-                    # 解析设备信息并添加到设备列表
-                    try:
-                        device_info = json.loads(message)
-                        if 'device_id' in device_info:
-                            self.root.after(0, lambda d=device_info, a=addr[0]: self.add_discovered_device(d, a))
-                    except:
-                        pass
-                        
-                except socket.timeout:
-                    continue
-                    
-        except Exception as e:
-            self.root.after(0, lambda: self.add_udp_message(f"UDP监听错误: {str(e)}"))
-        finally:
-            sock.close()
-    
-    def add_discovered_device(self, device_info, ip):
-        """添加发现的设备到列表"""
-        device_id = device_info.get('device_id', '未知')
-        device_name = device_info.get('device_name', '未知设备')
-        
-        # 检查是否已存在
-        for item in self.device_tree.get_children():
-            if self.device_tree.item(item, 'values')[0] == ip:
-                return
-        
-        self.device_tree.insert("", "end", values=(ip, device_id, device_name, "在线"))
+    @traced()
+    def flush_discovery(self, reschedule=True):
+        """把上一帧以来的广播消息和设备变更批量刷新到界面"""
+        # 新增设备或IP/名称变化的设备
+        for device, old_ip in self.discovery.index.drain_changes():
+            self.engine.registry.update(device.device_id, device.ip, device.device_name,
+                                        device.mac_address)
+            if old_ip and old_ip != device.ip:
+                self.engine.monitor.remove(old_ip)
+            self.engine.monitor.add(device.ip, device.device_id)
+            self.upsert_device_row(device.ip, (device.ip, device.device_id, device.device_name, "在线"),
+                                   old_ip)
+        
+        # 约每秒检查一次长时间没有广播的设备
+        self.udp_flush_count += 1
+        if self.udp_flush_count % UDP_FLUSH_FPS == 0:
+            now = time.monotonic()
+            for device in self.discovery.index:
+                # 最近一秒内收到的广播是免费的在线信号
+                if device.age(now) <= 1.0:
+                    self.engine.monitor.note_announcement(device.ip)
+                if self.device_tree.exists(device.ip):
+                    status = "离线" if device.age(now) > UDP_OFFLINE_AFTER else "在线"
+                    if self.device_tree.set(device.ip, "状态") != status:
+                        self.device_tree.set(device.ip, "状态", status)
+        
+        # 原始消息：每帧只显示最近的若干条
+        messages = self.discovery.drain_messages()
+        if messages:
+            skipped = len(messages) - UDP_MESSAGES_PER_FLUSH
+            lines = [f"来自 {ip}: {text}" for ip, text in messages[-UDP_MESSAGES_PER_FLUSH:]]
+            if skipped > 0:
+                lines.insert(0, f"（省略 {skipped} 条消息，共收到 {self.discovery.received} 条）")
+            self.add_udp_message("\n".join(lines))
+        
+        if reschedule and self.discovery.running:
+            self.udp_flush_job = self.root.after(UDP_FLUSH_INTERVAL_MS, self.flush_discovery)
     
     def on_device_select(self, event):
         """设备选择事件"""
@@ -595,61 +912,84 @@ class ESP32APITester:
             self.ip_entry.insert(0, ip)
     
     def connect_device(self):
-        """连接设备"""
+        """连接设备（在事件循环中连接，完成后更新界面）"""
         ip = self.ip_entry.get().strip()
         if not ip:
             messagebox.showerror("错误", "请输入设备IP地址")
             return
         
-        try:
-            # 测试连接
-            response = requests.get(f"http://{ip}/api/info", timeout=5)
-            if response.status_code == 200:
-                self.device_info = response.json()
-                self.device_ip = ip
-                self.connected = True
-                
-                # 更新设备信息显示
-                self.update_device_info()
-                
-                self.add_test_result(f"连接设备 {ip}", "成功")
-                messagebox.showinfo("成功", f"已成功连接到设备 {ip}")
-            else:
-                raise Exception(f"HTTP {response.status_code}")
-                
-        except Exception as e:
-            self.add_test_result(f"连接设备 {ip}", f"失败: {str(e)}")
-            messagebox.showerror("错误", f"连接设备失败: {str(e)}")
+        def connected(info):
+            # 更新设备信息显示（新设备完整重绘）
+            self.info_lines = {}
+            self.update_device_info()
+            messagebox.showinfo("成功", f"已成功连接到设备 {ip}")
+        
+        self.run_task(self.engine.connect_async(ip), connected,
+                      lambda e: messagebox.showerror("错误", f"连接设备失败: {str(e)}"))
     
     def disconnect_device(self):
         """断开设备连接"""
-        self.connected = False
-        self.device_ip = ""
-        self.device_info = {}
+        self.engine.disconnect()
+        self.info_lines = {}
         
         self.info_text.config(state=NORMAL)
         self.info_text.delete(1.0, tk.END)
         self.info_text.insert(tk.END, "设备已断开连接")
         self.info_text.config(state=DISABLED)
-        
-        self.add_test_result("断开设备连接", "成功")
     
+    @traced()
     def update_device_info(self):
-        """更新设备信息显示"""
+        """更新设备信息显示（只重绘状态镜像中变化的字段）"""
         if not self.connected:
             return
         
+        mirror = self.engine.mirror
+        changed = mirror.drain_changes()
+        info = mirror.info()
+        if list(info) != list(self.info_lines):
+            self.render_device_info(info)
+            return
+        if not changed:
+            return
+        
+        self.info_text.config(state=NORMAL)
+        for key in changed:
+            line = self.info_lines.get(key)
+            if line is not None:
+                self.info_text.delete(f"{line}.0", f"{line}.end")
+                self.info_text.insert(f"{line}.0", f"{key}: {info[key]}")
+        self.info_text.config(state=DISABLED)
+    
+    @traced()
+    def render_device_info(self, info):
+        """完整绘制设备信息，记录每个字段所在的行"""
         info_text = f"设备信息 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
         info_text += "="*50 + "\n"
         
-        for key, value in self.device_info.items():
+        self.info_lines = {}
+        for line, (key, value) in enumerate(info.items(), start=3):
             info_text += f"{key}: {value}\n"
+            self.info_lines[key] = line
         
         self.info_text.config(state=NORMAL)
         self.info_text.delete(1.0, tk.END)
         self.info_text.insert(tk.END, info_text)
         self.info_text.config(state=DISABLED)
     
+    def sync_device_state(self):
+        """定期读取 /api/info 校准状态镜像（事件循环中请求，主线程更新显示）"""
+        if self.connected and not self.state_syncing:
+            self.state_syncing = True
+            
+            def synced(_):
+                # 失败时下个周期重试
+                self.state_syncing = False
+                self.update_device_info()
+            
+            self.run_task(self.engine.sync_state_async(), synced, synced)
+        
+        self.root.after(STATE_SYNC_INTERVAL_MS, self.sync_device_state)
+    
     # ========== RGB控制相关方法 ==========
     
     def toggle_power(self):
@@ -659,18 +999,9 @@ class ESP32APITester:
             self.power_var.set(False)
             return
         
-        power_state = "on" if self.power_var.get() else "off"
-        
-        try:
-            response = requests.get(f"http://{self.device_ip}/api/control?power={power_state}", timeout=5)
-            if response.status_code == 200:
-                self.add_test_result(f"电源{power_state.upper()}", "成功")
-                self.update_device_info()
-            else:
-                raise Exception(f"HTTP {response.status_code}")
-        except Exception as e:
-            self.add_test_result(f"电源{power_state.upper()}", f"失败: {str(e)}")
-            messagebox.showerror("错误", f"控制失败: {str(e)}")
+        self.run_task(self.engine.set_power_async(self.power_var.get()),
+                      lambda _: self.update_device_info(),
+                      lambda e: messagebox.showerror("错误", f"控制失败: {str(e)}"))
     
     def set_color(self, color):
         """设置颜色"""
@@ -678,17 +1009,13 @@ class ESP32APITester:
             messagebox.showerror("错误", "请先连接设备")
             return
         
-        try:
-            response = requests.get(f"http://{self.device_ip}/api/control?color={color}", timeout=5)
-            if response.status_code == 200:
-                # 更新颜色预览
-                self.update_color_preview(color)
-                self.add_test_result(f"设置颜色 {color}", "成功")
-                self.update_device_info()
-            else:
-                raise Exception(f"HTTP {response.status_code}")
-        except Exception as e:
-            self.add_test_result(f"设置颜色 {color}", f"失败: {str(e)}")
+        def done(_):
+            # 更新颜色预览
+            self.update_color_preview(color)
+            self.update_device_info()
+        
+        # 失败已记录到测试结果
+        self.run_task(self.engine.set_color_async(color), done)
     
     def update_brightness(self, value):
         """更新亮度"""
@@ -698,16 +1025,10 @@ class ESP32APITester:
         if not self.connected:
             return
         
-        try:
-            response = requests.get(f"http://{self.device_ip}/api/control?brightness={brightness}", timeout=5)
-            if response.status_code == 200:
-                self.add_test_result(f"设置亮度 {brightness}%", "成功")
-                self.update_device_info()
-            else:
-                raise Exception(f"HTTP {response.status_code}")
-        except Exception as e:
-            self.add_test_result(f"设置亮度 {brightness}%", f"失败: {str(e)}")
+        # 滑块每一格都会触发，交给合并发送队列在后台发送最新值
+        self.get_sender(self.device_ip).submit(brightness=brightness)
     
+    @traced()
     def update_color_preview(self, color):
         """更新颜色预览"""
         color_map = {
@@ -730,19 +1051,9 @@ class ESP32APITester:
             messagebox.showerror("错误", "请先连接设备")
             return
         
-        def test_sequence():
-            colors = [1, 2, 3, 4, 5, 6, 7, 0]  # 红橙黄绿青蓝紫彩虹
-            
-            for color in colors:
-                try:
-                    response = requests.get(f"http://{self.device_ip}/api/control?color={color}", timeout=5)
-                    self.add_test_result(f"测试颜色 {color}", "成功")
-                    self.root.after(0, lambda c=color: self.update_color_preview(c))
-                    time.sleep(1)  # 每个颜色显示1秒
-                except Exception as e:
-                    self.add_test_result(f"测试颜色 {color}", f"失败: {str(e)}")
-        
-        threading.Thread(target=test_sequence, daemon=True).start()
+        self.run_task(self.engine.test_all_colors_async(
+            on_step=lambda c: self.ui_bridge.post(self.update_color_preview, c)),
+            group=SEQUENCE_GROUP)
     
     def rainbow_test(self):
         """彩虹渐变测试"""
@@ -750,56 +1061,32 @@ class ESP32APITester:
             messagebox.showerror("错误", "请先连接设备")
             return
         
-        def rainbow_sequence():
-            for hue in range(0, 360, 10):  # 每10度一个变化
-                try:
-                    response = requests.get(f"http://{self.device_ip}/api/control?hue={hue}&saturation=100&value=100", timeout=5)
-                    self.add_test_result(f"彩虹测试 色相{hue}°", "成功")
-                    time.sleep(0.1)  # 快速变化
-                except Exception as e:
-                    self.add_test_result(f"彩虹测试 色相{hue}°", f"失败: {str(e)}")
-        
-        threading.Thread(target=rainbow_sequence, daemon=True).start()
+        self.run_task(self.engine.rainbow_test_async(), group=SEQUENCE_GROUP)
     
     # ========== HSV控制相关方法 ==========
     
+    @traced()
     def draw_hsv_circle(self):
-        """绘制HSV圆形调光板 - 优化版"""
+        """绘制HSV圆形调光板 - 逐像素色环图像"""
         self.hsv_canvas.delete("hsv_circle")
         
         center_x, center_y = 200, 200
         radius = 180
         inner_radius = 50  # 内圆半径，用于创建环形效果
         
-        # 绘制背景圆环
+        # 色环整体为一张图像（角度为色相，半径为饱和度），生成结果缓存到磁盘
+        self.hsv_wheel_image = load_hsv_wheel(self.hsv_canvas, 400, radius, inner_radius,
+                                              "#2c3e50", self.get_theme_name())
+        self.hsv_canvas.create_image(0, 0, anchor=NW, image=self.hsv_wheel_image,
+                                     tags="hsv_circle")
+        
+        # 绘制内外边框
         self.hsv_canvas.create_oval(center_x - radius, center_y - radius,
                                    center_x + radius, center_y + radius,
-                                   fill="#34495e", outline="#2c3e50", width=2,
-                                   tags="hsv_circle")
-        
-        # 绘制HSV色环 - 使用更精细的渐变
-        for angle in range(0, 360, 2):  # 更细的分辨率
-            rad = angle * 3.14159 / 180
-
-            # 计算内外圆上的点（canvas 的 y 向下为正，使用 center_y - sin 来匹配选择器的计算）
-            x1 = center_x + inner_radius * math.cos(rad)
-            y1 = center_y - inner_radius * math.sin(rad)
-            x2 = center_x + radius * math.cos(rad)
-            y2 = center_y - radius * math.sin(rad)
-            
-            # 计算HSV颜色
-            rgb = self.hsv_to_rgb(angle, 100, 100)
-            color = f"#{rgb[0]:02x}{rgb[1]:02x}{rgb[2]:02x}"
-            
-            # 创建渐变扇形而不是简单的线条
-            self.hsv_canvas.create_line(x1, y1, x2, y2, width=12, fill=color, 
-                                       capstyle=tk.ROUND, tags="hsv_circle")
-        
-        # 绘制中心区域
+                                   outline="#34495e", width=2, tags="hsv_circle")
         self.hsv_canvas.create_oval(center_x - inner_radius, center_y - inner_radius,
                                    center_x + inner_radius, center_y + inner_radius,
-                                   fill="#2c3e50", outline="#34495e", width=2,
-                                   tags="hsv_circle")
+                                   outline="#34495e", width=2, tags="hsv_circle")
         
         # 添加刻度标记
         for major_angle in range(0, 360, 30):
@@ -819,35 +1106,22 @@ class ESP32APITester:
                 self.hsv_canvas.create_text(label_x, label_y, text=f"{major_angle}°",
                                           fill="#ecf0f1", font=("Arial", 8, "bold"),
                                           tags="hsv_circle")
+        
+        # 选择器保持在色环之上
+        self.hsv_canvas.tag_raise("selector")
     
+    @traced()
     def draw_color_picker(self):
-        """绘制取色器 - 修复版"""
+        """绘制取色器 - 色板图像"""
         self.color_picker_canvas.delete("color_picker")
         
         width, height = 250, 80
         
-        # 绘制背景
-        self.color_picker_canvas.create_rectangle(0, 0, width, height, 
-                                                 fill="#ecf0f1", outline="", 
-                                                 tags="color_picker")
-        
-        # 创建彩虹渐变 - 使用像素级渐变
-        for x in range(0, width):
-            # 计算色相（水平方向）
-            hue = (x / width) * 360
-            
-            for y in range(0, height):
-                # 计算明度（垂直方向）- 从顶部100%到底部50%
-                value = 100 - (y / height) * 50
-                
-                # 计算RGB颜色
-                rgb = self.hsv_to_rgb(hue, 100, value)
-                color = f"#{rgb[0]:02x}{rgb[1]:02x}{rgb[2]:02x}"
-                
-                # 绘制单个像素点
-                self.color_picker_canvas.create_rectangle(x, y, x+1, y+1, 
-                                                       fill=color, outline="", 
-                                                       tags="color_picker")
+        # 彩虹渐变为一张图像（水平为色相，垂直为明度），生成结果缓存到磁盘
+        self.color_picker_image = load_color_picker(self.color_picker_canvas, width, height,
+                                                    self.get_theme_name())
+        self.color_picker_canvas.create_image(0, 0, anchor=NW, image=self.color_picker_image,
+                                              tags="color_picker")
         
         # 添加边框
         self.color_picker_canvas.create_rectangle(2, 2, width-2, height-2, 
@@ -860,71 +1134,32 @@ class ESP32APITester:
                                             fill="#7f8c8d", font=("Arial", 8),
                                             tags="color_picker")
     
+    def get_theme_name(self):
+        """当前主题名称（用于图像缓存键）"""
+        try:
+            return self.root.style.theme_use()
+        except Exception:
+            return "default"
+    
     def hsv_to_rgb(self, h, s, v):
         """HSV转RGB转换"""
-        h = h % 360
-        if h < 0:
-            h += 360
-        
-        s = max(0, min(100, s)) / 100.0
-        v = max(0, min(100, v)) / 100.0
-        
-        c = v * s
-        x = c * (1 - abs((h / 60) % 2 - 1))
-        m = v - c
-        
-        if h < 60:
-            r, g, b = c, x, 0
-        elif h < 120:
-            r, g, b = x, c, 0
-        elif h < 180:
-            r, g, b = 0, c, x
-        elif h < 240:
-            r, g, b = 0, x, c
-        elif h < 300:
-            r, g, b = x, 0, c
-        else:
-            r, g, b = c, 0, x
-        
-        r = int((r + m) * 255)
-        g = int((g + m) * 255)
-        b = int((b + m) * 255)
-        
-        return (r, g, b)
+        return esp32_color.hsv_to_rgb(h, s, v)
     
     def rgb_to_hsv(self, r, g, b):
         """RGB转HSV转换"""
-        r, g, b = r/255.0, g/255.0, b/255.0
-        max_val = max(r, g, b)
-        min_val = min(r, g, b)
-        delta = max_val - min_val
-        
-        if delta == 0:
-            h = 0
-        elif max_val == r:
-            h = 60 * (((g - b) / delta) % 6)
-        elif max_val == g:
-            h = 60 * (((b - r) / delta) + 2)
-        else:
-            h = 60 * (((r - g) / delta) + 4)
-        
-        if max_val == 0:
-            s = 0
-        else:
-            s = delta / max_val
-        
-        v = max_val
-        
-        return (h, s * 100, v * 100)
+        return esp32_color.rgb_to_hsv(r, g, b)
     
+    @traced()
     def on_hsv_circle_click(self, event):
         """HSV圆形调光板点击事件"""
         self.update_hsv_from_circle(event.x, event.y)
     
+    @traced()
     def on_hsv_circle_drag(self, event):
         """HSV圆形调光板拖拽事件"""
         self.update_hsv_from_circle(event.x, event.y)
     
+    @traced()
     def update_hsv_from_circle(self, x, y):
         """根据圆形调光板位置更新HSV参数 - 优化版"""
         center_x, center_y = 200, 200
@@ -963,6 +1198,7 @@ class ESP32APITester:
         # 更新选择器位置
         self.update_selector_position()
     
+    @traced()
     def on_color_picker_click(self, event):
         """取色器点击事件 - 修复版"""
         x, y = event.x, event.y
@@ -1004,11 +1240,13 @@ class ESP32APITester:
         except Exception as e:
             self.add_test_result(f"取色失败: {str(e)}", "失败")
     
+    @traced()
     def update_hsv_from_slider(self, value=None):
         """根据滑块更新HSV参数"""
         self.update_hsv_ui()
         self.send_hsv_to_device()
     
+    @traced()
     def update_hsv_ui(self):
         """更新HSV界面显示 - 优化版"""
         hue = self.hue_var.get()
@@ -1044,6 +1282,7 @@ class ESP32APITester:
         self.value_label.config(foreground=text_color)
         self.hsv_brightness_label.config(foreground=text_color)
     
+    @traced()
     def update_selector_position(self):
         """更新HSV选择器位置 - 优化版"""
         hue = self.hue_var.get()
@@ -1073,12 +1312,14 @@ class ESP32APITester:
         
         self.hsv_canvas.itemconfig(self.hsv_selector, outline=outline_color)
     
+    @traced()
     def update_hsv_preview(self, hue, saturation, value):
         """更新HSV预览"""
         rgb = self.hsv_to_rgb(hue, saturation, value)
         color = f"#{rgb[0]:02x}{rgb[1]:02x}{rgb[2]:02x}"
         self.hsv_preview.config(bg=color)
     
+    @traced()
     def send_hsv_to_device(self):
         """发送HSV参数到设备"""
         if not self.connected:
@@ -1089,18 +1330,39 @@ class ESP32APITester:
         value_val = self.value_var.get()
         brightness = self.hsv_brightness_var.get()
         
+        # 拖动时不阻塞界面，排队中的旧值会被新值覆盖
+        self.get_sender(self.device_ip).submit(hue=hue, saturation=saturation, 
+                                               value=value_val, brightness=brightness)
+    
+    def get_sender(self, ip):
+        """获取设备的合并发送队列"""
+        return self.engine.get_sender(
+            ip, on_result=lambda p, r, e: self.ui_bridge.post(self.on_send_result, p, r, e))
+    
+    def update_send_rate(self):
+        """更新最大发送频率"""
         try:
-            response = requests.get(
-                f"http://{self.device_ip}/api/control?hue={hue}&saturation={saturation}&value={value_val}&brightness={brightness}", 
-                timeout=5
-            )
-            if response.status_code == 200:
-                self.add_test_result(f"HSV设置 H{hue}° S{saturation}% V{value_val}% B{brightness}%", "成功")
-                self.update_device_info()
-            else:
-                raise Exception(f"HTTP {response.status_code}")
-        except Exception as e:
-            self.add_test_result(f"HSV设置 H{hue}° S{saturation}% V{value_val}%", f"失败: {str(e)}")
+            self.engine.set_max_send_rate(max(1, int(self.send_rate_var.get())))
+        except (tk.TclError, ValueError):
+            return
+    
+    @traced()
+    def on_send_result(self, params, response, error):
+        """合并发送队列的发送结果（主线程）"""
+        desc = " ".join(f"{k}={v}" for k, v in params.items())
+        if error is None and response.status_code == 200:
+            self.add_test_result(f"发送 {desc}", "成功")
+            self.update_device_info()
+        elif error is None:
+            self.add_test_result(f"发送 {desc}", f"失败: HTTP {response.status_code}")
+        else:
+            self.add_test_result(f"发送 {desc}", f"失败: {str(error)}")
+        
+        sender = self.engine.senders.get(self.device_ip)
+        if sender is not None:
+            self.send_stats_label.config(
+                text=f"已发送 {sender.sent} | 已合并 {sender.skipped} | "
+                     f"未变化 {sender.suppressed} | 失败 {sender.failed}")
     
     def toggle_hsv_power(self):
         """切换HSV电源状态"""
@@ -1109,22 +1371,16 @@ class ESP32APITester:
             self.hsv_power_var.set(False)
             return
         
-        power_state = "on" if self.hsv_power_var.get() else "off"
+        power_on = self.hsv_power_var.get()
+        commands = [{"power": "on" if power_on else "off"}]
+        if power_on:
+            # 开启电源时同时发送当前HSV设置（合并为一个请求）
+            commands.append({"hue": self.hue_var.get(), "saturation": self.saturation_var.get(),
+                             "value": self.value_var.get(), "brightness": self.hsv_brightness_var.get()})
         
-        try:
-            response = requests.get(f"http://{self.device_ip}/api/control?power={power_state}", timeout=5)
-            if response.status_code == 200:
-                self.add_test_result(f"HSV电源{power_state.upper()}", "成功")
-                self.update_device_info()
-                
-                # 如果开启电源，发送当前HSV设置
-                if self.hsv_power_var.get():
-                    self.send_hsv_to_device()
-            else:
-                raise Exception(f"HTTP {response.status_code}")
-        except Exception as e:
-            self.add_test_result(f"HSV电源{power_state.upper()}", f"失败: {str(e)}")
-            messagebox.showerror("错误", f"控制失败: {str(e)}")
+        self.run_task(self.engine.control_commands_async(f"HSV电源{'ON' if power_on else 'OFF'}", commands),
+                      lambda _: self.update_device_info(),
+                      lambda e: messagebox.showerror("错误", f"控制失败: {str(e)}"))
     
     def reset_hsv_params(self):
         """重置HSV参数"""
@@ -1145,53 +1401,8 @@ class ESP32APITester:
             messagebox.showerror("错误", "请先连接设备")
             return
         
-        def hsv_sequence():
-            # 色相渐变
-            for hue in range(0, 360, 5):
-                try:
-                    response = requests.get(
-                        f"http://{self.device_ip}/api/control?hue={hue}&saturation=100&value=100", 
-                        timeout=5
-                    )
-                    self.root.after(0, lambda h=hue: [
-                        self.hue_var.set(h),
-                        self.update_hsv_ui()
-                    ])
-                    time.sleep(0.05)
-                except:
-                    pass
-            
-            # 饱和度渐变
-            for sat in range(100, 0, -5):
-                try:
-                    response = requests.get(
-                        f"http://{self.device_ip}/api/control?hue=180&saturation={sat}&value=100", 
-                        timeout=5
-                    )
-                    self.root.after(0, lambda s=sat: [
-                        self.saturation_var.set(s),
-                        self.update_hsv_ui()
-                    ])
-                    time.sleep(0.05)
-                except:
-                    pass
-            
-            # 明度渐变
-            for val in range(100, 0, -5):
-                try:
-                    response = requests.get(
-                        f"http://{self.device_ip}/api/control?hue=180&saturation=100&value={val}", 
-                        timeout=5
-                    )
-                    self.root.after(0, lambda v=val: [
-                        self.value_var.set(v),
-                        self.update_hsv_ui()
-                    ])
-                    time.sleep(0.05)
-                except:
-                    pass
-        
-        threading.Thread(target=hsv_sequence, daemon=True).start()
+        self.run_task(self.engine.hsv_gradient_test_async(on_step=self.post_hsv_step),
+                      group=SEQUENCE_GROUP)
     
     def random_color_test(self):
         """随机颜色测试"""
@@ -1199,28 +1410,20 @@ class ESP32APITester:
             messagebox.showerror("错误", "请先连接设备")
             return
         
-        def random_sequence():
-            for _ in range(20):  # 测试20个随机颜色
-                hue = random.randint(0, 360)
-                saturation = random.randint(50, 100)
-                value = random.randint(50, 100)
-                
-                try:
-                    response = requests.get(
-                        f"http://{self.device_ip}/api/control?hue={hue}&saturation={saturation}&value={value}", 
-                        timeout=5
-                    )
-                    self.root.after(0, lambda h=hue, s=saturation, v=value: [
-                        self.hue_var.set(h), 
-                        self.saturation_var.set(s), 
-                        self.value_var.set(v),
-                        self.update_hsv_ui()
-                    ])
-                    time.sleep(0.5)
-                except:
-                    pass
-        
-        threading.Thread(target=random_sequence, daemon=True).start()
+        self.run_task(self.engine.random_color_test_async(on_step=self.post_hsv_step),
+                      group=SEQUENCE_GROUP)
+    
+    def post_hsv_step(self, hue, saturation, value):
+        """测试序列的每一帧（事件循环中调用），交给主线程显示"""
+        self.ui_bridge.post(self.show_hsv_step, hue, saturation, value)
+    
+    @traced()
+    def show_hsv_step(self, hue, saturation, value):
+        """在主线程中显示测试序列当前的HSV值"""
+        self.hue_var.set(hue)
+        self.saturation_var.set(saturation)
+        self.value_var.set(value)
+        self.update_hsv_ui()
     
     # ========== UDP广播相关方法 ==========
     
@@ -1230,24 +1433,22 @@ class ESP32APITester:
             messagebox.showerror("错误", "请先连接设备")
             return
         
-        try:
-            response = requests.get(f"http://{self.device_ip}/api/broadcast?action={action}", timeout=5)
-            if response.status_code == 200:
-                self.add_test_result(f"UDP广播{action.upper()}", "成功")
-                self.add_udp_message(f"设备广播已{action}")
-                self.update_device_info()
-            else:
-                raise Exception(f"HTTP {response.status_code}")
-        except Exception as e:
-            self.add_test_result(f"UDP广播{action.upper()}", f"失败: {str(e)}")
-            messagebox.showerror("错误", f"控制失败: {str(e)}")
+        def done(_):
+            self.add_udp_message(f"设备广播已{action}")
+            self.update_device_info()
+        
+        self.run_task(self.engine.control_broadcast_async(action), done,
+                      lambda e: messagebox.showerror("错误", f"控制失败: {str(e)}"))
     
     def add_udp_message(self, message):
-        """添加UDP消息"""
+        """添加UDP消息（只保留最近的 UDP_MAX_LINES 行）"""
         timestamp = datetime.now().strftime("%H:%M:%S")
         formatted_message = f"[{timestamp}] {message}\n"
         
         self.udp_text.insert(tk.END, formatted_message)
+        lines = int(self.udp_text.index("end-1c").split(".")[0])
+        if lines > UDP_MAX_LINES:
+            self.udp_text.delete(1.0, f"{lines - UDP_MAX_LINES}.0")
         self.udp_text.see(tk.END)
     
     def clear_udp_messages(self):
@@ -1257,102 +1458,117 @@ class ESP32APITester:
     # ========== 测试报告相关方法 ==========
     
     def add_test_result(self, test_name, result):
-        """添加测试结果"""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.test_results.append({
-            "timestamp": timestamp,
-            "test_name": test_name,
-            "result": result
-        })
-        
-        # 更新结果显示
-        self.update_results_display()
-    
-    def update_results_display(self):
-        """更新测试结果显示"""
-        self.results_text.delete(1.0, tk.END)
-        
-        # 统计结果
-        total_tests = len(self.test_results)
-        success_tests = len([r for r in self.test_results if "成功" in r["result"]])
-        failed_tests = total_tests - success_tests
-        
-        header = f"测试报告 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-        header += "="*60 + "\n"
-        header += f"总测试数: {total_tests} | 成功: {success_tests} | 失败: {failed_tests}\n"
-        header += "="*60 + "\n\n"
-        
-        self.results_text.insert(tk.END, header)
+        """添加测试结果（显示由引擎的结果监听触发）"""
+        self.engine.add_result(test_name, result)
+    
+    @traced()
+    def drain_results(self):
+        """取出队列中的新结果，追加显示（每个界面周期执行一次）"""
+        lines = []
+        while True:
+            try:
+                result = self.result_queue.get_nowait()
+            except queue.Empty:
+                break
+            status = RESULT_ICONS[result.outcome]
+            lines.append(f"[{result.time_text}] {status} {result.test_name} - {result.result}\n")
         
-        # 显示详细结果
-        for result in self.test_results[-50:]:  # 显示最近50条记录
-            status = "✅" if "成功" in result["result"] else "❌"
-            line = f"[{result['timestamp']}] {status} {result['test_name']} - {result['result']}\n"
-            self.results_text.insert(tk.END, line)
+        if lines:
+            self.append_results(lines[-RESULTS_MAX_LINES:])
+            self.update_results_summary()
         
+        self.root.after(RESULTS_TICK_MS, self.drain_results)
+    
+    @traced()
+    def append_results(self, lines):
+        """追加结果行，只保留最近 RESULTS_MAX_LINES 行"""
+        self.results_text.insert(tk.END, "".join(lines))
+        line_count = int(self.results_text.index("end-1c").split(".")[0])
+        if line_count > RESULTS_MAX_LINES:
+            self.results_text.delete(1.0, f"{line_count - RESULTS_MAX_LINES}.0")
         self.results_text.see(tk.END)
     
+    def update_results_summary(self):
+        """更新结果统计（计数由引擎增量维护）"""
+        total_tests, success_tests, failed_tests = self.engine.result_counts()
+        self.results_summary_label.config(
+            text=f"总测试数: {total_tests} | 成功: {success_tests} | 失败: {failed_tests}")
+    
     def run_full_test(self):
         """运行完整测试"""
         if not self.connected:
             messagebox.showerror("错误", "请先连接设备")
             return
         
-        def full_test_sequence():
-            # 1. 基础连接测试
-            self.add_test_result("基础连接测试", "开始")
-            
-            # 2. RGB功能测试
-            self.add_test_result("RGB功能测试", "开始")
-            
-            # 测试所有颜色
-            colors = [1, 2, 3, 4, 5, 6, 7, 0]
-            for color in colors:
-                try:
-                    response = requests.get(f"http://{self.device_ip}/api/control?color={color}", timeout=5)
-                    self.add_test_result(f"颜色{color}测试", "成功")
-                    time.sleep(0.5)
-                except:
-                    self.add_test_result(f"颜色{color}测试", "失败")
-            
-            # 3. HSV功能测试
-            self.add_test_result("HSV功能测试", "开始")
-            
-            # 测试HSV参数
-            test_params = [
-                (0, 100, 100),   # 红色
-                (120, 100, 100), # 绿色
-                (240, 100, 100), # 蓝色
-            ]
-            
-            for hue, sat, val in test_params:
-                try:
-                    response = requests.get(
-                        f"http://{self.device_ip}/api/control?hue={hue}&saturation={sat}&value={val}", 
-                        timeout=5
-                    )
-                    self.add_test_result(f"HSV测试 H{hue}° S{sat}% V{val}%", "成功")
-                    time.sleep(0.5)
-                except:
-                    self.add_test_result(f"HSV测试 H{hue}° S{sat}% V{val}%", "失败")
-            
-            # 4. UDP广播测试
-            self.add_test_result("UDP广播测试", "开始")
-            
+        self.run_task(self.engine.run_full_test_async(),
+                      lambda _: messagebox.showinfo("完成", "完整测试已完成"), group=SEQUENCE_GROUP)
+    
+    def run_benchmark(self):
+        """运行性能基准测试并导出结果"""
+        if not self.connected:
+            messagebox.showerror("错误", "请先连接设备")
+            return
+        if self.bench_generator is not None:
+            messagebox.showwarning("警告", "基准测试正在运行")
+            return
+        
+        try:
+            endpoint = self.bench_endpoint_var.get()
+            rate = int(self.bench_rate_var.get())
+            concurrency = int(self.bench_concurrency_var.get())
+            duration = int(self.bench_duration_var.get())
+        except (tk.TclError, ValueError):
+            messagebox.showerror("错误", "基准测试参数无效")
+            return
+        
+        generator = LoadGenerator(self.device_ip, endpoint=endpoint, rate=rate or None,
+                                  concurrency=concurrency, duration=duration)
+        self.add_test_result(f"基准测试 {endpoint} 速率{rate or '闭环'} 并发{concurrency} {duration}秒", "开始")
+        
+        # 在主线程登记，工作线程开始之前按“停止”也能生效；结束回调在主线程中清除
+        self.bench_generator = generator
+        
+        # 结果由引擎的结果监听送回主线程，这里在工作线程中直接记录
+        def bench_sequence():
             try:
-                response = requests.get(f"http://{self.device_ip}/api/broadcast?action=enable", timeout=5)
-                self.add_test_result("启用广播", "成功")
-                time.sleep(2)
-                
-                response = requests.get(f"http://{self.device_ip}/api/broadcast?action=disable", timeout=5)
-                self.add_test_result("禁用广播", "成功")
-            except:
-                self.add_test_result("UDP广播测试", "失败")
-            
-            self.add_test_result("完整测试", "完成")
-            messagebox.showinfo("完成", "完整测试已完成")
+                result = generator.run(on_progress=lambda p: self.add_test_result(
+                    f"基准测试进度: 已发送 {p['sent']} 已完成 {p['completed']} p99 {p['p99_ms']:.1f}ms", "信息"))
+                filename = export_bench_result(result)
+                failed = result["completed"] - result["ok"]
+                for line in format_bench_result(result).splitlines():
+                    self.add_test_result(line, "信息")
+                self.add_test_result(
+                    f"基准测试完成，结果已导出: {filename}", "成功" if failed == 0 else f"失败: {failed}个请求出错")
+                return result
+            except Exception as e:
+                self.add_test_result("基准测试", f"失败: {str(e)}")
+                return None
         
-        threading.Thread(target=full_test_sequence, daemon=True).start()
+        def finished(result):
+            self.bench_generator = None
+            if result is not None:
+                self.last_bench_result = result
+        
+        self.run_blocking(bench_sequence, on_done=finished, on_error=lambda e: finished(None))
+    
+    def compare_benchmark(self):
+        """把最近一次基准测试结果与之前导出的结果（如旧固件）对比"""
+        current = self.last_bench_result
+        if current is None:
+            messagebox.showwarning("警告", "请先运行一次基准测试")
+            return
+        filename = filedialog.askopenfilename(
+            title="选择基线结果", filetypes=[("基准测试结果", "*.json"), ("所有文件", "*.*")])
+        if not filename:
+            return
+        try:
+            baseline = load_bench_result(filename)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("错误", f"基线文件无效: {str(e)}")
+            return
+        self.add_test_result(f"基准测试对比 基线: {filename}", "信息")
+        for line in compare_bench_results(baseline, current).splitlines():
+            self.add_test_result(line, "信息")
     
     def generate_report(self):
         """生成测试报告"""
@@ -1360,38 +1576,8 @@ class ESP32APITester:
             messagebox.showwarning("警告", "没有测试结果可生成报告")
             return
         
-        # 创建报告文件
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"esp32_test_report_{timestamp}.txt"
-        
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write("ESP32S3 SuperMini API测试报告\n")
-                f.write("="*60 + "\n")
-                f.write(f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"设备IP: {self.device_ip if self.connected else '未连接'}\n")
-                f.write("="*60 + "\n\n")
-                
-                # 统计信息
-                total_tests = len(self.test_results)
-                success_tests = len([r for r in self.test_results if "成功" in r["result"]])
-                failed_tests = total_tests - success_tests
-                success_rate = (success_tests / total_tests * 100) if total_tests > 0 else 0
-                
-                f.write("测试统计:\n")
-                f.write(f"总测试数: {total_tests}\n")
-                f.write(f"成功测试: {success_tests}\n")
-                f.write(f"失败测试: {failed_tests}\n")
-                f.write(f"成功率: {success_rate:.1f}%\n\n")
-                
-                # 详细结果
-                f.write("详细测试结果:\n")
-                f.write("-"*60 + "\n")
-                
-                for result in self.test_results:
-                    status = "成功" if "成功" in result["result"] else "失败"
-                    f.write(f"[{result['timestamp']}] {result['test_name']} - {status}\n")
-            
+            filename = self.engine.generate_report()
             messagebox.showinfo("成功", f"测试报告已生成: {filename}")
             self.add_test_result("生成测试报告", "成功")
             
@@ -1399,15 +1585,97 @@ class ESP32APITester:
             messagebox.showerror("错误", f"生成报告失败: {str(e)}")
             self.add_test_result("生成测试报告", f"失败: {str(e)}")
     
+    def export_reports(self):
+        """导出结构化测试报告（大量记录时在线程池中导出）"""
+        if not self.test_results:
+            messagebox.showwarning("警告", "没有测试结果可生成报告")
+            return
+        
+        def exported(files):
+            messagebox.showinfo("成功", "报告已导出:\n" + "\n".join(files))
+            self.add_test_result("导出测试报告", "成功")
+        
+        def failed(e):
+            messagebox.showerror("错误", f"导出报告失败: {str(e)}")
+            self.add_test_result("导出测试报告", f"失败: {str(e)}")
+        
+        self.run_blocking(self.engine.export_reports, on_done=exported, on_error=failed)
+    
     def clear_test_results(self):
         """清空测试记录"""
-        self.test_results.clear()
+        self.engine.clear_results()
+        # 丢弃尚未显示的旧结果
+        while True:
+            try:
+                self.result_queue.get_nowait()
+            except queue.Empty:
+                break
         self.results_text.delete(1.0, tk.END)
         self.add_test_result("清空测试记录", "完成")
     
+    def toggle_recording(self):
+        """开始/停止录制发出的控制请求和收到的UDP广播"""
+        if self.engine.recorder is not None:
+            self.discovery.recorder = None
+            self.engine.stop_recording()
+            self.record_button.config(text="⏺ 录制流量")
+            return
+        
+        filename = filedialog.asksaveasfilename(
+            title="保存录制文件", defaultextension=".e32r",
+            initialfile=f"esp32_traffic_{datetime.now().strftime('%Y%m%d_%H%M%S')}.e32r",
+            filetypes=[("流量录制", "*.e32r"), ("所有文件", "*.*")])
+        if not filename:
+            return
+        try:
+            self.discovery.recorder = self.engine.start_recording(filename)
+        except OSError as e:
+            messagebox.showerror("错误", f"无法创建录制文件: {str(e)}")
+            return
+        self.record_button.config(text="⏹ 停止录制")
+    
+    def toggle_tracing(self):
+        """开启/停止性能追踪，停止时导出 Chrome trace JSON"""
+        if get_tracer() is None:
+            self.engine.start_tracing()
+            self.trace_button.config(text="⏹ 导出追踪")
+            return
+        
+        filename = filedialog.asksaveasfilename(
+            title="导出性能追踪（可用 ui.perfetto.dev 打开）", defaultextension=".json",
+            initialfile=f"esp32_trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            filetypes=[("Chrome trace", "*.json"), ("所有文件", "*.*")])
+        if not filename:
+            return  # 继续追踪
+        self.trace_button.config(text="⏺ 性能追踪")
+        try:
+            self.engine.stop_tracing(filename)
+        except OSError as e:
+            messagebox.showerror("错误", f"导出性能追踪失败: {str(e)}")
+    
+    def replay_recording(self):
+        """回放录制文件（发往录制时的设备，或当前连接的设备）"""
+        filename = filedialog.askopenfilename(
+            title="选择录制文件", filetypes=[("流量录制", "*.e32r"), ("所有文件", "*.*")])
+        if not filename:
+            return
+        target = None
+        if self.connected and messagebox.askyesno("回放目标", f"全部发往当前连接的设备 {self.device_ip}？\n"
+                                                          "选择“否”发往录制时的设备"):
+            target = self.device_ip
+        
+        self.run_blocking(self.engine.replay, filename, 1.0, target,
+                          on_error=lambda e: self.add_test_result(f"回放 {filename}", f"失败: {str(e)}"))
+    
     def run(self):
         """运行应用程序"""
         self.root.mainloop()
+        # 停止线程池中的长任务，再取消并等待事件循环中的全部设备操作
+        self.stop_sequences()
+        self.engine.shutdown()
+        self.engine.stop_recording()
+        # 保存UDP广播发现的设备
+        self.engine.save_registry()
 
 if __name__ == "__main__":
     # 检查依赖
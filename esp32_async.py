@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESP32 测试引擎的asyncio事件循环
+
+功能特性：
+1. 一个后台线程运行一个asyncio事件循环，所有设备I/O协程都在其中执行，
+   上千个并发的设备操作只占用这一个线程
+2. 协程按分组登记，可以按组取消；停止事件循环时先取消并等待全部协程结束
+3. 按固定时间表发送的长任务（接口基准测试、流量回放）和报告导出在有界线程池中运行
+4. AsyncDeviceClient：基于asyncio流的设备HTTP客户端，接口、重试、耗时记录、
+   流量录制和性能追踪与 DeviceClient 一致
+5. UiBridge：把结果回调交给界面线程，界面用 root.after 定期批量执行，
+   界面线程从不等待网络
+
+作者: ESP32开发团队
+版本: 1.0.0
+日期: 2025-11-06
+"""
+
+import asyncio
+import functools
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import esp32_trace
+from esp32_client import (DEFAULT_BACKOFF, DEFAULT_RETRIES, DEFAULT_TIMEOUT, MAX_BACKOFF,
+                          TIMING_HISTORY, CallTiming, build_query)
+from esp32_registry import split_address
+
+DEFAULT_BLOCKING_WORKERS = 8    # 同步长任务的线程数上限
+STOP_TIMEOUT = 5.0
+MAX_HEADER_SIZE = 16384
+
+
+class EngineLoop:
+    """后台线程中的asyncio事件循环（submit/cancel/stop 可在任意线程调用）"""
+
+    def __init__(self, max_blocking=DEFAULT_BLOCKING_WORKERS):
+        self.loop = None
+        self._thread = None
+        self._tasks = {}            # asyncio.Task -> 分组名
+        self._executor = ThreadPoolExecutor(max_workers=max_blocking,
+                                            thread_name_prefix="engine-blocking")
+
+    @property
+    def running(self):
+        return self.loop is not None and self.loop.is_running()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(ready,), name="engine-loop",
+                                        daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def _run(self, ready):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self.loop = loop
+        loop.call_soon(ready.set)
+        try:
+            loop.run_forever()
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """取消全部协程并等待它们结束，然后停止事件循环"""
+        if self._thread is None:
+            return
+        if self.running:
+            try:
+                asyncio.run_coroutine_threadsafe(self._cancel_all(), self.loop).result(timeout)
+            except Exception:
+                pass  # 超时的协程随事件循环一起丢弃
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
+        self._thread = None
+        self._executor.shutdown(wait=False)
+
+    async def _cancel_all(self):
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def in_loop_thread(self):
+        return self._thread is not None and threading.get_ident() == self._thread.ident
+
+    def submit(self, coro, group=None):
+        """在事件循环中运行协程，返回 concurrent.futures.Future（可在任意线程等待或取消）"""
+        if not self.running:
+            coro.close()
+            raise RuntimeError("事件循环未运行")
+        return asyncio.run_coroutine_threadsafe(self._track(coro, group), self.loop)
+
+    async def _track(self, coro, group):
+        task = asyncio.current_task()
+        self._tasks[task] = group
+        try:
+            return await coro
+        finally:
+            del self._tasks[task]
+
+    def run(self, coro, timeout=None):
+        """运行协程并阻塞等待结果（供同步调用者使用，不能在事件循环线程中调用）"""
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError("不能在事件循环线程中同步等待协程")
+        return self.submit(coro).result(timeout)
+
+    async def run_blocking(self, func, *args, **kwargs):
+        """在线程池中运行同步函数（取消只停止等待，函数本身需要自己的停止方式）"""
+        return await self.loop.run_in_executor(self._executor,
+                                               functools.partial(func, *args, **kwargs))
+
+    def cancel(self, group=None):
+        """取消指定分组（None为全部）的协程"""
+        if self.running:
+            self.loop.call_soon_threadsafe(self._cancel, group)
+
+    def _cancel(self, group):
+        for task, task_group in list(self._tasks.items()):
+            if group is None or task_group == group:
+                task.cancel()
+
+    def pending(self, group=None):
+        """正在运行的协程数"""
+        return sum(1 for g in list(self._tasks.values()) if group is None or g == group)
+
+
+class UiBridge:
+    """事件循环/工作线程到界面线程的回调队列
+
+    其他线程只调用 post/watch，界面线程用 root.after 定期调用 drain。
+    """
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+
+    def post(self, callback, *args):
+        """把回调交给界面线程执行"""
+        self._queue.put((callback, args))
+
+    def watch(self, future, on_done=None, on_error=None):
+        """future 完成后在界面线程中调用 on_done(结果) 或 on_error(异常)，取消时都不调用"""
+        future.add_done_callback(lambda f: self.post(self._deliver, f, on_done, on_error))
+        return future
+
+    @staticmethod
+    def _deliver(future, on_done, on_error):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            if on_error:
+                on_error(error)
+        elif on_done:
+            on_done(future.result())
+
+    def drain(self, limit=None):
+        """执行排队的回调（界面线程），返回执行的个数"""
+        count = 0
+        while limit is None or count < limit:
+            try:
+                callback, args = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            count += 1
+            callback(*args)
+        return count
+
+
+class AsyncResponse:
+    """异步请求的响应（与 requests.Response 常用的属性一致）"""
+
+    def __init__(self, status_code, headers, content, timing=None):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.timing = timing
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", "replace")
+
+    def json(self):
+        """解析JSON响应体，格式错误时抛出 ValueError"""
+        return json.loads(self.content.decode("utf-8"))
+
+
+async def _read_line(reader):
+    try:
+        return (await reader.readuntil(b"\r\n"))[:-2].decode("latin-1")
+    except asyncio.LimitOverrunError:
+        raise ValueError("HTTP响应头过长") from None
+
+
+async def _read_response(reader):
+    """读取一个HTTP/1.x响应
+
+    返回 (状态码, 头部字典, 响应体, 是否可复用连接, 收到状态行的时刻)。
+    """
+    status_line = await _read_line(reader)
+    first_byte = time.perf_counter()
+    parts = status_line.split(" ", 2)
+    if len(parts) < 2 or not parts[0].startswith("HTTP/") or not parts[1].isdigit():
+        raise ValueError(f"无效的HTTP响应: {status_line!r}")
+    status = int(parts[1])
+    headers = {}
+    while True:
+        line = await _read_line(reader)
+        if not line:
+            break
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+
+    keep_alive = parts[0] == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+    if "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    elif headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks = []
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            if size == 0:
+                await reader.readuntil(b"\r\n")
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        body = b"".join(chunks)
+    else:
+        body = await reader.read()
+        keep_alive = False
+    return status, headers, body, keep_alive, first_byte
+
+
+class AsyncDeviceClient:
+    """单个ESP32设备的异步HTTP客户端
+
+    同一设备同一时间只有一个在途请求（固件 WebServer 一次只处理一个客户端），
+    设备支持keep-alive时复用连接。只能在创建它的事件循环中使用。
+    """
+
+    def __init__(self, ip, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF):
+        self.ip = ip
+        self.host, self.port = split_address(ip)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+        # 调用耗时记录
+        self.timings = deque(maxlen=TIMING_HISTORY)
+        self.last_timing = None
+        self.call_count = 0
+        self.error_count = 0
+
+        # 流量录制器，为None时不录制
+        self.recorder = None
+
+        self._connection = None     # (reader, writer)
+        self._lock = asyncio.Lock()
+
+    async def get(self, path, params=None, timeout=None, idempotent=True):
+        """发送GET请求，返回带有 timing 属性的 AsyncResponse"""
+        query = build_query(params) if params else ""
+        target = f"{path}?{query}" if query else path
+        timeout = self.timeout if timeout is None else timeout
+
+        async with self._lock:
+            attempts = 0
+            timings = [0.0, 0.0]    # TCP连接耗时, 收到响应头耗时
+            start = time.perf_counter()
+            while True:
+                attempts += 1
+                try:
+                    status, headers, body = await asyncio.wait_for(
+                        self._exchange(target, timings), timeout)
+                    break
+                except asyncio.TimeoutError:
+                    # 必须在 OSError 之前：3.11 起 asyncio.TimeoutError 即内置 TimeoutError（OSError 子类）。
+                    # 超时不重试（与 DeviceClient 不重试读超时一致），带 duration 的控制请求不会被重复执行
+                    self._drop_connection()
+                    self._record(path, None, timings, start, attempts, query)
+                    raise TimeoutError(f"请求超时（{timeout}秒）") from None
+                except (OSError, asyncio.IncompleteReadError) as e:
+                    # 连接失败（含keep-alive连接被设备关闭）时重试幂等请求
+                    self._drop_connection()
+                    if not idempotent or attempts > self.retries:
+                        self._record(path, None, timings, start, attempts, query)
+                        if isinstance(e, asyncio.IncompleteReadError):
+                            raise ConnectionError("设备关闭了连接") from None
+                        raise
+                    await asyncio.sleep(min(MAX_BACKOFF, self.backoff * (2 ** (attempts - 1))))
+                except BaseException:
+                    # 响应格式错误或被取消：连接状态未知，不再复用
+                    self._drop_connection()
+                    self._record(path, None, timings, start, attempts, query)
+                    raise
+
+        timing = self._record(path, status, timings, start, attempts, query)
+        return AsyncResponse(status, headers, body, timing)
+
+    async def _exchange(self, target, timings):
+        if self._connection is None:
+            connect_start = time.perf_counter()
+            try:
+                self._connection = await asyncio.open_connection(self.host, self.port,
+                                                                 limit=MAX_HEADER_SIZE)
+            finally:
+                timings[0] += time.perf_counter() - connect_start
+        reader, writer = self._connection
+
+        sent = time.perf_counter()
+        writer.write(f"GET {target} HTTP/1.1\r\nHost: {self.ip}\r\n"
+                     f"Connection: keep-alive\r\n\r\n".encode("ascii"))
+        await writer.drain()
+        status, headers, body, keep_alive, first_byte = await _read_response(reader)
+        timings[1] = first_byte - sent
+        if not keep_alive:
+            self._drop_connection()
+        return status, headers, body
+
+    def _drop_connection(self):
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            connection[1].close()
+
+    def _record(self, path, status, timings, start, attempts, query=""):
+        """记录一次调用的耗时（有录制器时同时写入录制文件）"""
+        connect_time, response_time = timings
+        timing = CallTiming(path, status, connect_time, response_time,
+                            time.perf_counter() - start, attempts)
+        self.timings.append(timing)
+        self.last_timing = timing
+        self.call_count += 1
+        if status is None:
+            self.error_count += 1
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.record_request(self.ip, path, query, status, start, timing.total)
+        esp32_trace.trace_request("GET", path, start, connect_time, response_time, timing.total,
+                                  status, attempts)
+        return timing
+
+    async def info(self, timeout=None):
+        """获取设备信息 /api/info"""
+        return await self.get("/api/info", timeout=timeout)
+
+    async def discover(self, timeout=None):
+        """设备发现接口 /api/discover"""
+        return await self.get("/api/discover", timeout=timeout)
+
+    async def control(self, **params):
+        """控制RGB灯光 /api/control，参数按传入顺序发送"""
+        return await self.get("/api/control", params)
+
+    async def broadcast(self, action):
+        """控制UDP广播 /api/broadcast"""
+        return await self.get("/api/broadcast", {"action": action})
+
+    def close(self):
+        """关闭保持的连接"""
+        self._drop_connection()
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESP32 接口性能基准测试
+
+功能特性：
+1. 开环定速负载：按目标速率固定调度请求，延迟从计划发送时刻算起，
+   设备卡顿时不会因为等待上一个请求而少发（避免协同遗漏）
+2. 闭环定并发负载：N个连接背靠背发送
+3. HDR风格对数直方图记录延迟，输出 p50/p90/p99/p99.9
+4. 统计吞吐量、超时和连接错误，结果可导出为JSON用于固件版本间对比
+
+作者: ESP32开发团队
+版本: 1.0.0
+日期: 2025-11-06
+"""
+
+import itertools
+import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from esp32_client import DeviceClient
+
+# 直方图精度：每个2的幂区间细分为64档（约1.6%相对误差）
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF = SUB_BUCKET_COUNT >> 1
+# 最大可记录延迟（微秒），超出的记录到最后一档
+MAX_TRACKABLE_US = 3600 * 1000000
+
+REPORT_PERCENTILES = (50, 90, 99, 99.9)
+
+# 基准测试接口: 名称 -> 第i个请求的 (路径, 参数)
+ENDPOINTS = {
+    "control": lambda i: ("/api/control", {"hue": (i * 7) % 360, "saturation": 100, "value": 100}),
+    "info": lambda i: ("/api/info", None),
+    "broadcast": lambda i: ("/api/broadcast", {"action": "disable"}),
+}
+
+
+def _bucket_index(value_us):
+    """微秒值对应的直方图档位"""
+    if value_us < SUB_BUCKET_COUNT:
+        return value_us
+    shift = value_us.bit_length() - SUB_BUCKET_BITS
+    sub = value_us >> shift
+    return SUB_BUCKET_COUNT + (shift - 1) * SUB_BUCKET_HALF + (sub - SUB_BUCKET_HALF)
+
+
+def _bucket_range(index):
+    """直方图档位对应的微秒区间 [lower, upper]"""
+    if index < SUB_BUCKET_COUNT:
+        return index, index
+    shift = (index - SUB_BUCKET_COUNT) // SUB_BUCKET_HALF + 1
+    sub = (index - SUB_BUCKET_COUNT) % SUB_BUCKET_HALF + SUB_BUCKET_HALF
+    return sub << shift, ((sub + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """HDR风格的对数-线性延迟直方图（单位微秒，固定内存）"""
+
+    def __init__(self):
+        self.counts = [0] * (_bucket_index(MAX_TRACKABLE_US) + 1)
+        self.count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        """记录一个延迟（秒）"""
+        self.record_us(int(seconds * 1000000))
+
+    def record_us(self, value_us):
+        """记录一个延迟（微秒）"""
+        value_us = max(0, min(int(value_us), MAX_TRACKABLE_US))
+        index = _bucket_index(value_us)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total_us += value_us
+            if self.min_us is None or value_us < self.min_us:
+                self.min_us = value_us
+            if value_us > self.max_us:
+                self.max_us = value_us
+
+    def record_many(self, values):
+        """批量记录延迟（秒），只加一次锁"""
+        with self._lock:
+            counts = self.counts
+            for seconds in values:
+                value_us = max(0, min(int(seconds * 1000000), MAX_TRACKABLE_US))
+                counts[_bucket_index(value_us)] += 1
+                self.count += 1
+                self.total_us += value_us
+                if self.min_us is None or value_us < self.min_us:
+                    self.min_us = value_us
+                if value_us > self.max_us:
+                    self.max_us = value_us
+
+    def merge(self, other):
+        """合并另一个直方图"""
+        with self._lock:
+            for index, n in enumerate(other.counts):
+                if n:
+                    self.counts[index] += n
+            self.count += other.count
+            self.total_us += other.total_us
+            if other.min_us is not None and (self.min_us is None or other.min_us < self.min_us):
+                self.min_us = other.min_us
+            self.max_us = max(self.max_us, other.max_us)
+
+    def percentile(self, p):
+        """第p百分位延迟（微秒），取所在档位的上界"""
+        if self.count == 0:
+            return 0
+        target = max(1, math.ceil(self.count * p / 100.0))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(_bucket_range(index)[1], self.max_us)
+        return self.max_us
+
+    def mean(self):
+        """平均延迟（微秒）"""
+        return self.total_us / self.count if self.count else 0.0
+
+    def summary_ms(self):
+        """百分位统计（毫秒）"""
+        result = {f"p{p:g}": self.percentile(p) / 1000.0 for p in REPORT_PERCENTILES}
+        result["min"] = (self.min_us or 0) / 1000.0
+        result["max"] = self.max_us / 1000.0
+        result["mean"] = self.mean() / 1000.0
+        return result
+
+    def to_dict(self):
+        """导出为稀疏的 {档位下界微秒: 次数}"""
+        return {str(_bucket_range(i)[0]): n for i, n in enumerate(self.counts) if n}
+
+    @classmethod
+    def from_dict(cls, data):
+        """从 to_dict 的结果恢复"""
+        hist = cls()
+        for lower, n in data.items():
+            index = _bucket_index(int(lower))
+            hist.counts[index] += n
+            hist.count += n
+            hist.total_us += int(lower) * n
+            if hist.min_us is None or int(lower) < hist.min_us:
+                hist.min_us = int(lower)
+            hist.max_us = max(hist.max_us, _bucket_range(index)[1])
+        return hist
+
+
+class LoadGenerator:
+    """/api/* 接口负载生成器"""
+
+    def __init__(self, ip, endpoint="info", rate=None, concurrency=4, duration=10.0,
+                 timeout=2.0, params=None):
+        if endpoint not in ENDPOINTS:
+            raise ValueError(f"未知接口: {endpoint}（可选: {', '.join(ENDPOINTS)}）")
+        self.ip = ip
+        self.endpoint = endpoint
+        self.rate = rate  # None 表示闭环定并发模式
+        self.concurrency = concurrency
+        self.duration = duration
+        self.timeout = timeout
+        self.request_for = ENDPOINTS[endpoint] if params is None else (
+            lambda i: (ENDPOINTS[endpoint](i)[0], params))
+
+        # 基准测试不重试，错误应如实计数
+        self.client = DeviceClient(ip, timeout=timeout, retries=0, pool_size=concurrency)
+
+        self.latency = LatencyHistogram()       # 从计划发送时刻算起（开环）
+        self.service_time = LatencyHistogram()  # 从实际发送时刻算起
+        self.sent = 0
+        self.ok = 0
+        self.timeouts = 0
+        self.connection_errors = 0
+        self.http_errors = 0
+        self.other_errors = 0
+        self.late_dispatches = 0
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def stop(self):
+        """提前停止"""
+        self._stop.set()
+
+    def _issue(self, i, intended):
+        """发送第i个请求并记录结果"""
+        import requests
+
+        path, params = self.request_for(i)
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            response = self.client.get(path, params, idempotent=False)
+            if response.status_code != 200:
+                outcome = "http"
+        except requests.Timeout:
+            outcome = "timeout"
+        except requests.ConnectionError:
+            outcome = "connection"
+        except Exception:
+            outcome = "other"
+        end = time.perf_counter()
+
+        # 错误请求同样记录延迟，卡顿不应从分布中消失
+        self.latency.record(end - intended)
+        self.service_time.record(end - start)
+        with self._stats_lock:
+            if outcome == "ok":
+                self.ok += 1
+            elif outcome == "timeout":
+                self.timeouts += 1
+            elif outcome == "connection":
+                self.connection_errors += 1
+            elif outcome == "http":
+                self.http_errors += 1
+            else:
+                self.other_errors += 1
+
+    def run(self, on_progress=None):
+        """运行基准测试，返回结果字典"""
+        device_info = self._fetch_device_info()
+        start = time.perf_counter()
+        if self.rate:
+            self._run_open_loop(start, on_progress)
+        else:
+            self._run_closed_loop(start, on_progress)
+        elapsed = time.perf_counter() - start
+        self.client.close()
+        return self._result(elapsed, device_info)
+
+    def _run_open_loop(self, start, on_progress):
+        """开环定速：按 start + i/rate 调度，不等待前一个请求完成"""
+        interval = 1.0 / self.rate
+        total = int(self.duration * self.rate)
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="bench")
+        next_report = start + 1.0
+        i = 0
+        while i < total and not self._stop.is_set():
+            now = time.perf_counter()
+            # 补发所有已到期的请求（sleep精度不足时批量调度）
+            due = min(total, int((now - start) / interval) + 1)
+            if due > i + 1:
+                self.late_dispatches += due - i - 1
+            while i < due:
+                executor.submit(self._issue, i, start + i * interval)
+                i += 1
+            self.sent = i
+            if on_progress and now >= next_report:
+                on_progress(self.progress())
+                next_report += 1.0
+            sleep = start + i * interval - time.perf_counter()
+            if sleep > 0:
+                self._stop.wait(sleep)
+        executor.shutdown(wait=True)
+
+    def _run_closed_loop(self, start, on_progress):
+        """闭环定并发：每个连接完成一个请求后立即发送下一个"""
+        deadline = start + self.duration
+        counter = itertools.count()
+        lock = threading.Lock()
+
+        def worker():
+            while not self._stop.is_set() and time.perf_counter() < deadline:
+                with lock:
+                    i = next(counter)
+                    self.sent += 1
+                self._issue(i, time.perf_counter())
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(self.concurrency)]
+        for t in threads:
+            t.start()
+        while any(t.is_alive() for t in threads):
+            self._stop.wait(1.0)
+            if on_progress:
+                on_progress(self.progress())
+        for t in threads:
+            t.join()
+
+    def _fetch_device_info(self):
+        """记录被测设备信息，便于对比不同固件"""
+        try:
+            response = self.client.info()
+            if response.status_code == 200:
+                return response.json()
+        except Exception:
+            pass
+        return {}
+
+    def progress(self):
+        """当前进度（用于界面显示）"""
+        return {"sent": self.sent, "completed": self.latency.count,
+                "p99_ms": self.latency.percentile(99) / 1000.0}
+
+    def _result(self, elapsed, device_info):
+        """汇总结果"""
+        completed = self.latency.count
+        return {
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "target": self.ip,
+            "endpoint": self.endpoint,
+            "mode": "open-loop" if self.rate else "closed-loop",
+            "target_rate": self.rate,
+            "concurrency": self.concurrency,
+            "duration": self.duration,
+            "elapsed": elapsed,
+            "device_info": device_info,
+            "sent": self.sent,
+            "completed": completed,
+            "ok": self.ok,
+            "timeouts": self.timeouts,
+            "connection_errors": self.connection_errors,
+            "http_errors": self.http_errors,
+            "other_errors": self.other_errors,
+            "late_dispatches": self.late_dispatches,
+            "throughput": completed / elapsed if elapsed > 0 else 0.0,
+            "latency_ms": self.latency.summary_ms(),
+            "service_time_ms": self.service_time.summary_ms(),
+            "latency_histogram_us": self.latency.to_dict(),
+        }
+
+
+def export_result(result, filename=None):
+    """导出结果为JSON文件，返回文件名"""
+    if filename is None:
+        filename = f"esp32_bench_{result['endpoint']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return filename
+
+
+def format_result(result):
+    """格式化为文本摘要"""
+    lat = result["latency_ms"]
+    mode = "开环" if result["mode"] == "open-loop" else "闭环"
+    lines = [
+        f"基准测试 {result['target']} {result['endpoint']} ({mode}, "
+        f"目标速率: {result['target_rate'] or '-'}/s, 并发: {result['concurrency']}, 时长: {result['duration']}s)",
+        f"完成: {result['completed']}/{result['sent']} | 吞吐量: {result['throughput']:.1f} 次/秒",
+        f"延迟(ms): p50={lat['p50']:.1f} p90={lat['p90']:.1f} p99={lat['p99']:.1f} "
+        f"p99.9={lat['p99.9']:.1f} max={lat['max']:.1f}",
+        f"超时: {result['timeouts']} | 连接错误: {result['connection_errors']} | "
+        f"HTTP错误: {result['http_errors']} | 其他错误: {result['other_errors']}",
+    ]
+    return "\n".join(lines)
+
+
+def load_result(filename):
+    """读取 export_result 导出的结果（用作对比基线）"""
+    with open(filename, encoding="utf-8") as f:
+        result = json.load(f)
+    if not isinstance(result, dict) or "latency_ms" not in result or "throughput" not in result:
+        raise ValueError(f"{filename} 不是基准测试结果文件")
+    return result
+
+
+def compare_results(baseline, current):
+    """对比两次结果的延迟百分位和吞吐量，返回文本"""
+    lines = []
+    # 负载配置不同时百分位不可直接比较
+    for key, label in (("endpoint", "接口"), ("mode", "模式"), ("target_rate", "目标速率"),
+                       ("concurrency", "并发")):
+        if baseline.get(key) != current.get(key):
+            lines.append(f"注意: {label}不同（基线 {baseline.get(key)}，当前 {current.get(key)}）")
+    lines.append(f"{'指标':<12}{'基线':>10}{'当前':>10}{'变化':>10}")
+    rows = [(f"p{p:g}(ms)", f"p{p:g}") for p in REPORT_PERCENTILES]
+    for label, key in rows:
+        a = baseline["latency_ms"][key]
+        b = current["latency_ms"][key]
+        change = (b - a) / a * 100 if a else 0.0
+        lines.append(f"{label:<12}{a:>10.1f}{b:>10.1f}{change:>+9.1f}%")
+    a, b = baseline["throughput"], current["throughput"]
+    change = (b - a) / a * 100 if a else 0.0
+    lines.append(f"{'吞吐量':<12}{a:>10.1f}{b:>10.1f}{change:>+9.1f}%")
+    return "\n".join(lines)
@@ -0,0 +1,681 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESP32S3 SuperMini API测试命令行工具
+
+不需要图形界面，可在CI或无显示器的机器上运行。
+
+用法示例：
+    python esp32_cli.py scan
+    python esp32_cli.py known
+    python esp32_cli.py discover
+    python esp32_cli.py discover --network 192.168.1.0/24 --force
+    python esp32_cli.py monitor --duration 60
+    python esp32_cli.py connect 192.168.1.50
+    python esp32_cli.py control 192.168.1.50 --color 3 --brightness 80
+    python esp32_cli.py control 192.168.1.50 192.168.1.51 --power off
+    python esp32_cli.py --report report.txt full-test 192.168.1.50
+    python esp32_cli.py --export fleet full-test 192.168.1.50 192.168.1.51 192.168.1.52
+    python esp32_cli.py effect 192.168.1.50 --effect gradient --fps 10 20 40 80
+    python esp32_cli.py scenario regression.yaml 192.168.1.50 192.168.1.51
+    python esp32_cli.py --record session.e32r effect 192.168.1.50
+    python esp32_cli.py replay session.e32r --target 127.0.1.1:8080 --speed 4
+    python esp32_cli.py bench 192.168.1.50 --endpoint control --rate 50 --save fw_1_0.json
+    python esp32_cli.py bench 192.168.1.50 --endpoint control --rate 50 --baseline fw_1_0.json
+    python esp32_cli.py udp-bench --rate 1000 10000 50000 --devices 200 --malformed 0.05 --save udp.json
+    python esp32_cli.py udp-bench --rate 1000 10000 50000 --devices 200 --malformed 0.05 --baseline udp.json
+    python esp32_cli.py combine-check --trials 500
+
+只在模块顶层导入 argparse 和 sys，其他模块在子命令中按需导入，
+保证 --help 等命令快速启动。
+
+作者: ESP32开发团队
+版本: 1.0.0
+日期: 2025-11-06
+"""
+
+import argparse
+import sys
+
+# 退出码
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_ERROR = 2
+
+
+def _print_result(record):
+    """结果监听：逐行输出测试记录"""
+    print(f"[{record.time_text}] {record.test_name}: {record.result}", flush=True)
+
+
+def _engine(args):
+    from esp32_core import TesterEngine
+    from esp32_registry import default_registry_path
+
+    engine = TesterEngine(results_path=args.results_log,
+                          registry_path=args.registry or default_registry_path())
+    if not args.quiet:
+        engine.result_listeners.append(_print_result)
+    if args.record:
+        engine.start_recording(args.record)
+    if args.trace:
+        engine.start_tracing()
+    args.engine = engine    # 命令结束后（包括出错时）由 main 清理
+    return engine
+
+
+def _control_params(args):
+    """从命令行参数收集 /api/control 参数"""
+    params = {}
+    for name in ("power", "color", "brightness", "hue", "saturation", "value"):
+        value = getattr(args, name)
+        if value is not None:
+            params[name] = value
+    return params
+
+
+def _finish(engine, args):
+    """按需生成报告，根据失败数返回退出码"""
+    if args.report is not None:
+        filename = engine.generate_report(args.report or None)
+        print(f"测试报告已生成: {filename}")
+    if args.export is not None:
+        for filename in engine.export_reports(args.export or None, args.export_format):
+            print(f"报告已导出: {filename}")
+    return EXIT_FAILED if engine.test_results.failure_count else EXIT_OK
+
+
+def _close(engine, args):
+    """停止录制并导出性能追踪，停止事件循环，关闭结果文件"""
+    engine.stop_recording()
+    if args.trace:
+        engine.stop_tracing(args.trace)
+    engine.shutdown()
+    engine.test_results.close()
+
+
+def cmd_scan(args):
+    """扫描局域网设备"""
+    engine = _engine(args)
+
+    def on_device(result):
+        info = result.info or {}
+        print(f"{result.ip:<16}{info.get('device_name', '-'):<24}{info.get('device_id', '-'):<16}"
+              f"{result.connect_time * 1000:7.1f}ms", flush=True)
+
+    networks = None
+    if args.network:
+        import ipaddress
+        from esp32_scanner import LocalNetwork
+
+        try:
+            networks = [LocalNetwork("指定", "", ipaddress.ip_network(n, strict=False))
+                        for n in args.network]
+        except ValueError as e:
+            print(f"错误: {e}", file=sys.stderr)
+            return EXIT_ERROR
+
+    try:
+        engine.scan(on_device=on_device, networks=networks, port=args.port,
+                    concurrency=args.concurrency, connect_timeout=args.timeout)
+    except Exception as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    return _finish(engine, args)
+
+
+def cmd_discover(args):
+    """主动发现设备（/api/discover），未过期的缓存结果不重新探测"""
+    engine = _engine(args)
+
+    def on_device(result):
+        info = result.info
+        rtt = "     缓存" if result.cached else f"{(result.connect_time or 0) * 1000:7.1f}ms"
+        print(f"{result.ip:<22}{info.get('device_name', '-'):<24}{info.get('device_id', '-'):<16}"
+              f"{rtt}", flush=True)
+
+    networks = None
+    if args.network:
+        import ipaddress
+        from esp32_scanner import LocalNetwork
+
+        try:
+            networks = [LocalNetwork("指定", "", ipaddress.ip_network(n, strict=False))
+                        for n in args.network]
+        except ValueError as e:
+            print(f"错误: {e}", file=sys.stderr)
+            return EXIT_ERROR
+    elif args.known_only:
+        networks = []
+
+    try:
+        engine.discover(on_device=on_device, networks=networks, port=args.port, force=args.force,
+                        concurrency=args.concurrency, connect_timeout=args.timeout,
+                        ttl=args.ttl, miss_ttl=args.miss_ttl)
+    except Exception as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    return _finish(engine, args)
+
+
+def cmd_known(args):
+    """列出已知设备（默认先并发校验是否在线）"""
+    import time
+
+    engine = _engine(args)
+    entries = engine.registry.entries()
+    if not entries:
+        print("注册表中没有已知设备，请先运行 scan 或 connect")
+        return _finish(engine, args)
+
+    if args.no_validate:
+        for entry in entries:
+            seen = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry.last_seen))
+            print(f"{entry.ip:<22}{entry.device_name:<24}{entry.device_id:<16}{seen}")
+        return _finish(engine, args)
+
+    def on_result(result):
+        entry = result.entry
+        rtt = f"{result.connect_time * 1000:7.1f}ms" if result.online else "      -"
+        moved = f" (原 {result.old_ip})" if result.ip != result.old_ip else ""
+        print(f"{result.ip:<22}{entry.device_name:<24}{entry.device_id:<16}{result.status:<9}"
+              f"{rtt}{moved}", flush=True)
+
+    engine.validate_registry(on_result=on_result)
+    return _finish(engine, args)
+
+
+def cmd_monitor(args):
+    """后台健康监控：输出健康状态变化，结束时输出每台设备的统计"""
+    import time
+    from esp32_monitor import DOWN
+    from esp32_results import Outcome
+
+    engine = _engine(args)
+    monitor = engine.monitor
+    monitor.min_interval = args.min_interval
+    monitor.max_interval = args.max_interval
+    addresses = args.ips or [entry.ip for entry in engine.registry.entries()]
+    if not addresses:
+        print("没有要监控的设备，请指定IP或先运行 scan", file=sys.stderr)
+        return EXIT_ERROR
+    for address in addresses:
+        entry = engine.registry.by_ip(address)
+        monitor.add(address, entry.device_id if entry else "")
+
+    cpu_start = time.process_time()
+    start = time.monotonic()
+    monitor.start()
+    try:
+        while time.monotonic() - start < args.duration:
+            time.sleep(1.0)
+            for health in monitor.drain_changes():
+                engine.add_result(f"设备 {health.address} 健康状态", health.state,
+                                  Outcome.INFO, device=health.address)
+    finally:
+        monitor.stop()
+    elapsed = time.monotonic() - start
+    cpu = time.process_time() - cpu_start
+
+    print(f"{'地址':<22}{'状态':<10}{'轮询':>6}{'广播':>6}{'间隔':>8}{'可用率':>8}{'RTT中位数':>10}")
+    for health in sorted(monitor.devices(), key=lambda h: h.address):
+        median = health.series.median_rtt(health.series.size)
+        rtt = f"{median * 1000:.1f}ms" if median is not None else "-"
+        print(f"{health.address:<22}{health.state:<10}{health.polls:>6}{health.announcements:>6}"
+              f"{health.interval:>7.1f}s{health.series.availability() * 100:>7.0f}%{rtt:>10}")
+    print(f"监控 {len(monitor)} 台设备 {elapsed:.0f}秒, CPU占用 {cpu / elapsed * 100:.2f}%")
+    for health in monitor.devices():
+        status = "失败: 离线" if health.state == DOWN else "成功"
+        engine.add_result(f"健康检查 {health.address}", status, device=health.address)
+    return _finish(engine, args)
+
+
+def cmd_connect(args):
+    """连接设备并显示设备信息"""
+    import json
+
+    engine = _engine(args)
+    try:
+        info = engine.connect(args.ip)
+    except Exception as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    print(json.dumps(info, ensure_ascii=False, indent=2))
+    return _finish(engine, args)
+
+
+def cmd_control(args):
+    """向一个或多个设备发送控制命令"""
+    params = _control_params(args)
+    if not params:
+        print("错误: 至少需要一个控制参数", file=sys.stderr)
+        return EXIT_ERROR
+
+    engine = _engine(args)
+    if len(args.ips) == 1:
+        try:
+            engine.connect(args.ips[0])
+            engine.control(**params)
+        except Exception:
+            pass  # 失败已记录到测试结果
+        return _finish(engine, args)
+
+    from esp32_fleet import summarize
+
+    results = engine.fleet.control(args.ips, **params)
+    for r in results:
+        status = "成功" if r.ok else f"失败: {r.error}"
+        engine.add_result(f"控制 {r.ip} ({r.latency * 1000:.1f}ms)", status)
+    success, failed, max_latency = summarize(results)
+    print(f"成功 {success} | 失败 {failed} | 最大延迟 {max_latency * 1000:.1f}ms")
+    engine.fleet.shutdown()
+    return _finish(engine, args)
+
+
+def cmd_full_test(args):
+    """运行完整测试（多个IP时在所有设备上并发运行）"""
+    engine = _engine(args)
+    if len(args.ips) == 1:
+        try:
+            engine.connect(args.ips[0])
+        except Exception as e:
+            print(f"错误: {e}", file=sys.stderr)
+            return EXIT_ERROR
+        engine.run_full_test(delay=args.delay, broadcast_wait=args.broadcast_wait)
+        return _finish(engine, args)
+
+    def on_device(run):
+        if args.quiet:
+            status = "通过" if run.ok else f"失败: {run.first_error()}"
+            print(f"{run.ip:<22}{run.passed:>3}/{run.total_steps:<4}{run.elapsed:6.1f}s  {status}",
+                  flush=True)
+
+    runs = engine.run_fleet_test(args.ips, args.delay, args.broadcast_wait, args.concurrency,
+                                 args.device_timeout, on_device)
+    print(f"{'地址':<22}{'通过':>6}{'p50(ms)':>10}{'p99(ms)':>10}{'耗时':>8}  结果")
+    for run in runs:
+        lat = run.latency.summary_ms() if run.latency.count else {"p50": 0.0, "p99": 0.0}
+        status = "通过" if run.ok else f"失败: {run.first_error()}"
+        print(f"{run.ip:<22}{run.passed:>3}/{run.total_steps:<3}{lat['p50']:>10.1f}{lat['p99']:>10.1f}"
+              f"{run.elapsed:>7.1f}s  {status}")
+    return _finish(engine, args)
+
+
+def cmd_effect(args):
+    """按一组帧率播放灯效，找出能流畅播放的最高帧率"""
+    from esp32_effects import EFFECTS
+
+    engine = _engine(args)
+    try:
+        engine.connect(args.ip)
+    except Exception as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return EXIT_ERROR
+
+    frames = EFFECTS[args.effect]() * args.loops
+    best = None
+    for fps in sorted(args.fps):
+        stats = engine.play_effect(f"{args.effect} @{fps:g}FPS", frames, fps, args.policy)
+        if args.quiet:
+            print(stats.summary())
+        if stats.smooth:
+            best = fps
+    print(f"能流畅播放的最高帧率: {best:g} FPS" if best else "所有帧率均不流畅")
+    return _finish(engine, args)
+
+
+def cmd_scenario(args):
+    """校验场景文件并在一台或多台设备上运行"""
+    from esp32_scenario import ScenarioError, load_scenario
+
+    try:
+        scenario = load_scenario(args.file)
+    except (OSError, ScenarioError) as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return EXIT_ERROR
+
+    print(f"场景 {scenario.name}: {len(scenario)} 个步骤, 等待共 {scenario.duration:.1f}秒")
+    if args.check:
+        for i, step in enumerate(scenario.program, 1):
+            extras = []
+            if step.expect:
+                extras.append(f"断言 {step.expect}")
+            if step.budget is not None:
+                extras.append(f"预算 {step.budget * 1000:g}ms")
+            if step.wait:
+                extras.append(f"等待 {step.wait:g}s")
+            print(f"{i:>5}. {step.name}  {'  '.join(extras)}")
+        return EXIT_OK
+    if not args.ips:
+        print("错误: 需要至少一个设备IP（或使用 --check 只校验场景）", file=sys.stderr)
+        return EXIT_ERROR
+
+    engine = _engine(args)
+    runs = engine.run_scenario(scenario, args.ips, args.concurrency, args.device_timeout)
+    for run in runs:
+        status = "通过" if run.ok else f"失败: {run.first_error()}"
+        print(f"{run.ip:<22}{run.passed:>5}/{run.total_steps:<5}{run.elapsed:7.1f}s  {status}")
+    return _finish(engine, args)
+
+
+def cmd_replay(args):
+    """回放录制文件并与录制时的状态码和延迟对比"""
+    engine = _engine(args)
+    udp_target = None
+    if args.udp:
+        host, _, port = args.udp.rpartition(":")
+        udp_target = (host or "224.0.0.1", int(port))
+    try:
+        report = engine.replay(args.file, 0 if args.max_speed else args.speed, args.target,
+                               udp_target)
+    except (OSError, ValueError) as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    if args.quiet:
+        print(report.summary())
+    return _finish(engine, args)
+
+
+def cmd_bench(args):
+    """对单台设备运行接口基准测试，可保存结果并与之前固件的结果对比"""
+    from esp32_bench import LoadGenerator, compare_results, export_result, format_result, load_result
+
+    baseline = None
+    if args.baseline:
+        try:
+            baseline = load_result(args.baseline)
+        except (OSError, ValueError) as e:
+            print(f"错误: {e}", file=sys.stderr)
+            return EXIT_ERROR
+
+    generator = LoadGenerator(args.ip, endpoint=args.endpoint, rate=args.rate or None,
+                              concurrency=args.concurrency, duration=args.duration, timeout=args.timeout)
+    progress = None if args.quiet else (lambda p: print(
+        f"已发送 {p['sent']} 已完成 {p['completed']} p99 {p['p99_ms']:.1f}ms", flush=True))
+    result = generator.run(on_progress=progress)
+    print(format_result(result))
+    if baseline is not None:
+        print()
+        print(compare_results(baseline, result))
+    if args.save is not None:
+        print(f"结果已保存: {export_result(result, args.save or None)}")
+    return EXIT_FAILED if result["completed"] != result["ok"] else EXIT_OK
+
+
+def cmd_udp_bench(args):
+    """按一组速率向本机发送合成UDP广播，测量设备发现的接收能力，可与基线对比"""
+    from esp32_udpbench import (LOSS_TOLERANCE, FloodConfig, compare_flood, export_flood, find_baseline,
+                                format_flood, load_flood, run_flood)
+
+    baseline = None
+    if args.baseline:
+        try:
+            baseline = load_flood(args.baseline)
+        except (OSError, ValueError) as e:
+            print(f"错误: {e}", file=sys.stderr)
+            return EXIT_ERROR
+
+    results = []
+    regressions = []
+    best = None
+    for rate in sorted(args.rate):
+        config = FloodConfig(rate, args.devices, args.duration, args.name_variation, args.churn,
+                             args.malformed, args.port, seed=args.seed)
+        try:
+            result = run_flood(config)
+        except (OSError, RuntimeError, ValueError) as e:
+            print(f"错误: {e}", file=sys.stderr)
+            return EXIT_ERROR
+        results.append(result)
+        print(format_flood(result))
+        if result["loss_ratio"] <= LOSS_TOLERANCE:
+            best = rate
+        if baseline is not None:
+            previous = find_baseline(baseline, result)
+            if previous is None:
+                print("基线中没有相同配置的结果，跳过对比")
+            else:
+                text, found = compare_flood(previous, result)
+                print(text)
+                regressions.extend(f"{rate:g}/s {item}" for item in found)
+        print()
+    print(f"无丢包接收的最高速率: {best:g} 个/秒" if best else "所有速率均有丢包")
+
+    if args.save is not None:
+        print(f"结果已保存: {export_flood(results, args.save or None)}")
+    if regressions:
+        print("与基线相比退化: " + "; ".join(regressions))
+        return EXIT_FAILED
+    return EXIT_OK
+
+
+def cmd_combine_check(args):
+    """验证合并命令：同一组随机命令逐个发往设备A、合并后发往设备B，对比两台设备的状态"""
+    import random
+
+    from esp32_client import DeviceClient
+    from esp32_state import INFO_FIELDS, CommandBuilder, random_commands, random_state
+
+    simulator = None
+    if args.ips and len(args.ips) != 2:
+        print("错误: 需要两台设备的地址（或不指定以使用内置模拟器）", file=sys.stderr)
+        return EXIT_ERROR
+    if args.ips:
+        addresses = args.ips
+    else:
+        from esp32_simulator import DeviceSimulator
+
+        simulator = DeviceSimulator(count=2, base_ip=args.base_ip, port=args.port,
+                                    service_time=0.0, jitter=0.0).start()
+        addresses = simulator.addresses
+    sequential, combined = DeviceClient(addresses[0]), DeviceClient(addresses[1])
+    fields = [field for _, field in INFO_FIELDS if field != "broadcast_enabled"]
+
+    def send(client, requests):
+        for params in requests:
+            client.control(**params)
+
+    def light_state(client):
+        info = client.info().json()
+        return {field: info.get(field) for field in fields}
+
+    rng = random.Random(args.seed)
+    sent = merged = 0
+    mismatches = []
+    try:
+        for trial in range(args.trials):
+            # 两台设备先设置为同一个随机初始状态
+            state = random_state(rng)
+            hsv = {"hue": state.hsv_hue, "saturation": state.hsv_saturation, "value": state.hsv_value}
+            color = {"color": state.current_rgb_color}
+            setup = [color, hsv] if state.use_hsv_mode else [hsv, color]
+            setup.append({"brightness": state.rgb_brightness,
+                          "power": "on" if state.rgb_enabled else "off"})
+            for client in (sequential, combined):
+                send(client, CommandBuilder(setup).build())
+
+            commands = random_commands(rng, rng.randint(1, args.length))
+            requests = CommandBuilder(commands).build()
+            send(sequential, commands)
+            send(combined, requests)
+            sent += len(commands)
+            merged += len(requests)
+
+            expected, actual = light_state(sequential), light_state(combined)
+            if expected != actual:
+                mismatches.append((trial, commands, requests, expected, actual))
+    except Exception as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return EXIT_ERROR
+    finally:
+        if simulator is not None:
+            simulator.stop()
+
+    saved = (1 - merged / sent) * 100 if sent else 0.0
+    print(f"合并检查: {args.trials} 组命令, 逐个发送 {sent} 个请求, 合并后 {merged} 个请求 "
+          f"(减少 {saved:.1f}%), 状态不一致 {len(mismatches)} 组")
+    for trial, commands, requests, expected, actual in mismatches[:5]:
+        diff = {field: (expected[field], actual[field]) for field in fields if expected[field] != actual[field]}
+        print(f"  第{trial + 1}组 命令 {commands} -> 请求 {requests}: {diff}")
+    return EXIT_FAILED if mismatches else EXIT_OK
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="esp32_cli", description="ESP32S3 SuperMini API测试命令行工具")
+    parser.add_argument("-q", "--quiet", action="store_true", help="不逐行输出测试记录")
+    parser.add_argument("--report", nargs="?", const="", default=None, metavar="FILE",
+                        help="完成后生成文本测试报告（不指定文件名时自动命名）")
+    parser.add_argument("--export", nargs="?", const="", default=None, metavar="BASENAME",
+                        help="完成后导出 JSON/CSV/JUnit XML 报告（BASENAME.json/.csv/.xml）")
+    parser.add_argument("--export-format", action="append", choices=["json", "csv", "junit"],
+                        help="只导出指定格式（可多次指定，默认全部）")
+    parser.add_argument("--results-log", metavar="FILE",
+                        help="把全部测试结果追加写入JSONL文件")
+    parser.add_argument("--record", metavar="FILE",
+                        help="把发出的控制/广播请求录制到二进制文件（可用 replay 回放）")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="记录性能追踪并导出 Chrome trace JSON（可用 ui.perfetto.dev 打开）")
+    parser.add_argument("--registry", metavar="FILE",
+                        help="已知设备注册表文件（默认在缓存目录中）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scan = subparsers.add_parser("scan", help="扫描局域网设备")
+    scan.add_argument("--network", action="append", metavar="CIDR",
+                      help="扫描指定网段（可多次指定，默认扫描本机所在网段）")
+    scan.add_argument("--port", type=int, default=80, help="设备HTTP端口")
+    scan.add_argument("--concurrency", type=int, default=256, help="最大并发连接数")
+    scan.add_argument("--timeout", type=float, default=0.5, help="连接超时（秒）")
+    scan.set_defaults(func=cmd_scan)
+
+    discover = subparsers.add_parser("discover", help="主动发现设备（/api/discover，带缓存）")
+    discover.add_argument("--network", action="append", metavar="CIDR",
+                          help="探测指定网段（可多次指定，默认本机所在网段）")
+    discover.add_argument("--known-only", action="store_true",
+                          help="只探测已知设备和邻居表中的地址，不探测整个网段")
+    discover.add_argument("--port", type=int, default=80, help="设备HTTP端口")
+    discover.add_argument("--concurrency", type=int, default=256, help="最大并发连接数")
+    discover.add_argument("--timeout", type=float, default=0.5, help="连接超时（秒）")
+    discover.add_argument("--ttl", type=float, default=600.0, help="设备应答的缓存时间（秒）")
+    discover.add_argument("--miss-ttl", type=float, default=120.0, help="无应答地址的缓存时间（秒）")
+    discover.add_argument("--force", action="store_true", help="忽略缓存，重新探测全部地址")
+    discover.set_defaults(func=cmd_discover)
+
+    known = subparsers.add_parser("known", help="列出并校验已知设备（扫描或连接过的设备）")
+    known.add_argument("--no-validate", action="store_true", help="只列出，不探测是否在线")
+    known.set_defaults(func=cmd_known)
+
+    monitor = subparsers.add_parser("monitor", help="后台健康监控（自适应轮询 /api/info）")
+    monitor.add_argument("ips", nargs="*", metavar="ip", help="设备地址（默认监控全部已知设备）")
+    monitor.add_argument("--duration", type=float, default=60.0, help="监控时长（秒）")
+    monitor.add_argument("--min-interval", type=float, default=2.0, help="最短轮询间隔（秒）")
+    monitor.add_argument("--max-interval", type=float, default=60.0, help="最长轮询间隔（秒）")
+    monitor.set_defaults(func=cmd_monitor)
+
+    connect = subparsers.add_parser("connect", help="连接设备并显示设备信息")
+    connect.add_argument("ip", help="设备IP地址（可带端口，如 127.0.1.1:8080）")
+    connect.set_defaults(func=cmd_connect)
+
+    control = subparsers.add_parser("control", help="发送控制命令（多个IP时并发发送）")
+    control.add_argument("ips", nargs="+", metavar="ip", help="设备IP地址")
+    control.add_argument("--power", choices=["on", "off"], help="电源")
+    control.add_argument("--color", type=int, help="预设颜色（0彩虹, 1-7）")
+    control.add_argument("--brightness", type=int, help="亮度 0-100")
+    control.add_argument("--hue", type=int, help="色相 0-360")
+    control.add_argument("--saturation", type=int, help="饱和度 0-100")
+    control.add_argument("--value", type=int, help="明度 0-100")
+    control.set_defaults(func=cmd_control)
+
+    full_test = subparsers.add_parser("full-test", help="运行完整测试（多个IP时并发运行）")
+    full_test.add_argument("ips", nargs="+", metavar="ip", help="设备IP地址")
+    full_test.add_argument("--delay", type=float, default=0.5, help="每个测试步骤的间隔（秒）")
+    full_test.add_argument("--broadcast-wait", type=float, default=2.0, help="广播测试等待时间（秒）")
+    full_test.add_argument("--concurrency", type=int, default=64, help="多台设备时的最大在途请求数")
+    full_test.add_argument("--device-timeout", type=float, default=60.0,
+                           help="多台设备时每台设备的总超时（秒）")
+    full_test.set_defaults(func=cmd_full_test)
+
+    effect = subparsers.add_parser("effect", help="按截止时间播放灯效并统计实际帧率")
+    effect.add_argument("ip", help="设备IP地址")
+    effect.add_argument("--effect", choices=["rainbow", "gradient", "random", "walk"], default="rainbow",
+                        help="灯效")
+    effect.add_argument("--fps", type=float, nargs="+", default=[10.0], help="目标帧率（可指定多个）")
+    effect.add_argument("--policy", choices=["drop", "merge", "none"], default="drop",
+                        help="设备跟不上时的处理：丢弃过期帧/合并过期帧/逐帧发送")
+    effect.add_argument("--loops", type=int, default=1, help="循环次数")
+    effect.set_defaults(func=cmd_effect)
+
+    scenario = subparsers.add_parser("scenario", help="运行JSON/YAML场景文件（多个IP时并发运行）")
+    scenario.add_argument("file", help="场景文件（.json/.yaml/.yml）")
+    scenario.add_argument("ips", nargs="*", metavar="ip", help="设备IP地址")
+    scenario.add_argument("--check", action="store_true", help="只校验并列出编译后的步骤")
+    scenario.add_argument("--concurrency", type=int, default=64, help="最大在途请求数")
+    scenario.add_argument("--device-timeout", type=float, default=600.0,
+                          help="每台设备的总超时（秒）")
+    scenario.set_defaults(func=cmd_scenario)
+
+    replay = subparsers.add_parser("replay", help="回放录制的请求流并对比状态码和延迟")
+    replay.add_argument("file", help="录制文件")
+    replay.add_argument("--target", metavar="IP", help="全部发往该设备（默认发往录制时的设备）")
+    replay.add_argument("--speed", type=float, default=1.0, help="回放倍速")
+    replay.add_argument("--max-speed", action="store_true", help="不等待，按最快速度回放")
+    replay.add_argument("--udp", metavar="[HOST]:PORT",
+                        help="同时把录制的UDP广播发往该地址（如 :8888 为组播组）")
+    replay.set_defaults(func=cmd_replay)
+
+    bench = subparsers.add_parser("bench", help="接口性能基准测试（可与之前固件的结果对比）")
+    bench.add_argument("ip", help="设备IP地址（可带端口，如 127.0.1.1:8080）")
+    bench.add_argument("--endpoint", choices=["info", "control", "broadcast"], default="info", help="测试的接口")
+    bench.add_argument("--rate", type=float, default=20.0, help="每秒请求数（0为闭环定并发）")
+    bench.add_argument("--concurrency", type=int, default=4, help="并发连接数")
+    bench.add_argument("--duration", type=float, default=10.0, help="时长（秒）")
+    bench.add_argument("--timeout", type=float, default=2.0, help="请求超时（秒）")
+    bench.add_argument("--save", nargs="?", const="", default=None, metavar="FILE",
+                       help="把结果保存为JSON（不指定文件名时自动命名）")
+    bench.add_argument("--baseline", metavar="FILE", help="与之前保存的结果对比延迟百分位和吞吐量")
+    bench.set_defaults(func=cmd_bench)
+
+    udp_bench = subparsers.add_parser("udp-bench", help="UDP广播洪泛基准测试（本机回环，不需要设备）")
+    udp_bench.add_argument("--rate", type=float, nargs="+", default=[1000.0],
+                           help="每秒发送的广播数（可指定多个）")
+    udp_bench.add_argument("--devices", type=int, default=100, help="虚拟设备数（每台一个回环地址）")
+    udp_bench.add_argument("--duration", type=float, default=5.0, help="每个速率的发送时长（秒）")
+    udp_bench.add_argument("--name-variation", type=float, default=0.0,
+                           help="设备名加随机后缀的设备比例（0-1，改变数据报长度）")
+    udp_bench.add_argument("--churn", type=float, default=0.0,
+                           help="以新名称广播的比例（0-1，触发设备变更和界面刷新）")
+    udp_bench.add_argument("--malformed", type=float, default=0.0, help="格式错误数据报的比例（0-1）")
+    udp_bench.add_argument("--port", type=int, default=18888, help="UDP端口（默认不用8888以免混入真实设备）")
+    udp_bench.add_argument("--seed", type=int, default=1, help="随机种子")
+    udp_bench.add_argument("--save", nargs="?", const="", default=None, metavar="FILE",
+                           help="把结果保存为基线JSON（不指定文件名时自动命名）")
+    udp_bench.add_argument("--baseline", metavar="FILE", help="与基线JSON中相同配置的结果对比，退化时退出码为1")
+    udp_bench.set_defaults(func=cmd_udp_bench)
+
+    combine = subparsers.add_parser("combine-check",
+                                    help="验证合并命令与逐个发送的设备状态一致（默认使用内置模拟器）")
+    combine.add_argument("ips", nargs="*", metavar="ip",
+                         help="两台设备的地址（A逐个发送，B合并发送；不指定时启动两台模拟设备）")
+    combine.add_argument("--trials", type=int, default=200, help="随机命令组数")
+    combine.add_argument("--length", type=int, default=6, help="每组最多的命令数")
+    combine.add_argument("--seed", type=int, default=1, help="随机种子")
+    combine.add_argument("--base-ip", default="127.0.1.201", help="模拟设备的第一个回环地址")
+    combine.add_argument("--port", type=int, default=18080, help="模拟设备的HTTP端口")
+    combine.set_defaults(func=cmd_combine_check)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except KeyboardInterrupt:
+        return EXIT_ERROR
+    finally:
+        engine = getattr(args, "engine", None)
+        if engine is not None:
+            _close(engine, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESP32 设备HTTP客户端
+
+功能特性：
+1. 每个设备一个客户端，持有keep-alive连接池
+2. 统一构造 /api/control 等接口的查询参数
+3. 幂等请求在连接失败时有界退避重试
+4. 记录每次调用的连接耗时和响应耗时
+5. 可选的流量录制器（esp32_replay.TrafficRecorder）记录发出的控制请求
+
+作者: ESP32开发团队
+版本: 1.0.0
+日期: 2025-11-06
+"""
+
+import threading
+import time
+from collections import deque, namedtuple
+from urllib.parse import urlencode
+
+import esp32_trace
+from esp32_state import CommandBuilder
+
+DEFAULT_TIMEOUT = 5
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.05
+MAX_BACKOFF = 0.5
+DEFAULT_POOL_SIZE = 2
+TIMING_HISTORY = 1000
+
+# 单次调用耗时（秒）: 接口路径, HTTP状态码(失败为None), TCP连接耗时(复用连接为0),
+# 收到响应头耗时, 总耗时, 尝试次数
+CallTiming = namedtuple("CallTiming", ["path", "status", "connect", "response", "total", "attempts"])
+
+# 当前线程最近一次新建TCP连接的耗时，由连接池回调写入
+_connect_timing = threading.local()
+
+_adapter_class = None
+
+
+def _timed_adapter_class():
+    """使用计时连接的HTTP适配器类
+
+    requests 导入耗时较长，首次创建客户端时才导入，
+    这样不发HTTP请求的命令行功能可以快速启动。
+    """
+    global _adapter_class
+    if _adapter_class is not None:
+        return _adapter_class
+
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection
+    from urllib3.connectionpool import HTTPConnectionPool
+
+    class TimedHTTPConnection(HTTPConnection):
+        """记录TCP建连耗时的HTTP连接"""
+
+        def _new_conn(self):
+            start = time.perf_counter()
+            try:
+                return super()._new_conn()
+            finally:
+                _connect_timing.elapsed = getattr(_connect_timing, "elapsed", 0.0) + time.perf_counter() - start
+
+    class TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = TimedHTTPConnection
+
+    class TimedHTTPAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            pool_classes = dict(self.poolmanager.pool_classes_by_scheme)
+            pool_classes["http"] = TimedHTTPConnectionPool
+            self.poolmanager.pool_classes_by_scheme = pool_classes
+
+    _adapter_class = TimedHTTPAdapter
+    return _adapter_class
+
+
+def build_query(params):
+    """构造查询字符串，按传入顺序输出，忽略值为None的参数"""
+    items = []
+    for key, value in params.items():
+        if value is None:
+            continue
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        items.append((key, value))
+    return urlencode(items)
+
+
+class DeviceClient:
+    """单个ESP32设备的HTTP客户端"""
+
+    def __init__(self, ip, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, pool_size=DEFAULT_POOL_SIZE):
+        self.ip = ip
+        self.base_url = f"http://{ip}"
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+        import requests
+
+        self.session = requests.Session()
+        adapter = _timed_adapter_class()(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+
+        # 调用耗时记录
+        self.timings = deque(maxlen=TIMING_HISTORY)
+        self.last_timing = None
+        self.call_count = 0
+        self.error_count = 0
+
+        # 流量录制器，为None时不录制
+        self.recorder = None
+
+    def get(self, path, params=None, timeout=None, idempotent=True):
+        """发送GET请求，返回带有 timing 属性的 requests.Response"""
+        import requests
+
+        url = self.base_url + path
+        query = build_query(params) if params else ""
+        if query:
+            url += "?" + query
+        timeout = self.timeout if timeout is None else timeout
+
+        attempts = 0
+        connect_time = 0.0
+        start = time.perf_counter()
+        while True:
+            attempts += 1
+            _connect_timing.elapsed = 0.0
+            try:
+                response = self.session.get(url, timeout=timeout)
+                connect_time += _connect_timing.elapsed
+                break
+            except requests.ConnectionError:
+                # 连接失败（含keep-alive连接被设备关闭）时重试幂等请求
+                connect_time += _connect_timing.elapsed
+                if not idempotent or attempts > self.retries:
+                    self._record(path, None, connect_time, 0.0, start, attempts, query)
+                    raise
+                time.sleep(min(MAX_BACKOFF, self.backoff * (2 ** (attempts - 1))))
+            except requests.RequestException:
+                connect_time += _connect_timing.elapsed
+                self._record(path, None, connect_time, 0.0, start, attempts, query)
+                raise
+
+        response.timing = self._record(path, response.status_code, connect_time,
+                                       response.elapsed.total_seconds(), start, attempts, query)
+        return response
+
+    def _record(self, path, status, connect_time, response_time, start, attempts, query=""):
+        """记录一次调用的耗时（有录制器时同时写入录制文件）"""
+        timing = CallTiming(path, status, connect_time, response_time,
+                            time.perf_counter() - start, attempts)
+        self.timings.append(timing)
+        self.last_timing = timing
+        self.call_count += 1
+        if status is None:
+            self.error_count += 1
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.record_request(self.ip, path, query, status, start, timing.total)
+        esp32_trace.trace_request("GET", path, start, connect_time, response_time, timing.total,
+                                  status, attempts)
+        return timing
+
+    def info(self, timeout=None):
+        """获取设备信息 /api/info"""
+        return self.get("/api/info", timeout=timeout)
+
+    def discover(self, timeout=None):
+        """设备发现接口 /api/discover"""
+        return self.get("/api/discover", timeout=timeout)
+
+    def control(self, **params):
+        """控制RGB灯光 /api/control，参数按传入顺序发送"""
+        return self.get("/api/control", params)
+
+    def broadcast(self, action):
+        """控制UDP广播 /api/broadcast"""
+        return self.get("/api/broadcast", {"action": action})
+
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
+
+
+class CoalescingSender:
+    """最新值优先的合并发送队列
+
+    在后台线程中发送 /api/control 请求，同一时间最多一个请求在途。
+    排队中的参数由 CommandBuilder 合并（同名参数取新值，HSV/预设颜色模式与逐个发送一致），
+    被合并掉的中间状态计入 skipped；
+    should_send 判定为不会改变设备状态的参数不发送，计入 suppressed。
+    """
+
+    def __init__(self, client, max_rate=20.0, on_result=None, should_send=None):
+        self.client = client
+        self.max_rate = max_rate
+        self.on_result = on_result
+        # should_send(params) 返回False时不发送（例如参数不会改变设备状态）
+        self.should_send = should_send
+
+        self.sent = 0
+        self.skipped = 0
+        self.suppressed = 0
+        self.failed = 0
+
+        self._pending = CommandBuilder()
+        self._last_send = 0.0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, **params):
+        """提交控制参数，与尚未发送的参数合并"""
+        with self._cond:
+            if self._pending:
+                self.skipped += 1
+            self._pending.add(**params)
+            self._cond.notify()
+
+    def set_max_rate(self, max_rate):
+        """设置最大发送频率（次/秒），0表示不限制"""
+        with self._cond:
+            self.max_rate = max_rate
+            self._cond.notify()
+
+    def close(self):
+        """停止发送线程，丢弃未发送的参数"""
+        with self._cond:
+            self._closed = True
+            self._pending.clear()
+            self._cond.notify()
+
+    def _next_params(self):
+        """等待下一组待发送参数，同时遵守最大发送频率"""
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+                if self._pending:
+                    interval = 1.0 / self.max_rate if self.max_rate > 0 else 0.0
+                    delay = self._last_send + interval - time.monotonic()
+                    if delay <= 0:
+                        # 合并结果偶尔需要两个请求，后一个留在队列中继续合并
+                        requests = self._pending.build()
+                        self._pending = CommandBuilder(requests[1:])
+                        self._last_send = time.monotonic()
+                        if requests:
+                            return requests[0]
+                        continue
+                    # 等待期间到达的新值继续合并
+                    self._cond.wait(delay)
+                else:
+                    self._cond.wait()
+
+    def _run(self):
+        """发送线程"""
+        while True:
+            params = self._next_params()
+            if params is None:
+                return
+            if self.should_send is not None and not self.should_send(params):
+                self.suppressed += 1
+                continue
+
+            response, error = None, None
+            try:
+                with esp32_trace.span("合并发送", "worker", {"params": len(params)}):
+                    response = self.client.control(**params)
+                if response.status_code != 200:
+                    self.failed += 1
+                else:
+                    self.sent += 1
+            except Exception as e:
+                error = e
+                self.failed += 1
+
+            if self.on_result:
+                self.on_result(params, response, error)
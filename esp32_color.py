@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESP32 颜色空间转换
+
+功能特性：
+1. 与固件 hsvToRgb 一致的标量HSV/RGB互转
+2. 基于NumPy的批量HSV/RGB互转（与标量版本逐像素一致）
+3. 整数HSV网格（360×101×101）查找表，用于大批量转换
+
+作者: ESP32开发团队
+版本: 1.0.0
+日期: 2025-11-06
+"""
+
+import threading
+
+try:
+    import numpy as np
+except ImportError:  # NumPy为可选依赖，缺失时只能使用标量转换
+    np = None
+
+# 整数HSV网格尺寸: 色相0-359, 饱和度0-100, 明度0-100
+LUT_SHAPE = (360, 101, 101)
+
+_lut = None
+_lut_lock = threading.Lock()
+
+
+def hsv_to_rgb(h, s, v):
+    """HSV转RGB转换（h: 0-360, s/v: 0-100），返回 (r, g, b) 0-255"""
+    h = h % 360
+    if h < 0:
+        h += 360
+
+    s = max(0, min(100, s)) / 100.0
+    v = max(0, min(100, v)) / 100.0
+
+    c = v * s
+    x = c * (1 - abs((h / 60) % 2 - 1))
+    m = v - c
+
+    if h < 60:
+        r, g, b = c, x, 0
+    elif h < 120:
+        r, g, b = x, c, 0
+    elif h < 180:
+        r, g, b = 0, c, x
+    elif h < 240:
+        r, g, b = 0, x, c
+    elif h < 300:
+        r, g, b = x, 0, c
+    else:
+        r, g, b = c, 0, x
+
+    r = int((r + m) * 255)
+    g = int((g + m) * 255)
+    b = int((b + m) * 255)
+
+    return (r, g, b)
+
+
+def rgb_to_hsv(r, g, b):
+    """RGB转HSV转换（r/g/b: 0-255），返回 (h 0-360, s 0-100, v 0-100)"""
+    r, g, b = r/255.0, g/255.0, b/255.0
+    max_val = max(r, g, b)
+    min_val = min(r, g, b)
+    delta = max_val - min_val
+
+    if delta == 0:
+        h = 0
+    elif max_val == r:
+        h = 60 * (((g - b) / delta) % 6)
+    elif max_val == g:
+        h = 60 * (((b - r) / delta) + 2)
+    else:
+        h = 60 * (((r - g) / delta) + 4)
+
+    if max_val == 0:
+        s = 0
+    else:
+        s = delta / max_val
+
+    v = max_val
+
+    return (h, s * 100, v * 100)
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("批量颜色转换需要安装NumPy: pip install numpy")
+
+
+def hsv_to_rgb_array(h, s, v):
+    """批量HSV转RGB，参数为可广播的数组，返回形状为 (..., 3) 的uint8数组"""
+    _require_numpy()
+
+    h, s, v = np.broadcast_arrays(np.asarray(h, dtype=np.float64),
+                                  np.asarray(s, dtype=np.float64),
+                                  np.asarray(v, dtype=np.float64))
+    h = np.mod(h, 360)
+    s = np.clip(s, 0, 100) / 100.0
+    v = np.clip(v, 0, 100) / 100.0
+
+    c = v * s
+    x = c * (1 - np.abs(np.mod(h / 60, 2) - 1))
+    m = v - c
+    zero = np.zeros_like(c)
+
+    # 按60°扇区选择分量，与标量版本的分支顺序一致
+    sectors = [h < 60, h < 120, h < 180, h < 240, h < 300]
+    r = np.select(sectors, [c, x, zero, zero, x], default=c)
+    g = np.select(sectors, [x, c, c, x, zero], default=zero)
+    b = np.select(sectors, [zero, zero, x, c, c], default=x)
+
+    rgb = np.stack([r + m, g + m, b + m], axis=-1) * 255
+    return np.trunc(rgb).astype(np.uint8)
+
+
+def rgb_to_hsv_array(rgb):
+    """批量RGB转HSV，参数为形状 (..., 3) 的数组，返回形状相同的float64数组 (h, s, v)"""
+    _require_numpy()
+
+    rgb = np.asarray(rgb, dtype=np.float64) / 255.0
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    max_val = rgb.max(axis=-1)
+    min_val = rgb.min(axis=-1)
+    delta = max_val - min_val
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        h_r = 60 * np.mod((g - b) / delta, 6)
+        h_g = 60 * (((b - r) / delta) + 2)
+        h_b = 60 * (((r - g) / delta) + 4)
+        s = np.where(max_val == 0, 0.0, delta / max_val)
+
+    h = np.select([delta == 0, max_val == r, max_val == g], [0.0, h_r, h_g], default=h_b)
+    return np.stack([h, s * 100, max_val * 100], axis=-1)
+
+
+def lookup_table():
+    """整数HSV网格的RGB查找表（首次调用时生成，约11MB）"""
+    global _lut
+    if _lut is None:
+        _require_numpy()
+        with _lut_lock:
+            if _lut is None:
+                h, s, v = np.ogrid[0:LUT_SHAPE[0], 0:LUT_SHAPE[1], 0:LUT_SHAPE[2]]
+                table = hsv_to_rgb_array(h, s, v)
+                table.flags.writeable = False
+                _lut = table
+    return _lut
+
+
+def hsv_to_rgb_lut(h, s, v):
+    """基于查找表的批量HSV转RGB，h/s/v按整数处理，结果与 hsv_to_rgb 一致"""
+    table = lookup_table()
+    h = np.mod(np.asarray(h, dtype=np.int64), LUT_SHAPE[0])
+    s = np.clip(np.asarray(s, dtype=np.int64), 0, LUT_SHAPE[1] - 1)
+    v = np.clip(np.asarray(v, dtype=np.int64), 0, LUT_SHAPE[2] - 1)
+    return table[h, s, v]
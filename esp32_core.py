@@ -0,0 +1,917 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESP32S3 SuperMini API测试引擎
+
+不依赖GUI的设备管理和测试逻辑，供Tk界面（esp32_api_tester.py）
+和命令行（esp32_cli.py）共用。
+
+设备命令和测试序列是运行在引擎事件循环（esp32_async.EngineLoop）中的协程，
+界面直接提交 *_async 协程（可取消，不阻塞界面线程），
+命令行使用同名的同步方法（在事件循环中运行协程并等待结果）。
+
+功能特性：
+1. 设备扫描、连接和信息获取，已知设备注册表
+2. RGB/HSV/亮度/广播控制
+3. 颜色、彩虹、渐变、随机颜色和完整测试序列（可在多台设备上并发运行）
+4. 测试结果记录和报告生成
+
+作者: ESP32开发团队
+版本: 1.0.0
+日期: 2025-11-06
+"""
+
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime
+
+import esp32_trace
+from esp32_effects import (POLICY_DROP, EffectPlayer, hue_sweep, random_colors,
+                           saturation_ramp, value_ramp)
+from esp32_registry import MOVED, OFFLINE, DeviceRegistry
+from esp32_state import CommandBuilder, DeviceMirror
+from esp32_results import DEFAULT_CAPACITY, Outcome, ResultRecord, ResultStore
+
+__version__ = "1.0.0"
+
+# 颜色测试顺序：红橙黄绿青蓝紫彩虹
+COLOR_SEQUENCE = [1, 2, 3, 4, 5, 6, 7, 0]
+
+# 报告中的结果类型
+OUTCOME_TEXT = {Outcome.SUCCESS: "成功", Outcome.FAILURE: "失败", Outcome.INFO: "信息"}
+
+# 完整测试的HSV测试点
+FULL_TEST_HSV_POINTS = [
+    (0, 100, 100),   # 红色
+    (120, 100, 100), # 绿色
+    (240, 100, 100), # 蓝色
+]
+
+
+class TesterEngine:
+    """设备测试引擎（线程安全，不依赖GUI）"""
+
+    def __init__(self, results_path=None, results_capacity=DEFAULT_CAPACITY, registry_path=None):
+        # 设备连接状态
+        self.device_ip = ""
+        self.connected = False
+
+        # 每个设备的状态镜像（命令成功后乐观更新，定期用 /api/info 校准）
+        self.mirrors = {}
+        self.mirror = None
+
+        # 设备HTTP客户端（每个设备一个，复用keep-alive连接）
+        self.clients = {}
+        self.async_clients = {}
+        self.client = None          # 当前设备的 AsyncDeviceClient
+
+        # 设备I/O事件循环（首次使用时在后台线程中启动）
+        self._io_loop = None
+
+        # 流量录制器（录制期间所有客户端共用）
+        self.recorder = None
+
+        # 合并发送队列（拖动色环/滑块时只发送最新值）
+        self.senders = {}
+        self.max_send_rate = 20
+
+        # 正在播放的灯效、正在运行的批量测试和回放
+        self.effect_player = None
+        self.suite_runner = None
+        self.replayer = None
+
+        # 设备群批量控制和健康监控（首次使用时创建）
+        self._fleet = None
+        self._monitor = None
+        self._discover_cache = None
+
+        # 已知设备注册表（registry_path 为None时不保存到磁盘）
+        self.registry = DeviceRegistry(registry_path)
+        self.registry.load()
+
+        # 测试结果记录（内存中只保留最近的记录，完整历史写入 results_path）
+        self.test_results = ResultStore(results_capacity, results_path)
+        self.result_listeners = []
+        self._lock = threading.Lock()
+
+    # ========== 测试结果 ==========
+
+    def add_result(self, test_name, result, outcome=None, **fields):
+        """添加测试结果并通知监听者，fields 为 ResultRecord 的 device/endpoint/status/latency"""
+        record = self.test_results.append(ResultRecord(test_name, result, outcome, **fields))
+        # 监听者在调用线程中执行，不能直接操作GUI
+        for listener in list(self.result_listeners):
+            listener(record)
+        return record
+
+    def clear_results(self):
+        """清空测试记录"""
+        self.test_results.clear()
+
+    def result_counts(self):
+        """统计结果: (总数, 成功数, 失败数)，计数随结果增量更新"""
+        results = self.test_results
+        return results.total, results.success_count, results.failure_count
+
+    # ========== 设备连接 ==========
+
+    def get_client(self, ip):
+        """获取设备的HTTP客户端（按IP缓存）"""
+        from esp32_client import DeviceClient
+
+        with self._lock:
+            client = self.clients.get(ip)
+            if client is None:
+                client = DeviceClient(ip)
+                client.recorder = self.recorder
+                self.clients[ip] = client
+        return client
+
+    def get_async_client(self, ip):
+        """获取设备的异步HTTP客户端（按IP缓存，只能在引擎事件循环中使用）"""
+        from esp32_async import AsyncDeviceClient
+
+        with self._lock:
+            client = self.async_clients.get(ip)
+            if client is None:
+                client = AsyncDeviceClient(ip)
+                client.recorder = self.recorder
+                self.async_clients[ip] = client
+        return client
+
+    # ========== 事件循环 ==========
+
+    @property
+    def io_loop(self):
+        """设备I/O事件循环（EngineLoop）"""
+        with self._lock:
+            if self._io_loop is None:
+                from esp32_async import EngineLoop
+                self._io_loop = EngineLoop()
+                self._io_loop.start()
+        return self._io_loop
+
+    def _run(self, coro):
+        """在事件循环中运行协程并等待结果（同步方法使用）"""
+        return self.io_loop.run(coro)
+
+    def start_monitor(self):
+        """在引擎事件循环中启动健康监控（不另起线程）"""
+        self.monitor.start(self.io_loop.loop)
+
+    def shutdown(self):
+        """停止健康监控，取消并等待全部设备协程，停止事件循环"""
+        if self._monitor is not None:
+            self._monitor.stop()
+        # 线程池中的回放不会被取消，先让它自己停止
+        self.stop_replay()
+        if self._io_loop is not None:
+            self._io_loop.stop()
+            self._io_loop = None
+
+    # ========== 流量录制和回放 ==========
+
+    def start_recording(self, path):
+        """开始把发出的控制请求录制到文件，返回 TrafficRecorder"""
+        from esp32_replay import TrafficRecorder
+
+        self.stop_recording()
+        recorder = TrafficRecorder(path)
+        with self._lock:
+            self.recorder = recorder
+            for client in list(self.clients.values()) + list(self.async_clients.values()):
+                client.recorder = recorder
+        self.add_result(f"开始录制流量到 {path}", "信息")
+        return recorder
+
+    def stop_recording(self):
+        """停止录制，返回录制的记录数（未在录制时返回None）"""
+        with self._lock:
+            recorder, self.recorder = self.recorder, None
+            for client in list(self.clients.values()) + list(self.async_clients.values()):
+                client.recorder = None
+        if recorder is None:
+            return None
+        recorder.close()
+        self.add_result(f"停止录制: {recorder.count} 条记录, {recorder.bytes_written} 字节", "信息")
+        return recorder.count
+
+    @esp32_trace.traced(cat="task")
+    def replay(self, path, speed=1.0, target=None, udp_target=None):
+        """回放录制文件并与录制对比，返回 ReplayReport（状态码不一致记为失败）"""
+        from esp32_replay import Replayer, read_log
+
+        _, records = read_log(path)
+        self.add_result(f"回放 {path} ({len(records)} 条记录)", "开始")
+        self.replayer = Replayer(self.get_client, speed, target, udp_target)
+        try:
+            report = self.replayer.run(records)
+        finally:
+            self.replayer = None
+        self.add_result(report.summary(), "成功" if report.mismatch_count == 0 else
+                        f"失败: {report.mismatch_count} 个请求状态码与录制不一致")
+        for record, status in report.mismatches:
+            self.add_result(f"回放 {record.device} {record.payload}: 状态码 {status}，"
+                            f"录制时为 {record.status}", "不一致", Outcome.INFO, device=record.device)
+        return report
+
+    def stop_replay(self):
+        """停止正在进行的回放（可在任意线程调用）"""
+        replayer = self.replayer
+        if replayer is not None:
+            replayer.stop()
+
+    # ========== 性能追踪 ==========
+
+    def start_tracing(self, max_events=esp32_trace.DEFAULT_MAX_EVENTS):
+        """开启性能追踪（请求、界面回调和后台任务记录为时间线）"""
+        esp32_trace.start(max_events)
+        self.add_result("开启性能追踪", "信息")
+
+    def stop_tracing(self, path):
+        """停止追踪并导出 Chrome trace JSON（可用 Perfetto 打开），未开启时返回None"""
+        tracer = esp32_trace.stop()
+        if tracer is None:
+            return None
+        count = tracer.export(path)
+        dropped = f"（缓冲区已满，丢弃最早的 {tracer.dropped} 个）" if tracer.dropped else ""
+        self.add_result(f"性能追踪已导出: {path}, {count} 个事件{dropped}", "成功")
+        return count
+
+    def get_mirror(self, ip):
+        """获取设备的状态镜像（按IP缓存）"""
+        with self._lock:
+            mirror = self.mirrors.get(ip)
+            if mirror is None:
+                mirror = DeviceMirror()
+                self.mirrors[ip] = mirror
+        return mirror
+
+    @property
+    def device_info(self):
+        """当前设备信息（来自状态镜像）"""
+        return self.mirror.info() if self.mirror is not None else {}
+
+    def get_sender(self, ip, on_result=None):
+        """获取设备的合并发送队列（按IP缓存），不会改变设备状态的参数不发送"""
+        from esp32_client import CoalescingSender
+
+        sender = self.senders.get(ip)
+        if sender is None:
+            mirror = self.get_mirror(ip)
+
+            def sent(params, response, error):
+                if error is None and response.status_code == 200:
+                    mirror.apply_control(params)
+                if on_result:
+                    on_result(params, response, error)
+
+            sender = CoalescingSender(self.get_client(ip), max_rate=self.max_send_rate,
+                                      on_result=sent,
+                                      should_send=lambda params: not mirror.is_redundant(params))
+            self.senders[ip] = sender
+        return sender
+
+    def set_max_send_rate(self, max_rate):
+        """设置所有合并发送队列的最大发送频率"""
+        self.max_send_rate = max_rate
+        for sender in self.senders.values():
+            sender.set_max_rate(max_rate)
+
+    @property
+    def fleet(self):
+        """设备群批量控制器"""
+        if self._fleet is None:
+            from esp32_fleet import FleetController
+            self._fleet = FleetController(self.get_client, get_async_client=self.get_async_client)
+        return self._fleet
+
+    @property
+    def monitor(self):
+        """设备群后台健康监控"""
+        if self._monitor is None:
+            from esp32_monitor import HealthMonitor
+            self._monitor = HealthMonitor()
+        return self._monitor
+
+    def scan(self, on_device=None, on_network=None, networks=None, **scanner_options):
+        """扫描局域网设备，每发现一个设备调用 on_device(ScanResult)"""
+        return self._run(self.scan_async(on_device, on_network, networks, **scanner_options))
+
+    @esp32_trace.traced(cat="task")
+    async def scan_async(self, on_device=None, on_network=None, networks=None, **scanner_options):
+        """扫描局域网设备（在引擎事件循环中运行，取消即停止扫描），回调在事件循环中调用"""
+        from esp32_scanner import SubnetScanner, get_local_networks
+
+        self.add_result("开始扫描局域网设备", "信息")
+        try:
+            if networks is None:
+                networks = get_local_networks()
+            if not networks:
+                raise Exception("未找到可用的网络接口")
+
+            for local in networks:
+                self.add_result(f"扫描网段 {local.network} ({local.interface or local.address})", "信息")
+                if on_network:
+                    on_network(local)
+
+            def on_result(result):
+                if result.info is not None and "device_id" in result.info:
+                    address = result.ip if scanner.port == 80 else f"{result.ip}:{scanner.port}"
+                    self.registry.update_from_info(address, result.info)
+                if on_device:
+                    on_device(result)
+
+            start = time.perf_counter()
+            scanner = SubnetScanner(**scanner_options)
+            results = await scanner.scan_async(networks, on_result=on_result)
+            elapsed = time.perf_counter() - start
+            self.save_registry()
+
+            self.add_result(f"发现 {len(results)} 个设备 (探测 {scanner.hosts_probed} 个地址, "
+                            f"耗时 {elapsed:.1f}秒)", "成功")
+            return results
+        except Exception as e:
+            self.add_result(f"网络扫描失败: {str(e)}", "失败")
+            raise
+
+    @property
+    def discover_cache(self):
+        """/api/discover 应答缓存（保存在注册表文件旁边，注册表不保存时只在内存中）"""
+        if self._discover_cache is None:
+            from esp32_scanner import DISCOVER_CACHE_FILENAME, DiscoverCache
+
+            path = None
+            if self.registry.path is not None:
+                path = os.path.join(os.path.dirname(os.path.abspath(self.registry.path)),
+                                    DISCOVER_CACHE_FILENAME)
+            self._discover_cache = DiscoverCache(path)
+            self._discover_cache.load()
+        return self._discover_cache
+
+    def discover(self, on_device=None, networks=None, port=80, force=False, **options):
+        """主动发现设备，返回 [DiscoverResult, ...]（见 discover_async）"""
+        return self._run(self.discover_async(on_device, networks, port, force, **options))
+
+    @esp32_trace.traced(cat="task")
+    async def discover_async(self, on_device=None, networks=None, port=80, force=False, **options):
+        """主动发现：并发请求已知设备、邻居表和网段中地址的 /api/discover
+
+        未过期的缓存结果直接返回，不重新探测；每找到一个设备调用 on_device(DiscoverResult)。
+        networks 为None时使用本机所在网段，options 传给 ActiveDiscovery。
+        """
+        from esp32_registry import read_arp_table
+        from esp32_scanner import ActiveDiscovery, discover_candidates, get_local_networks
+
+        self.add_result("开始主动发现设备", "信息")
+        try:
+            if networks is None:
+                networks = get_local_networks()
+            arp_table = read_arp_table()
+            known = [entry.ip for entry in self.registry.entries()]
+            candidates = discover_candidates(networks, known, arp_table, port)
+            if not candidates:
+                raise Exception("没有可探测的地址（未找到网络接口和已知设备）")
+
+            def on_result(result):
+                if not result.cached:
+                    self.registry.update_from_info(result.ip, result.info)
+                if on_device:
+                    on_device(result)
+
+            start = time.perf_counter()
+            discovery = ActiveDiscovery(self.discover_cache, **options)
+            results = await discovery.discover_async(candidates, arp_table, on_result, force)
+            elapsed = time.perf_counter() - start
+            self.save_registry()
+            try:
+                self.discover_cache.save()
+            except OSError:
+                pass   # 缓存写入失败只影响下次发现的速度
+
+            self.add_result(f"发现 {len(results)} 个设备 (候选 {len(candidates)} 个地址, "
+                            f"探测 {discovery.probed}, 缓存命中 {discovery.cache_hits}, "
+                            f"耗时 {elapsed:.2f}秒)", "成功")
+            return results
+        except Exception as e:
+            self.add_result(f"主动发现失败: {str(e)}", "失败")
+            raise
+
+    def connect(self, ip):
+        """连接设备，成功后返回设备信息"""
+        return self._run(self.connect_async(ip))
+
+    @esp32_trace.traced(cat="task")
+    async def connect_async(self, ip):
+        """连接设备，成功后返回设备信息"""
+        client = self.get_async_client(ip)
+        try:
+            response = await client.info()
+            if response.status_code != 200:
+                raise Exception(f"HTTP {response.status_code}")
+            info = response.json()
+            self.mirror = self.get_mirror(ip)
+            self.mirror.reconcile(info)
+            self.registry.update_from_info(ip, info)
+            self.save_registry()
+            self.device_ip = ip
+            self.client = client
+            self.connected = True
+        except Exception as e:
+            self.add_result(f"连接设备 {ip}", f"失败: {str(e)}", Outcome.FAILURE, device=ip)
+            raise
+
+        timing = response.timing
+        self.add_result(f"连接设备 {ip}", "成功", Outcome.SUCCESS, device=ip,
+                        endpoint="/api/info", status=response.status_code,
+                        latency=timing.total if timing else None)
+        return self.device_info
+
+    def disconnect(self):
+        """断开设备连接"""
+        self.connected = False
+        self.device_ip = ""
+        self.mirror = None
+        self.client = None
+        self.add_result("断开设备连接", "成功")
+
+    def sync_state(self):
+        """读取 /api/info 校准当前设备的状态镜像，返回与镜像不一致的字段"""
+        return self._run(self.sync_state_async())
+
+    @esp32_trace.traced(cat="task")
+    async def sync_state_async(self):
+        """读取 /api/info 校准当前设备的状态镜像，返回与镜像不一致的字段"""
+        self.require_connection()
+        mirror = self.mirror
+        response = await self.client.info()
+        if response.status_code != 200:
+            raise Exception(f"HTTP {response.status_code}")
+        drift = mirror.reconcile(response.json())
+        if drift:
+            self.add_result(f"设备状态与镜像不一致: {', '.join(drift)}", "已校准", Outcome.INFO,
+                            device=self.device_ip)
+        return drift
+
+    def validate_registry(self, on_result=None):
+        """并发校验注册表中的已知设备，返回 [ValidationResult, ...]"""
+        return self._run(self.validate_registry_async(on_result))
+
+    @esp32_trace.traced(cat="task")
+    async def validate_registry_async(self, on_result=None):
+        """并发校验注册表中的已知设备，返回 [ValidationResult, ...]"""
+        if not len(self.registry):
+            return []
+        start = time.perf_counter()
+        results = await self.registry.validate_async(on_result=on_result)
+        elapsed = time.perf_counter() - start
+        self.save_registry()
+
+        moved = [r for r in results if r.status == MOVED]
+        offline = sum(1 for r in results if r.status == OFFLINE)
+        for r in moved:
+            self.add_result(f"已知设备 {r.entry.device_id} 地址变化 {r.old_ip} -> {r.ip}", "信息",
+                            device=r.ip)
+        self.add_result(f"校验 {len(results)} 个已知设备: 在线 {len(results) - offline} "
+                        f"(地址变化 {len(moved)}), 离线 {offline} (耗时 {elapsed:.2f}秒)", "完成",
+                        Outcome.INFO)
+        return results
+
+    def save_registry(self):
+        """保存注册表（写入失败只记录，不影响测试）"""
+        try:
+            self.registry.save()
+        except OSError as e:
+            self.add_result("保存已知设备注册表", f"失败: {str(e)}", Outcome.INFO)
+
+    def require_connection(self):
+        """未连接时抛出异常"""
+        if not self.connected:
+            raise Exception("请先连接设备")
+
+    # ========== 设备控制 ==========
+
+    async def _request_async(self, name, request, device=None):
+        """等待一次设备请求（协程）并记录结果（含接口、状态码和耗时），失败时抛出异常"""
+        device = device or self.device_ip
+        start = time.perf_counter()
+        try:
+            response = await request
+        except Exception as e:
+            self.add_result(name, f"失败: {str(e)}", Outcome.FAILURE, device=device,
+                            latency=time.perf_counter() - start)
+            raise
+
+        timing = getattr(response, "timing", None)
+        fields = {
+            "device": device,
+            "endpoint": timing.path if timing else "",
+            "status": response.status_code,
+            "latency": timing.total if timing else time.perf_counter() - start,
+        }
+        if response.status_code != 200:
+            self.add_result(name, f"失败: HTTP {response.status_code}", Outcome.FAILURE, **fields)
+            raise Exception(f"HTTP {response.status_code}")
+        self.add_result(name, "成功", Outcome.SUCCESS, **fields)
+        return response
+
+    async def _control_async(self, name, params, force=False):
+        """发送 /api/control 并更新状态镜像；不会改变设备状态时跳过并返回None"""
+        self.require_connection()
+        mirror = self.mirror
+        if not force and mirror.is_redundant(params):
+            self.add_result(name, "跳过（状态未变化）", Outcome.INFO, device=self.device_ip)
+            return None
+        response = await self._request_async(name, self.client.control(**params))
+        mirror.apply_control(params)
+        return response
+
+    async def _broadcast_async(self, name, action):
+        self.require_connection()
+        mirror = self.mirror
+        response = await self._request_async(name, self.client.broadcast(action))
+        mirror.apply_broadcast(action)
+        return response
+
+    def set_power(self, on, name=None):
+        """切换电源状态"""
+        return self._run(self.set_power_async(on, name))
+
+    async def set_power_async(self, on, name=None):
+        """切换电源状态"""
+        power_state = "on" if on else "off"
+        return await self._control_async(name or f"电源{power_state.upper()}", {"power": power_state})
+
+    def set_color(self, color):
+        """设置预设颜色"""
+        return self._run(self.set_color_async(color))
+
+    async def set_color_async(self, color):
+        """设置预设颜色"""
+        return await self._control_async(f"设置颜色 {color}", {"color": color})
+
+    def set_brightness(self, brightness):
+        """设置亮度"""
+        return self._run(self.set_brightness_async(brightness))
+
+    async def set_brightness_async(self, brightness):
+        """设置亮度"""
+        return await self._control_async(f"设置亮度 {brightness}%", {"brightness": brightness})
+
+    def set_hsv(self, hue, saturation, value, brightness=None):
+        """设置HSV参数"""
+        return self._run(self.set_hsv_async(hue, saturation, value, brightness))
+
+    async def set_hsv_async(self, hue, saturation, value, brightness=None):
+        """设置HSV参数"""
+        name = f"HSV设置 H{hue}° S{saturation}% V{value}%"
+        if brightness is not None:
+            name += f" B{brightness}%"
+        return await self._control_async(name, {"hue": hue, "saturation": saturation,
+                                                "value": value, "brightness": brightness})
+
+    def control(self, force=False, **params):
+        """发送任意 /api/control 参数组合"""
+        return self._run(self.control_async(force, **params))
+
+    async def control_async(self, force=False, **params):
+        """发送任意 /api/control 参数组合"""
+        name = "控制 " + " ".join(f"{k}={v}" for k, v in params.items())
+        return await self._control_async(name, params, force)
+
+    def control_commands(self, name, commands, force=False):
+        """把多条 /api/control 命令合并成尽量少的请求按顺序发送，返回 [响应或None, ...]"""
+        return self._run(self.control_commands_async(name, commands, force))
+
+    async def control_commands_async(self, name, commands, force=False):
+        """把多条 /api/control 命令合并成尽量少的请求按顺序发送，返回 [响应或None, ...]
+
+        合并规则见 CommandBuilder，发送后的设备状态与逐个发送相同。
+        """
+        requests = CommandBuilder(commands).build()
+        responses = []
+        for i, params in enumerate(requests, 1):
+            label = name if len(requests) == 1 else f"{name} ({i}/{len(requests)})"
+            responses.append(await self._control_async(label, params, force))
+        return responses
+
+    def control_broadcast(self, action):
+        """控制UDP广播（广播10分钟后由设备自动关闭，因此不跳过）"""
+        return self._run(self.control_broadcast_async(action))
+
+    async def control_broadcast_async(self, action):
+        """控制UDP广播（广播10分钟后由设备自动关闭，因此不跳过）"""
+        return await self._broadcast_async(f"UDP广播{action.upper()}", action)
+
+    # ========== 测试序列 ==========
+
+    def test_all_colors(self, on_step=None, delay=1.0):
+        """测试所有颜色，每个颜色后调用 on_step(color)"""
+        return self._run(self.test_all_colors_async(on_step, delay))
+
+    @esp32_trace.traced(cat="task")
+    async def test_all_colors_async(self, on_step=None, delay=1.0):
+        """测试所有颜色，每个颜色后调用 on_step(color)"""
+        self.require_connection()
+        try:
+            for color in COLOR_SEQUENCE:
+                try:
+                    await self._control_async(f"测试颜色 {color}", {"color": color}, force=True)
+                    if on_step:
+                        on_step(color)
+                except Exception:
+                    pass  # 失败已记录
+                await asyncio.sleep(delay)  # 每个颜色显示1秒
+        except asyncio.CancelledError:
+            self.add_result("颜色测试", "已取消", Outcome.INFO, device=self.device_ip)
+            raise
+
+    async def _send_control_async(self, params):
+        """发送一帧控制参数，非200时抛出异常"""
+        response = await self.client.control(**params)
+        if response.status_code != 200:
+            raise Exception(f"HTTP {response.status_code}")
+        self.mirror.apply_control(params)
+        return response
+
+    def play_effect(self, name, frames, fps, policy=POLICY_DROP, on_frame=None, frame_name=None):
+        """按截止时间播放帧序列并记录帧率统计，返回 EffectStats"""
+        return self._run(self.play_effect_async(name, frames, fps, policy, on_frame, frame_name))
+
+    @esp32_trace.traced(cat="task")
+    async def play_effect_async(self, name, frames, fps, policy=POLICY_DROP, on_frame=None,
+                                frame_name=None):
+        """按截止时间播放帧序列并记录帧率统计，返回 EffectStats
+
+        frame_name(params) 不为None时每一帧都记录为一条测试结果。
+        """
+        self.require_connection()
+        if frame_name is None:
+            send = self._send_control_async
+        else:
+            send = lambda p: self._control_async(frame_name(p), p, force=True)
+
+        player = EffectPlayer(send, fps, policy, on_frame)
+        self.effect_player = player
+        try:
+            stats = await player.play_async(frames)
+        except asyncio.CancelledError:
+            self.add_result(f"{name}", "已取消", Outcome.INFO, device=self.device_ip)
+            raise
+        finally:
+            self.effect_player = None
+        self.add_result(f"{name} {stats.summary()}", "完成" if stats.smooth else "不流畅",
+                        Outcome.INFO, device=self.device_ip)
+        return stats
+
+    def stop_effect(self):
+        """停止正在播放的效果"""
+        player = self.effect_player
+        if player is not None:
+            player.stop()
+
+    def rainbow_test(self, fps=10.0, policy=POLICY_DROP):
+        """彩虹渐变测试（每10度一帧）"""
+        return self._run(self.rainbow_test_async(fps, policy))
+
+    async def rainbow_test_async(self, fps=10.0, policy=POLICY_DROP):
+        """彩虹渐变测试（每10度一帧）"""
+        return await self.play_effect_async("彩虹测试", hue_sweep(0, 360, 10), fps, policy,
+                                            frame_name=lambda p: f"彩虹测试 色相{p['hue']}°")
+
+    def hsv_gradient_test(self, on_step=None, fps=20.0, policy=POLICY_DROP):
+        """HSV渐变测试（色相、饱和度、明度依次渐变），每帧调用 on_step(h, s, v)"""
+        return self._run(self.hsv_gradient_test_async(on_step, fps, policy))
+
+    async def hsv_gradient_test_async(self, on_step=None, fps=20.0, policy=POLICY_DROP):
+        """HSV渐变测试（色相、饱和度、明度依次渐变），每帧调用 on_step(h, s, v)"""
+        frames = hue_sweep(0, 360, 5) + saturation_ramp() + value_ramp()
+        return await self.play_effect_async("HSV渐变测试", frames, fps, policy,
+                                            self._step_callback(on_step))
+
+    def random_color_test(self, on_step=None, count=20, fps=2.0, policy=POLICY_DROP):
+        """随机颜色测试，每帧调用 on_step(h, s, v)"""
+        return self._run(self.random_color_test_async(on_step, count, fps, policy))
+
+    async def random_color_test_async(self, on_step=None, count=20, fps=2.0, policy=POLICY_DROP):
+        """随机颜色测试，每帧调用 on_step(h, s, v)"""
+        return await self.play_effect_async("随机颜色测试", random_colors(count), fps, policy,
+                                            self._step_callback(on_step))
+
+    @staticmethod
+    def _step_callback(on_step):
+        if on_step is None:
+            return None
+        return lambda index, p: on_step(p["hue"], p["saturation"], p["value"])
+
+    def run_full_test(self, delay=0.5, broadcast_wait=2.0):
+        """运行完整测试"""
+        return self._run(self.run_full_test_async(delay, broadcast_wait))
+
+    @esp32_trace.traced(cat="task")
+    async def run_full_test_async(self, delay=0.5, broadcast_wait=2.0):
+        """运行完整测试"""
+        self.require_connection()
+        try:
+            await self._full_test_steps(delay, broadcast_wait)
+        except asyncio.CancelledError:
+            self.add_result("完整测试", "已取消", Outcome.INFO, device=self.device_ip)
+            raise
+        self.add_result("完整测试", "完成")
+
+    async def _full_test_steps(self, delay, broadcast_wait):
+        # 1. 基础连接测试
+        self.add_result("基础连接测试", "开始")
+
+        # 2. RGB功能测试
+        self.add_result("RGB功能测试", "开始")
+
+        for color in COLOR_SEQUENCE:
+            try:
+                await self._control_async(f"颜色{color}测试", {"color": color}, force=True)
+            except Exception:
+                pass  # 失败已记录
+            await asyncio.sleep(delay)
+
+        # 3. HSV功能测试
+        self.add_result("HSV功能测试", "开始")
+
+        for hue, sat, val in FULL_TEST_HSV_POINTS:
+            try:
+                await self._control_async(f"HSV测试 H{hue}° S{sat}% V{val}%",
+                                          {"hue": hue, "saturation": sat, "value": val}, force=True)
+            except Exception:
+                pass  # 失败已记录
+            await asyncio.sleep(delay)
+
+        # 4. UDP广播测试
+        self.add_result("UDP广播测试", "开始")
+
+        try:
+            await self._broadcast_async("启用广播", "enable")
+            await asyncio.sleep(broadcast_wait)
+            await self._broadcast_async("禁用广播", "disable")
+        except Exception:
+            pass  # 失败已记录
+
+    def run_fleet_test(self, ips, delay=0.5, broadcast_wait=2.0, concurrency=None,
+                       device_timeout=None, on_device=None):
+        """在多台设备上并发运行完整测试，返回 [DeviceRun, ...]"""
+        return self._run(self.run_fleet_test_async(ips, delay, broadcast_wait, concurrency,
+                                                   device_timeout, on_device))
+
+    async def run_fleet_test_async(self, ips, delay=0.5, broadcast_wait=2.0, concurrency=None,
+                                   device_timeout=None, on_device=None):
+        """在多台设备上并发运行完整测试，返回 [DeviceRun, ...]"""
+        from esp32_suite import full_test_steps
+
+        return await self.run_suite_async("批量完整测试", ips, full_test_steps(delay, broadcast_wait),
+                                          concurrency, device_timeout, on_device)
+
+    def run_scenario(self, scenario, ips=None, concurrency=None, device_timeout=None,
+                     on_device=None):
+        """在一台或多台设备上运行编译好的场景（不指定设备时为当前连接的设备）"""
+        return self._run(self.run_scenario_async(scenario, ips, concurrency, device_timeout,
+                                                 on_device))
+
+    async def run_scenario_async(self, scenario, ips=None, concurrency=None, device_timeout=None,
+                                 on_device=None):
+        """在一台或多台设备上运行编译好的场景（不指定设备时为当前连接的设备）"""
+        if not ips:
+            self.require_connection()
+            ips = [self.device_ip]
+        return await self.run_suite_async(f"场景 {scenario.name}", ips, scenario.program,
+                                          concurrency, device_timeout, on_device)
+
+    def run_suite(self, title, ips, steps, concurrency=None, device_timeout=None, on_device=None):
+        """在多台设备上并发运行步骤序列（SuiteStep 列表），返回 [DeviceRun, ...]"""
+        return self._run(self.run_suite_async(title, ips, steps, concurrency, device_timeout,
+                                              on_device))
+
+    @esp32_trace.traced(cat="task")
+    async def run_suite_async(self, title, ips, steps, concurrency=None, device_timeout=None,
+                              on_device=None):
+        """在多台设备上并发运行步骤序列（SuiteStep 列表），返回 [DeviceRun, ...]
+
+        每个步骤按设备记录到测试结果（报告中按设备统计通过率和延迟），
+        每台设备完成时再记录一条汇总并调用 on_device(DeviceRun)（在事件循环中调用）。
+        stop_fleet_test() 或取消协程时在途请求立即中断。
+        """
+        from esp32_suite import (DEFAULT_CONCURRENCY, DEFAULT_DEVICE_TIMEOUT, SuiteRunner,
+                                 summarize_runs)
+
+        runner = SuiteRunner(self.get_async_client, concurrency or DEFAULT_CONCURRENCY,
+                             device_timeout or DEFAULT_DEVICE_TIMEOUT)
+        self.suite_runner = runner
+        self.add_result(f"{title} ({len(ips)}台, {len(steps)}个步骤)", "开始")
+
+        def on_step(ip, step, result):
+            fields = {"device": ip, "status": result.status, "latency": result.latency,
+                      "endpoint": {"info": "/api/info", "control": "/api/control",
+                                   "broadcast": "/api/broadcast"}[step.method]}
+            if result.ok:
+                self.add_result(f"[{ip}] {step.name}", "成功", Outcome.SUCCESS, **fields)
+                if step.method == "control":
+                    self.get_mirror(ip).apply_control(step.kwargs)
+                elif step.method == "broadcast":
+                    self.get_mirror(ip).apply_broadcast(*step.args)
+            else:
+                self.add_result(f"[{ip}] {step.name}", f"失败: {result.error}", Outcome.FAILURE,
+                                **fields)
+
+        def device_done(run):
+            summary = (f"[{run.ip}] {title} 通过 {run.passed}/{run.total_steps} "
+                       f"(耗时 {run.elapsed:.1f}秒)")
+            if run.aborted:
+                # 未执行的步骤也算失败
+                self.add_result(summary, f"失败: {run.aborted}", Outcome.FAILURE, device=run.ip)
+            else:
+                self.add_result(summary, "完成", Outcome.INFO, device=run.ip)
+            if on_device:
+                on_device(run)
+
+        start = time.perf_counter()
+        try:
+            runs = await runner.run(ips, steps, on_step, device_done)
+        except asyncio.CancelledError:
+            self.add_result(title, "已取消", Outcome.INFO)
+            raise
+        finally:
+            self.suite_runner = None
+        elapsed = time.perf_counter() - start
+
+        passed, failed, latency = summarize_runs(runs)
+        text = f"{title}: 通过 {passed}台, 失败 {failed}台, 总耗时 {elapsed:.1f}秒"
+        if latency.count:
+            lat = latency.summary_ms()
+            text += f", 请求延迟 p50={lat['p50']:.1f}ms p99={lat['p99']:.1f}ms"
+        self.add_result(text, "完成")
+        return runs
+
+    def stop_fleet_test(self):
+        """停止正在运行的批量测试或场景（可在任意线程调用，在途请求立即中断）"""
+        runner = self.suite_runner
+        if runner is not None:
+            runner.stop()
+
+    # ========== 测试报告 ==========
+
+    @esp32_trace.traced(cat="task")
+    def generate_report(self, filename=None):
+        """生成文本测试报告，返回文件名"""
+        results = self.test_results
+        if not results:
+            raise Exception("没有测试结果可生成报告")
+
+        if filename is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"esp32_test_report_{timestamp}.txt"
+
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write("ESP32S3 SuperMini API测试报告\n")
+            f.write("="*60 + "\n")
+            f.write(f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            f.write(f"设备IP: {self.device_ip if self.connected else '未连接'}\n")
+            f.write(f"测试工具版本: {__version__}\n")
+            f.write("="*60 + "\n\n")
+
+            # 统计信息（由结果存储增量维护）
+            total_tests, success_tests, failed_tests = self.result_counts()
+            judged = success_tests + failed_tests
+            success_rate = (success_tests / judged * 100) if judged > 0 else 0
+
+            f.write("测试统计:\n")
+            f.write(f"总测试数: {total_tests}\n")
+            f.write(f"成功测试: {success_tests}\n")
+            f.write(f"失败测试: {failed_tests}\n")
+            f.write(f"成功率: {success_rate:.1f}%\n")
+            if results.latency.count:
+                lat = results.latency.summary_ms()
+                f.write(f"请求延迟(ms): p50={lat['p50']:.1f} p90={lat['p90']:.1f} "
+                        f"p99={lat['p99']:.1f} max={lat['max']:.1f}\n")
+            f.write("\n")
+
+            # 详细结果
+            f.write("详细测试结果:\n")
+            f.write("-"*60 + "\n")
+
+            for record in results.history():
+                f.write(f"[{record.time_text}] {record.test_name} - {OUTCOME_TEXT[record.outcome]}\n")
+
+        return filename
+
+    @esp32_trace.traced(cat="task")
+    def export_reports(self, basename=None, formats=None):
+        """导出 JSON/CSV/JUnit XML 报告，返回文件名列表"""
+        from esp32_report import REPORT_FORMATS, build_metadata, write_reports
+
+        if not self.test_results:
+            raise Exception("没有测试结果可生成报告")
+        if basename is None:
+            basename = f"esp32_test_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        metadata = build_metadata(__version__, self.device_ip, self.device_info)
+        files, _ = write_reports(self.test_results, basename, metadata,
+                                 formats or REPORT_FORMATS)
+        return files
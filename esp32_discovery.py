@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESP32 UDP广播设备发现
+
+功能特性：
+1. 基于selectors的非阻塞UDP接收，在每个网卡上加入组播组 224.0.0.1:8888
+2. 使用预分配缓冲区接收数据报，每次唤醒读空套接字
+3. 按 device_id 和 IP 建立内存索引，记录最后出现时间
+4. 变更集中记录，由界面按固定帧率批量刷新
+5. 可选的流量录制器（esp32_replay.TrafficRecorder）记录收到的每个数据报
+
+作者: ESP32开发团队
+版本: 1.0.0
+日期: 2025-11-06
+"""
+
+import json
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+
+import esp32_trace
+
+MULTICAST_GROUP = "224.0.0.1"
+UDP_PORT = 8888
+BUFFER_SIZE = 2048
+RECV_BUFFER_BYTES = 4 * 1024 * 1024  # 突发广播时的内核接收缓冲区
+MAX_RECENT_MESSAGES = 200
+
+
+class DiscoveredDevice:
+    """通过UDP广播发现的设备"""
+
+    __slots__ = ("device_id", "ip", "device_name", "mac_address", "first_seen", "last_seen",
+                 "announcements")
+
+    def __init__(self, device_id, ip, device_name, mac_address, now):
+        self.device_id = device_id
+        self.ip = ip
+        self.device_name = device_name
+        self.mac_address = mac_address
+        self.first_seen = now
+        self.last_seen = now
+        self.announcements = 1
+
+    def age(self, now=None):
+        """距离最后一次广播的秒数"""
+        return (time.monotonic() if now is None else now) - self.last_seen
+
+
+class DeviceIndex:
+    """按 device_id 和 IP 索引的设备表（线程安全）"""
+
+    def __init__(self):
+        self._by_id = {}
+        self._by_ip = {}
+        self._changed = {}  # device_id -> 变更前的IP（新设备为None）
+        self._lock = threading.Lock()
+
+    def update(self, device_id, ip, device_name="", mac_address="", now=None):
+        """记录一次广播，返回设备；设备新增或IP/名称变化时记为变更"""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            device = self._by_id.get(device_id)
+            if device is None:
+                device = DiscoveredDevice(device_id, ip, device_name, mac_address, now)
+                self._by_id[device_id] = device
+                self._by_ip[ip] = device
+                self._changed.setdefault(device_id, None)
+                return device
+
+            device.last_seen = now
+            device.announcements += 1
+            if device.ip != ip or device.device_name != device_name:
+                self._changed.setdefault(device_id, device.ip)
+                if self._by_ip.get(device.ip) is device:
+                    del self._by_ip[device.ip]
+                device.ip = ip
+                device.device_name = device_name
+                device.mac_address = mac_address
+                self._by_ip[ip] = device
+            return device
+
+    def get(self, device_id):
+        with self._lock:
+            return self._by_id.get(device_id)
+
+    def by_ip(self, ip):
+        with self._lock:
+            return self._by_ip.get(ip)
+
+    def drain_changes(self):
+        """取出自上次调用以来的变更: [(设备, 变更前的IP或None), ...]"""
+        with self._lock:
+            changed, self._changed = self._changed, {}
+            return [(self._by_id[device_id], old_ip) for device_id, old_ip in changed.items()]
+
+    def stale(self, max_age, now=None):
+        """超过 max_age 秒未广播的设备"""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            return [d for d in self._by_id.values() if now - d.last_seen > max_age]
+
+    def clear(self):
+        with self._lock:
+            self._by_id.clear()
+            self._by_ip.clear()
+            self._changed.clear()
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._by_id.values()))
+
+
+def parse_announcement(data):
+    """解析广播数据报，返回设备信息字典；不是设备广播时返回None"""
+    try:
+        info = json.loads(data)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(info, dict) or "device_id" not in info:
+        return None
+    return info
+
+
+class AnnouncementListener:
+    """UDP广播接收线程，结果写入 DeviceIndex"""
+
+    def __init__(self, index=None, group=MULTICAST_GROUP, port=UDP_PORT, interfaces=None,
+                 keep_messages=MAX_RECENT_MESSAGES):
+        self.index = index if index is not None else DeviceIndex()
+        self.group = group
+        self.port = port
+        # 要加入组播组的本机网卡IP，None 表示所有本机网卡
+        self.interfaces = interfaces
+        self.joined = []
+
+        # 最近的原始消息 (来源IP, 文本)，供界面显示
+        self.messages = deque(maxlen=keep_messages)
+
+        # 统计
+        self.received = 0
+        self.malformed = 0
+        self.bytes_received = 0
+
+        # 流量录制器，为None时不录制
+        self.recorder = None
+
+        self._sock = None
+        self._wakeup_r = None
+        self._wakeup_w = None
+        self._thread = None
+        self._running = False
+
+    @property
+    def running(self):
+        return self._running
+
+    def cpu_time(self):
+        """接收线程已使用的CPU时间（秒），未运行或平台不支持按线程计时时返回None"""
+        thread = self._thread
+        if not self._running or not hasattr(time, "pthread_getcpuclockid"):
+            return None
+        try:
+            return time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+        except OSError:
+            return None
+
+    def _interface_addresses(self):
+        if self.interfaces is not None:
+            return list(self.interfaces)
+        from esp32_scanner import get_local_networks
+
+        return [n.address for n in get_local_networks()]
+
+    def _open_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            except OSError:
+                pass
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_BYTES)
+        except OSError:
+            pass
+        sock.bind(("", self.port))
+        sock.setblocking(False)
+
+        # 默认网卡加一次，再在每个本机网卡上各加一次
+        group = socket.inet_aton(self.group)
+        for address in ["0.0.0.0"] + self._interface_addresses():
+            try:
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                                group + socket.inet_aton(address))
+                self.joined.append(address)
+            except OSError:
+                continue  # 同一网卡重复加入或网卡不支持组播
+        if not self.joined:
+            sock.close()
+            raise OSError(f"无法在任何网卡上加入组播组 {self.group}")
+        return sock
+
+    def start(self):
+        """启动接收线程（套接字错误在调用线程中抛出）"""
+        if self._running:
+            return
+        self.joined = []
+        self._sock = self._open_socket()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="udp-discovery", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止接收线程"""
+        if not self._running:
+            return
+        self._running = False
+        try:
+            self._wakeup_w.send(b"\0")
+        except OSError:
+            pass
+        self._thread.join(timeout=2.0)
+        for sock in (self._sock, self._wakeup_r, self._wakeup_w):
+            sock.close()
+        self._sock = self._wakeup_r = self._wakeup_w = None
+
+    def _run(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self._sock, selectors.EVENT_READ)
+        selector.register(self._wakeup_r, selectors.EVENT_READ)
+        buffer = bytearray(BUFFER_SIZE)
+        view = memoryview(buffer)
+        try:
+            while self._running:
+                for key, _ in selector.select():
+                    if key.fileobj is self._sock:
+                        with esp32_trace.span("UDP接收", "udp"):
+                            self._drain(view)
+                        esp32_trace.counter("UDP广播", received=self.received,
+                                            malformed=self.malformed)
+        finally:
+            selector.close()
+
+    def _drain(self, view):
+        """读空套接字中所有待处理的数据报"""
+        sock = self._sock
+        index = self.index
+        messages = self.messages
+        while True:
+            try:
+                size, addr = sock.recvfrom_into(view)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            self.received += 1
+            self.bytes_received += size
+            data = bytes(view[:size])
+            messages.append((addr[0], data))
+            recorder = self.recorder
+            if recorder is not None:
+                recorder.record_announcement(addr[0], data)
+
+            info = parse_announcement(data)
+            if info is None:
+                self.malformed += 1
+                continue
+            index.update(str(info["device_id"]), addr[0], info.get("device_name", ""),
+                         info.get("mac_address", ""), time.monotonic())
+
+    def drain_messages(self):
+        """取出最近的原始消息: [(来源IP, 文本), ...]"""
+        result = []
+        while True:
+            try:
+                ip, data = self.messages.popleft()
+            except IndexError:
+                return result
+            result.append((ip, data.decode("utf-8", "replace")))
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESP32 灯效播放引擎
+
+功能特性：
+1. 预先生成帧序列：色相扫描、饱和度/明度渐变、随机游走、自定义关键帧
+2. 按单调时钟的截止时间调度每一帧，不受网络延迟累积影响
+3. 设备跟不上时丢弃过期帧，或把过期帧的参数合并成尽量少的请求（esp32_state.CommandBuilder）
+4. 统计实际帧率、迟到帧、丢弃帧和发送抖动，用于找出固件能流畅播放的最高帧率
+5. 同步播放（独立线程）或在asyncio事件循环中播放（play_async，取消协程即停止）
+
+每一帧是一个 /api/control 参数字典，例如 {"hue": 120, "saturation": 100, "value": 100}。
+
+作者: ESP32开发团队
+版本: 1.0.0
+日期: 2025-11-06
+"""
+
+import asyncio
+import math
+import random
+import threading
+import time
+
+import esp32_trace
+from esp32_bench import LatencyHistogram
+from esp32_state import CommandBuilder
+
+# 过期帧处理策略
+POLICY_DROP = "drop"    # 只发送最新到期的一帧，丢弃其余过期帧
+POLICY_MERGE = "merge"  # 用 CommandBuilder 把所有过期帧合并成尽量少的请求（与逐帧发送的最终状态相同）
+POLICY_NONE = "none"    # 不丢帧，逐帧发送（用于测量设备的极限速度）
+POLICIES = (POLICY_DROP, POLICY_MERGE, POLICY_NONE)
+
+# 发送时刻晚于截止时间超过 LATE_FRACTION 个帧间隔视为迟到
+LATE_FRACTION = 0.5
+# 流畅播放的判定：没有丢弃帧，迟到帧不超过5%
+SMOOTH_LATE_RATIO = 0.05
+
+
+# ========== 帧序列生成 ==========
+
+def hue_sweep(start=0, end=360, step=10, saturation=100, value=100):
+    """色相扫描（不包含 end）"""
+    if step == 0:
+        raise ValueError("step 不能为0")
+    return [{"hue": hue % 360, "saturation": saturation, "value": value}
+            for hue in range(start, end, step)]
+
+
+def saturation_ramp(start=100, end=0, step=-5, hue=180, value=100):
+    """饱和度渐变（不包含 end）"""
+    return [{"hue": hue, "saturation": sat, "value": value} for sat in range(start, end, step)]
+
+
+def value_ramp(start=100, end=0, step=-5, hue=180, saturation=100):
+    """明度渐变（不包含 end）"""
+    return [{"hue": hue, "saturation": saturation, "value": val} for val in range(start, end, step)]
+
+
+def random_colors(count, saturation=(50, 100), value=(50, 100), seed=None):
+    """独立的随机颜色"""
+    rng = random.Random(seed)
+    return [{"hue": rng.randint(0, 360), "saturation": rng.randint(*saturation),
+             "value": rng.randint(*value)} for _ in range(count)]
+
+
+def random_walk(count, hue=0, saturation=100, value=100, max_step=15, seed=None):
+    """HSV随机游走：每帧在上一帧基础上小幅变化，颜色连续"""
+    rng = random.Random(seed)
+    frames = []
+    for _ in range(count):
+        hue = (hue + rng.randint(-max_step, max_step)) % 360
+        saturation = max(50, min(100, saturation + rng.randint(-5, 5)))
+        value = max(30, min(100, value + rng.randint(-5, 5)))
+        frames.append({"hue": hue, "saturation": saturation, "value": value})
+    return frames
+
+
+def _lerp_hue(a, b, t):
+    """沿最短方向插值色相"""
+    delta = ((b - a + 180) % 360) - 180
+    return (a + delta * t) % 360
+
+
+def keyframes(points, fps):
+    """关键帧插值: points 为 [(时间秒, {参数}), ...]，按 fps 生成中间帧
+
+    hue 沿色环最短方向插值，其他数值参数线性插值，非数值参数取前一个关键帧的值。
+    """
+    points = sorted(points, key=lambda point: point[0])
+    if not points:
+        return []
+    start, end = points[0][0], points[-1][0]
+    count = int(round((end - start) * fps)) + 1
+    frames = []
+    segment = 0
+    for i in range(count):
+        t = start + i / fps
+        while segment < len(points) - 2 and t > points[segment + 1][0]:
+            segment += 1
+        (t0, a), (t1, b) = points[segment], points[min(segment + 1, len(points) - 1)]
+        ratio = 0.0 if t1 <= t0 else max(0.0, min(1.0, (t - t0) / (t1 - t0)))
+        frame = {}
+        for key, value in a.items():
+            target = b.get(key, value)
+            if key == "hue":
+                frame[key] = int(round(_lerp_hue(value, target, ratio))) % 360
+            elif isinstance(value, (int, float)) and isinstance(target, (int, float)):
+                frame[key] = int(round(value + (target - value) * ratio))
+            else:
+                frame[key] = value
+        frames.append(frame)
+    return frames
+
+
+# 预设效果: 名称 -> 帧序列生成函数
+EFFECTS = {
+    "rainbow": lambda: hue_sweep(0, 360, 10),
+    "gradient": lambda: hue_sweep(0, 360, 5) + saturation_ramp() + value_ramp(),
+    "random": lambda: random_colors(20),
+    "walk": lambda: random_walk(200),
+}
+
+
+# ========== 播放 ==========
+
+class EffectStats:
+    """一次播放的统计"""
+
+    def __init__(self, fps, frames):
+        self.fps = fps
+        self.frames = frames          # 帧序列总长度
+        self.sent = 0                 # 实际发送的请求数
+        self.dropped = 0              # 被丢弃的过期帧
+        self.merged = 0               # 合并进其他请求的过期帧
+        self.late = 0                 # 发送时已迟到的帧
+        self.errors = 0
+        self.elapsed = 0.0
+        self.lateness = LatencyHistogram()    # 发送时刻相对截止时间的延后
+        self.request_latency = LatencyHistogram()
+        # 相邻两次发送间隔的在线均值/方差（Welford）
+        self._interval_n = 0
+        self._interval_mean = 0.0
+        self._interval_m2 = 0.0
+
+    def add_interval(self, interval):
+        self._interval_n += 1
+        delta = interval - self._interval_mean
+        self._interval_mean += delta / self._interval_n
+        self._interval_m2 += delta * (interval - self._interval_mean)
+
+    @property
+    def achieved_fps(self):
+        """按平均发送间隔计算的实际帧率"""
+        return 1.0 / self._interval_mean if self._interval_mean > 0 else 0.0
+
+    @property
+    def jitter(self):
+        """发送间隔的标准差（秒）"""
+        if self._interval_n < 2:
+            return 0.0
+        return math.sqrt(self._interval_m2 / (self._interval_n - 1))
+
+    @property
+    def smooth(self):
+        """没有丢帧/合并帧且迟到帧不超过5%"""
+        if self.dropped or self.merged or self.errors:
+            return False
+        return self.late <= self.sent * SMOOTH_LATE_RATIO
+
+    def to_dict(self):
+        return {
+            "fps": self.fps,
+            "frames": self.frames,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "merged": self.merged,
+            "late": self.late,
+            "errors": self.errors,
+            "elapsed": self.elapsed,
+            "achieved_fps": self.achieved_fps,
+            "jitter_ms": self.jitter * 1000.0,
+            "lateness_ms": self.lateness.summary_ms(),
+            "request_latency_ms": self.request_latency.summary_ms(),
+            "smooth": self.smooth,
+        }
+
+    def summary(self):
+        """一行文本摘要"""
+        return (f"目标 {self.fps:g}FPS 实际 {self.achieved_fps:.1f}FPS | 发送 {self.sent}/{self.frames} "
+                f"| 迟到 {self.late} 丢弃 {self.dropped} 合并 {self.merged} 错误 {self.errors} "
+                f"| 抖动 {self.jitter * 1000:.1f}ms 请求p99 "
+                f"{self.request_latency.percentile(99) / 1000:.1f}ms")
+
+
+class EffectPlayer:
+    """按截止时间播放帧序列
+
+    send(params) 发送一帧（通常是 DeviceClient.control），出错时抛出异常；
+    play_async 中 send 为协程函数（通常是 AsyncDeviceClient.control）；
+    on_frame(index, params) 在每次发送后调用（用于界面显示）。
+    """
+
+    def __init__(self, send, fps=20.0, policy=POLICY_DROP, on_frame=None):
+        if fps <= 0:
+            raise ValueError("fps 必须大于0")
+        if policy not in POLICIES:
+            raise ValueError(f"未知策略: {policy}（可选: {', '.join(POLICIES)}）")
+        self.send = send
+        self.fps = fps
+        self.policy = policy
+        self.on_frame = on_frame
+        self._stop = threading.Event()
+
+    def stop(self):
+        """停止播放（在其他线程中调用）"""
+        self._stop.set()
+
+    def play(self, frames, loops=1):
+        """播放帧序列，返回 EffectStats"""
+        frames = list(frames) * loops
+        stats = EffectStats(self.fps, len(frames))
+        period = 1.0 / self.fps
+        self._stop.clear()
+
+        start = time.monotonic()
+        last_send = None
+        index = 0
+        while index < len(frames) and not self._stop.is_set():
+            deadline = start + index * period
+            now = time.monotonic()
+            if now < deadline:
+                # Event.wait 可被 stop() 提前唤醒
+                if self._stop.wait(deadline - now):
+                    break
+                now = time.monotonic()
+
+            index, requests = self._begin_frame(frames, index, start, now, last_send, stats)
+            last_send = now
+            try:
+                with esp32_trace.span("灯效帧", "effect", {"index": index}):
+                    for params in requests:
+                        self.send(params)
+            except Exception:
+                stats.errors += 1
+            self._end_frame(index, requests, now, stats)
+            index += 1
+
+        stats.elapsed = time.monotonic() - start
+        return stats
+
+    async def play_async(self, frames, loops=1):
+        """在事件循环中播放帧序列（send 为协程函数），返回 EffectStats
+
+        取消协程时立即停止；stop() 在下一帧到期时生效。
+        """
+        frames = list(frames) * loops
+        stats = EffectStats(self.fps, len(frames))
+        period = 1.0 / self.fps
+        self._stop.clear()
+
+        start = time.monotonic()
+        last_send = None
+        index = 0
+        while index < len(frames) and not self._stop.is_set():
+            deadline = start + index * period
+            now = time.monotonic()
+            if now < deadline:
+                await asyncio.sleep(deadline - now)
+                if self._stop.is_set():
+                    break
+                now = time.monotonic()
+
+            index, requests = self._begin_frame(frames, index, start, now, last_send, stats)
+            last_send = now
+            try:
+                with esp32_trace.span("灯效帧", "effect", {"index": index}):
+                    for params in requests:
+                        await self.send(params)
+            except Exception:
+                stats.errors += 1
+            self._end_frame(index, requests, now, stats)
+            index += 1
+
+        stats.elapsed = time.monotonic() - start
+        return stats
+
+    def _begin_frame(self, frames, index, start, now, last_send, stats):
+        """按过期帧策略选出要发送的帧并记录迟到统计，返回 (帧序号, [请求参数, ...])
+
+        合并策略下请求可能不止一个（例如 color 帧之后是 HSV 帧），需要按顺序全部发送。
+        """
+        period = 1.0 / self.fps
+        requests = [frames[index]]
+        if self.policy != POLICY_NONE:
+            # 已经到期的最新一帧
+            due = min(len(frames) - 1, int((now - start) / period))
+            if due > index:
+                if self.policy == POLICY_MERGE:
+                    requests = CommandBuilder(frames[index:due + 1]).build() or [frames[due]]
+                    stats.merged += due - index
+                else:
+                    requests = [frames[due]]
+                    stats.dropped += due - index
+                index = due
+
+        lateness = now - (start + index * period)
+        stats.lateness.record(max(0.0, lateness))
+        esp32_trace.counter("灯效", lateness_ms=max(0.0, lateness) * 1000.0,
+                            dropped=stats.dropped + stats.merged)
+        if lateness > period * LATE_FRACTION:
+            stats.late += 1
+        if last_send is not None:
+            stats.add_interval(now - last_send)
+        return index, requests
+
+    def _end_frame(self, index, requests, now, stats):
+        stats.request_latency.record(time.monotonic() - now)
+        stats.sent += 1
+        if self.on_frame:
+            self.on_frame(index, requests[-1])
+
+
+def find_max_smooth_fps(send, frames, fps_values, policy=POLICY_DROP, on_result=None):
+    """依次用各帧率播放同一序列，返回 (能流畅播放的最高帧率或None, [EffectStats, ...])"""
+    results = []
+    best = None
+    for fps in sorted(fps_values):
+        stats = EffectPlayer(send, fps, policy).play(frames)
+        results.append(stats)
+        if on_result:
+            on_result(stats)
+        if stats.smooth:
+            best = fps
+    return best, results
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESP32 设备群批量控制
+
+功能特性：
+1. 向多个设备并发发送电源、颜色、亮度、HSV命令
+2. 全局并发数有上限，每个设备同一时间只有一个在途请求
+   （固件 WebServer 一次只处理一个客户端）
+3. 汇总每个设备的结果和延迟
+4. *_async 协程版本在引擎事件循环中分发（AsyncDeviceClient），
+   上千台设备只占用事件循环一个线程
+
+作者: ESP32开发团队
+版本: 1.0.0
+日期: 2025-11-06
+"""
+
+import asyncio
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import esp32_trace
+
+DEFAULT_MAX_WORKERS = 64
+
+# 单个设备的执行结果: IP地址, 是否成功, HTTP状态码(失败为None), 延迟(秒), 错误信息
+FleetResult = namedtuple("FleetResult", ["ip", "ok", "status", "latency", "error"])
+
+
+class FleetController:
+    """设备群并发命令分发"""
+
+    def __init__(self, get_client, max_workers=DEFAULT_MAX_WORKERS, get_async_client=None):
+        # get_client(ip) 返回该设备的 DeviceClient，get_async_client(ip) 返回 AsyncDeviceClient
+        self.get_client = get_client
+        self.get_async_client = get_async_client
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="fleet")
+        self._device_locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _device_lock(self, ip):
+        """获取设备锁，保证同一设备只有一个在途请求"""
+        with self._locks_lock:
+            lock = self._device_locks.get(ip)
+            if lock is None:
+                lock = threading.Lock()
+                self._device_locks[ip] = lock
+            return lock
+
+    def _call(self, ip, method, args, kwargs):
+        """在单个设备上执行一次调用"""
+        with self._device_lock(ip), esp32_trace.span(f"批量 {method}", "worker", {"ip": ip}):
+            start = time.perf_counter()
+            try:
+                response = getattr(self.get_client(ip), method)(*args, **kwargs)
+            except Exception as e:
+                return FleetResult(ip, False, None, time.perf_counter() - start, str(e))
+            latency = time.perf_counter() - start
+            ok = response.status_code == 200
+            error = "" if ok else f"HTTP {response.status_code}"
+            return FleetResult(ip, ok, response.status_code, latency, error)
+
+    def run(self, ips, method, *args, **kwargs):
+        """对所有设备并发调用 DeviceClient.<method>，按输入顺序返回结果"""
+        futures = [self._executor.submit(self._call, ip, method, args, kwargs)
+                   for ip in dict.fromkeys(ips)]
+        return [future.result() for future in futures]
+
+    async def _call_async(self, semaphore, ip, method, args, kwargs):
+        """在单个设备上执行一次异步调用（AsyncDeviceClient 保证每个设备只有一个在途请求）"""
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await getattr(self.get_async_client(ip), method)(*args, **kwargs)
+            except Exception as e:
+                return FleetResult(ip, False, None, time.perf_counter() - start, str(e))
+            latency = time.perf_counter() - start
+            ok = response.status_code == 200
+            error = "" if ok else f"HTTP {response.status_code}"
+            return FleetResult(ip, ok, response.status_code, latency, error)
+
+    async def run_async(self, ips, method, *args, **kwargs):
+        """run 的协程版本：对所有设备并发调用 AsyncDeviceClient.<method>，按输入顺序返回结果"""
+        if self.get_async_client is None:
+            raise RuntimeError("未提供异步客户端")
+        semaphore = asyncio.Semaphore(self.max_workers)
+        return list(await asyncio.gather(*(self._call_async(semaphore, ip, method, args, kwargs)
+                                           for ip in dict.fromkeys(ips))))
+
+    def control(self, ips, **params):
+        """批量发送 /api/control"""
+        return self.run(ips, "control", **params)
+
+    async def control_async(self, ips, **params):
+        """批量发送 /api/control（协程）"""
+        return await self.run_async(ips, "control", **params)
+
+    def broadcast(self, ips, action):
+        """批量控制UDP广播"""
+        return self.run(ips, "broadcast", action)
+
+    def info(self, ips):
+        """批量获取设备信息"""
+        return self.run(ips, "info")
+
+    def shutdown(self):
+        """关闭线程池"""
+        self._executor.shutdown(wait=False)
+
+
+def summarize(results):
+    """汇总结果: (成功数, 失败数, 最大延迟秒)"""
+    success = sum(1 for r in results if r.ok)
+    max_latency = max((r.latency for r in results), default=0.0)
+    return success, len(results) - success, max_latency
+
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESP32 设备群健康监控
+
+功能特性：
+1. 用一个asyncio事件循环轮询所有已知设备的 /api/info
+   （自己的后台线程，或共用引擎的事件循环）
+2. 自适应轮询间隔：状态稳定的设备逐步放慢，状态反复变化的设备立即加快
+3. UDP广播视为免费的在线信号，收到广播的设备推迟下一次轮询
+4. 每台设备用固定大小的环形缓冲区保存RTT和可用性时间序列
+5. 健康状态变化集中记录，由界面批量刷新
+
+调度使用按到期时间排序的堆，空闲时事件循环一直睡到下一台设备到期，
+几百台设备的监控开销主要是每次轮询的一个TCP连接。
+
+作者: ESP32开发团队
+版本: 1.0.0
+日期: 2025-11-06
+"""
+
+import asyncio
+import heapq
+import math
+import random
+import threading
+import time
+from array import array
+
+from esp32_registry import split_address
+
+# 轮询间隔（秒）
+MIN_INTERVAL = 2.0
+DEFAULT_INTERVAL = 5.0
+MAX_INTERVAL = 60.0
+BACKOFF_FACTOR = 1.5      # 状态稳定时每次轮询后间隔乘以该系数
+
+POLL_CONNECT_TIMEOUT = 1.0
+POLL_INFO_TIMEOUT = 2.0
+POLL_CONCURRENCY = 32
+
+SERIES_SIZE = 120          # 每台设备保留的样本数
+DOWN_AFTER = 2             # 连续失败次数达到该值视为离线
+FLAP_WINDOW = 20           # 统计可用性变化次数的最近样本数
+FLAP_TRANSITIONS = 2       # 最近样本中可用性变化达到该次数视为不稳定
+SLOW_RTT = 0.5             # 最近样本RTT中位数超过该值（秒）视为缓慢
+SLOW_WINDOW = 10
+
+# 健康状态
+UNKNOWN = "unknown"
+HEALTHY = "healthy"
+SLOW = "slow"
+FLAPPING = "flapping"
+DOWN = "down"
+
+
+class RttSeries:
+    """RTT环形缓冲区（float32，失败的样本记为NaN）"""
+
+    __slots__ = ("size", "count", "_values", "_next")
+
+    def __init__(self, size=SERIES_SIZE):
+        self.size = size
+        self.count = 0
+        self._values = array("f", bytes(4 * size))
+        self._next = 0
+
+    def add(self, rtt):
+        """记录一次样本，rtt 为None表示不可达"""
+        self._values[self._next] = math.nan if rtt is None else rtt
+        self._next = (self._next + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+
+    def recent(self, n=None):
+        """最近n个样本（从旧到新），NaN表示不可达"""
+        n = self.count if n is None else min(n, self.count)
+        start = (self._next - n) % self.size
+        if start + n <= self.size:
+            return self._values[start:start + n].tolist()
+        return (self._values[start:] + self._values[:self._next]).tolist()
+
+    def availability(self, n=None):
+        """最近n个样本中可达的比例"""
+        samples = self.recent(n)
+        if not samples:
+            return 0.0
+        return sum(1 for v in samples if v == v) / len(samples)
+
+    def transitions(self, n=FLAP_WINDOW):
+        """最近n个样本中可达/不可达的切换次数"""
+        samples = self.recent(n)
+        return sum(1 for a, b in zip(samples, samples[1:]) if (a == a) != (b == b))
+
+    def median_rtt(self, n=SLOW_WINDOW):
+        """最近n个样本中可达样本RTT的中位数（秒），没有时为None"""
+        samples = sorted(v for v in self.recent(n) if v == v)
+        if not samples:
+            return None
+        return samples[len(samples) // 2]
+
+
+class DeviceHealth:
+    """一台设备的监控状态"""
+
+    __slots__ = ("address", "device_id", "interval", "next_due", "series", "failures",
+                 "last_ok", "last_signal", "announcements", "polls", "state")
+
+    def __init__(self, address, device_id="", interval=DEFAULT_INTERVAL):
+        self.address = address
+        self.device_id = device_id
+        self.interval = interval
+        self.next_due = 0.0
+        self.series = RttSeries()
+        self.failures = 0           # 连续失败次数
+        self.last_ok = None         # 最后一次轮询成功的时间（单调时钟）
+        self.last_signal = None     # 最后一次收到UDP广播的时间
+        self.announcements = 0
+        self.polls = 0
+        self.state = UNKNOWN
+
+    @property
+    def online(self):
+        return self.state not in (UNKNOWN, DOWN)
+
+    def classify(self):
+        """根据时间序列判断健康状态"""
+        if self.series.count == 0:
+            return UNKNOWN if self.last_signal is None else HEALTHY
+        if self.failures >= DOWN_AFTER:
+            return DOWN
+        if self.series.transitions() >= FLAP_TRANSITIONS:
+            return FLAPPING
+        median = self.series.median_rtt()
+        if median is not None and median > SLOW_RTT:
+            return SLOW
+        return HEALTHY
+
+
+class HealthMonitor:
+    """后台健康监控（线程安全）
+
+    probe(address) 为协程函数，返回RTT（秒），不可达时返回None；
+    默认使用 SubnetScanner 的 TCP 连接 + GET /api/info。
+    """
+
+    def __init__(self, probe=None, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL,
+                 concurrency=POLL_CONCURRENCY):
+        self.probe = probe or self._probe_info
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.concurrency = concurrency
+
+        self._devices = {}
+        self._heap = []            # (到期时间, 地址)
+        self._changed = set()
+        self._lock = threading.Lock()
+        self._scanners = {}
+
+        self._loop = None
+        self._wakeup = None
+        self._thread = None
+        self._future = None
+        self._running = False
+
+    @property
+    def running(self):
+        return self._running
+
+    # ========== 设备管理（任意线程调用） ==========
+
+    def add(self, address, device_id=""):
+        """开始监控设备（已在监控中时只更新 device_id）"""
+        with self._lock:
+            health = self._devices.get(address)
+            if health is not None:
+                if device_id:
+                    health.device_id = device_id
+                return health
+            health = self._devices[address] = DeviceHealth(address, device_id)
+            # 首次轮询在一个间隔内随机分散，避免同时启动的设备一起轮询
+            health.next_due = time.monotonic() + random.uniform(0, min(1.0, health.interval))
+            heapq.heappush(self._heap, (health.next_due, address))
+        self._wake()
+        return health
+
+    def remove(self, address):
+        with self._lock:
+            self._devices.pop(address, None)
+            self._changed.discard(address)
+
+    def note_announcement(self, ip):
+        """收到设备的UDP广播：视为在线，推迟下一次轮询"""
+        now = time.monotonic()
+        with self._lock:
+            health = self._devices.get(ip)
+            if health is None:
+                return
+            health.last_signal = now
+            health.announcements += 1
+            if health.next_due == math.inf:
+                return  # 正在轮询
+            woke = health.state == DOWN
+            if woke:
+                # 离线设备重新出现：尽快轮询确认
+                health.interval = self.min_interval
+                health.next_due = now
+            else:
+                health.next_due = max(health.next_due, now + health.interval)
+                if health.state == UNKNOWN:
+                    health.state = HEALTHY
+                    self._changed.add(ip)
+            heapq.heappush(self._heap, (health.next_due, ip))
+        if woke:
+            self._wake()
+
+    def get(self, address):
+        with self._lock:
+            return self._devices.get(address)
+
+    def devices(self):
+        with self._lock:
+            return list(self._devices.values())
+
+    def drain_changes(self):
+        """取出上次调用以来健康状态变化的设备: [DeviceHealth, ...]"""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+            return [self._devices[a] for a in changed if a in self._devices]
+
+    def __len__(self):
+        return len(self._devices)
+
+    # ========== 后台线程 ==========
+
+    def start(self, loop=None):
+        """开始监控；loop 为其他线程中运行的事件循环时在其中调度，否则启动自己的线程"""
+        if self._running:
+            return
+        self._running = True
+        ready = threading.Event()
+        if loop is not None:
+            self._loop = loop
+            self._future = asyncio.run_coroutine_threadsafe(self._schedule(ready), loop)
+        else:
+            self._thread = threading.Thread(target=self._run, args=(ready,),
+                                            name="health-monitor", daemon=True)
+            self._thread.start()
+        ready.wait()
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        self._wake()
+        timeout = POLL_CONNECT_TIMEOUT + POLL_INFO_TIMEOUT + 1.0
+        if self._future is not None:
+            try:
+                self._future.result(timeout)
+            except Exception:
+                pass  # 事件循环已停止
+            self._future = None
+            self._loop = None
+        else:
+            self._thread.join(timeout=timeout)
+
+    def _wake(self):
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                pass  # 事件循环已关闭
+
+    def _run(self, ready):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._schedule(ready))
+        finally:
+            self._loop.close()
+            self._loop = None
+
+    async def _schedule(self, ready):
+        """按到期时间依次启动轮询，空闲时睡到下一台设备到期"""
+        self._wakeup = asyncio.Event()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        ready.set()
+
+        while self._running:
+            now = time.monotonic()
+            due = []
+            timeout = None
+            with self._lock:
+                while self._heap:
+                    when, address = self._heap[0]
+                    health = self._devices.get(address)
+                    if health is None or when != health.next_due:
+                        heapq.heappop(self._heap)  # 已移除或已重新安排
+                        continue
+                    if when > now:
+                        timeout = when - now
+                        break
+                    heapq.heappop(self._heap)
+                    health.next_due = math.inf  # 轮询期间不重复安排
+                    due.append(health)
+
+            for health in due:
+                task = asyncio.ensure_future(self._poll(health, semaphore))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        for task in list(tasks):
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _poll(self, health, semaphore):
+        async with semaphore:
+            try:
+                rtt = await self.probe(health.address)
+            except Exception:
+                rtt = None
+        self._record(health, rtt)
+        self._wakeup.set()  # 下一次轮询可能早于调度循环当前的等待时间
+
+    def _record(self, health, rtt, now=None):
+        """记录一次轮询结果，调整轮询间隔并安排下一次轮询"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            previous = health.state
+            health.polls += 1
+            health.series.add(rtt)
+            if rtt is None:
+                health.failures += 1
+            else:
+                health.failures = 0
+                health.last_ok = now
+            health.state = health.classify()
+
+            if health.state != previous:
+                self._changed.add(health.address)
+            if health.state != previous or health.state in (FLAPPING, SLOW) \
+                    or (rtt is None and health.state != DOWN):
+                # 状态变化、不稳定或刚开始失败：加快轮询
+                health.interval = self.min_interval
+            else:
+                health.interval = min(self.max_interval, health.interval * BACKOFF_FACTOR)
+
+            if health.address in self._devices:
+                health.next_due = now + health.interval
+                heapq.heappush(self._heap, (health.next_due, health.address))
+
+    async def _probe_info(self, address):
+        """TCP连接并读取 /api/info，返回总耗时"""
+        from esp32_scanner import SubnetScanner
+
+        host, port = split_address(address)
+        scanner = self._scanners.get(port)
+        if scanner is None:
+            scanner = self._scanners[port] = SubnetScanner(
+                port=port, connect_timeout=POLL_CONNECT_TIMEOUT, info_timeout=POLL_INFO_TIMEOUT)
+        start = time.perf_counter()
+        result = await scanner.probe(host)
+        if result is None or result.info is None:
+            return None
+        return time.perf_counter() - start
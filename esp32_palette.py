@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESP32 调光板图像生成
+
+功能特性：
+1. 逐像素生成HSV色环（角度为色相，半径为饱和度）
+2. 生成快速取色色板（水平为色相，垂直为明度）
+3. 生成结果按尺寸和主题缓存到磁盘（PPM格式，Tk原生支持）
+
+作者: ESP32开发团队
+版本: 1.0.0
+日期: 2025-11-06
+"""
+
+import atexit
+import math
+import os
+import sys
+import tempfile
+
+from esp32_color import hsv_to_rgb, hsv_to_rgb_array, np
+
+# 修改渲染算法时递增，使旧缓存失效
+PALETTE_VERSION = 1
+
+
+def get_cache_dir():
+    """获取图像缓存目录"""
+    if sys.platform.startswith("win"):
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "esp32_api_tester")
+
+
+def hex_to_rgb(color):
+    """'#rrggbb' 转 (r, g, b)"""
+    color = color.lstrip("#")
+    return tuple(int(color[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def encode_ppm(pixels, width, height):
+    """将RGB像素编码为二进制PPM"""
+    header = f"P6 {width} {height} 255\n".encode("ascii")
+    if np is not None and isinstance(pixels, np.ndarray):
+        return header + np.ascontiguousarray(pixels, dtype=np.uint8).tobytes()
+    return header + bytes(pixels)
+
+
+def render_hsv_wheel(size, radius, inner_radius, background):
+    """生成HSV色环，圆环内外使用背景色，返回PPM数据"""
+    center = size / 2
+    bg = hex_to_rgb(background)
+
+    if np is not None:
+        y, x = np.mgrid[0:size, 0:size].astype(np.float64)
+        dx = x - center
+        dy = y - center
+        distance = np.hypot(dx, dy)
+
+        # 与 update_hsv_from_circle 的换算一致：0°在右侧，逆时针增加
+        hue = np.degrees(np.arctan2(-dy, dx))
+        hue = np.where(hue < 0, hue + 360, hue)
+        saturation = (distance - inner_radius) / (radius - inner_radius) * 100
+
+        pixels = hsv_to_rgb_array(hue, saturation, 100)
+        ring = (distance >= inner_radius) & (distance <= radius)
+        pixels[~ring] = bg
+        return encode_ppm(pixels, size, size)
+
+    # 无NumPy时逐像素计算（仅首次生成时较慢，之后读取缓存）
+    pixels = bytearray()
+    for py in range(size):
+        dy = py - center
+        for px in range(size):
+            dx = px - center
+            distance = math.sqrt(dx * dx + dy * dy)
+            if inner_radius <= distance <= radius:
+                hue = math.degrees(math.atan2(-dy, dx))
+                if hue < 0:
+                    hue += 360
+                saturation = (distance - inner_radius) / (radius - inner_radius) * 100
+                pixels.extend(hsv_to_rgb(hue, saturation, 100))
+            else:
+                pixels.extend(bg)
+    return encode_ppm(pixels, size, size)
+
+
+def render_color_picker(width, height):
+    """生成取色色板（水平色相0-360°，垂直明度100%到50%），返回PPM数据"""
+    if np is not None:
+        y, x = np.mgrid[0:height, 0:width].astype(np.float64)
+        hue = (x / width) * 360
+        value = 100 - (y / height) * 50
+        return encode_ppm(hsv_to_rgb_array(hue, 100, value), width, height)
+
+    pixels = bytearray()
+    for y in range(height):
+        value = 100 - (y / height) * 50
+        for x in range(width):
+            pixels.extend(hsv_to_rgb((x / width) * 360, 100, value))
+    return encode_ppm(pixels, width, height)
+
+
+# 缓存目录不可写时写到临时目录的图像: 文件名 -> 路径（本进程内复用，退出时删除）
+_fallback_paths = {}
+
+
+def _remove_fallback_files():
+    for path in _fallback_paths.values():
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    _fallback_paths.clear()
+
+
+atexit.register(_remove_fallback_files)
+
+
+def cached_image_path(name, width, height, theme, render):
+    """返回缓存图像路径，缓存不存在时调用 render() 生成并写入"""
+    cache_dir = get_cache_dir()
+    filename = f"{name}_{width}x{height}_{theme}_v{PALETTE_VERSION}.ppm"
+    path = os.path.join(cache_dir, filename)
+    if os.path.exists(path):
+        return path
+    fallback = _fallback_paths.get(filename)
+    if fallback is not None and os.path.exists(fallback):
+        return fallback
+
+    data = render()
+    tmp_path = None
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # 先写临时文件再替换，避免并发启动时读到半个文件
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return path
+    except OSError:
+        if tmp_path is not None:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    # 缓存目录不可写时写到临时目录使用（同一图像只写一次，进程退出时删除）
+    fd, path = tempfile.mkstemp(prefix="esp32_", suffix=".ppm")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    _fallback_paths[filename] = path
+    return path
+
+
+def load_hsv_wheel(master, size, radius, inner_radius, background, theme):
+    """加载HSV色环 PhotoImage"""
+    import tkinter as tk
+
+    key = f"{theme}_{background.lstrip('#')}_{radius}_{inner_radius}"
+    path = cached_image_path("hsv_wheel", size, size, key,
+                             lambda: render_hsv_wheel(size, radius, inner_radius, background))
+    return tk.PhotoImage(master=master, file=path)
+
+
+def load_color_picker(master, width, height, theme):
+    """加载取色色板 PhotoImage"""
+    import tkinter as tk
+
+    path = cached_image_path("color_picker", width, height, theme,
+                             lambda: render_color_picker(width, height))
+    return tk.PhotoImage(master=master, file=path)
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESP32 已知设备注册表
+
+功能特性：
+1. 按 device_id（没有时按MAC）持久保存设备的最后IP、名称、最后在线时间和固件信息
+2. 启动时并发TCP探测全部已知设备，通过 /api/info 确认是同一台设备
+3. 对照内核邻居表（/proc/net/arp），不用全网段扫描就能发现IP变化的设备
+4. 原子写入（临时文件 + 替换），文件损坏时从空表开始
+
+作者: ESP32开发团队
+版本: 1.0.0
+日期: 2025-11-06
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+
+from esp32_state import INFO_FIELDS
+
+REGISTRY_VERSION = 1
+REGISTRY_FILENAME = "devices.json"
+ARP_TABLE_PATH = "/proc/net/arp"
+ARP_COMPLETE = 0x2  # ATF_COM：邻居表项已解析出MAC
+
+# 启动校验的超时，保证已知设备在1秒内可用
+VALIDATE_CONNECT_TIMEOUT = 0.3
+VALIDATE_INFO_TIMEOUT = 0.6
+VALIDATE_CONCURRENCY = 64
+
+# 校验结果
+ONLINE = "online"     # 在最后的IP上找到
+MOVED = "moved"       # 在邻居表中的新IP上找到
+OFFLINE = "offline"   # 未找到
+
+# 随命令变化的灯光状态字段不保存到注册表
+_STATE_FIELDS = {field for _, field in INFO_FIELDS}
+
+
+def default_registry_path():
+    """注册表文件路径（在缓存目录中）"""
+    from esp32_palette import get_cache_dir
+
+    return os.path.join(get_cache_dir(), REGISTRY_FILENAME)
+
+
+def normalize_mac(mac):
+    return (mac or "").strip().lower()
+
+
+def split_address(address, default_port=80):
+    """'ip' 或 'ip:端口' -> (ip, 端口)"""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return host, int(port)
+    return address, default_port
+
+
+def read_arp_table(path=ARP_TABLE_PATH):
+    """读取内核邻居表，返回 {MAC: IP}（只包含已解析的表项；非Linux系统返回空表）"""
+    table = {}
+    try:
+        with open(path, encoding="ascii", errors="replace") as f:
+            next(f, None)  # 表头
+            for line in f:
+                parts = line.split()
+                if len(parts) < 4:
+                    continue
+                try:
+                    flags = int(parts[2], 16)
+                except ValueError:
+                    continue
+                mac = normalize_mac(parts[3])
+                if flags & ARP_COMPLETE and mac != "00:00:00:00:00:00":
+                    table[mac] = parts[0]
+    except OSError:
+        pass
+    return table
+
+
+class RegistryEntry:
+    """注册表中的一台设备"""
+
+    __slots__ = ("device_id", "mac_address", "ip", "device_name", "last_seen", "info")
+
+    def __init__(self, device_id, ip, device_name="", mac_address="", last_seen=None, info=None):
+        self.device_id = device_id
+        self.ip = ip                        # 最后使用的地址（可带端口）
+        self.device_name = device_name
+        self.mac_address = normalize_mac(mac_address)
+        self.last_seen = time.time() if last_seen is None else last_seen
+        self.info = info or {}              # /api/info 中不随命令变化的字段
+
+    def to_dict(self):
+        return {
+            "device_id": self.device_id,
+            "mac_address": self.mac_address,
+            "ip": self.ip,
+            "device_name": self.device_name,
+            "last_seen": self.last_seen,
+            "info": self.info,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["device_id"], data["ip"], data.get("device_name", ""),
+                   data.get("mac_address", ""), data.get("last_seen"), data.get("info"))
+
+
+class ValidationResult:
+    """一台已知设备的启动校验结果"""
+
+    __slots__ = ("entry", "status", "ip", "old_ip", "info", "connect_time")
+
+    def __init__(self, entry, status, ip, old_ip, info=None, connect_time=None):
+        self.entry = entry
+        self.status = status
+        self.ip = ip              # 当前地址（离线时为最后的地址）
+        self.old_ip = old_ip      # 校验前的地址
+        self.info = info
+        self.connect_time = connect_time
+
+    @property
+    def online(self):
+        return self.status != OFFLINE
+
+
+class DeviceRegistry:
+    """已知设备注册表（线程安全）
+
+    path 为None时只保存在内存中。
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._by_id = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    # ========== 持久化 ==========
+
+    def load(self):
+        """读取注册表文件（不存在或损坏时为空表），返回设备数"""
+        if self.path is None:
+            return 0
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            entries = [RegistryEntry.from_dict(d) for d in data.get("devices", [])]
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            entries = []
+        with self._lock:
+            self._by_id = {entry.device_id: entry for entry in entries}
+            self._dirty = False
+        return len(entries)
+
+    def save(self, force=False):
+        """有修改时写入文件（先写临时文件再替换，避免写到一半时损坏）"""
+        if self.path is None:
+            return
+        with self._lock:
+            if not (self._dirty or force):
+                return
+            data = {"version": REGISTRY_VERSION,
+                    "devices": [entry.to_dict() for entry in self._by_id.values()]}
+            self._dirty = False
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".devices-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    # ========== 更新和查询 ==========
+
+    def update(self, device_id, ip, device_name="", mac_address="", info=None, now=None):
+        """记录设备在 ip 上出现，返回注册表项"""
+        if not device_id:
+            device_id = normalize_mac(mac_address)
+        if not device_id:
+            return None
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._by_id.get(device_id)
+            if entry is None:
+                entry = self._by_id[device_id] = RegistryEntry(device_id, ip, device_name,
+                                                               mac_address, now, info)
+            else:
+                entry.ip = ip
+                entry.last_seen = now
+                if device_name:
+                    entry.device_name = device_name
+                if mac_address:
+                    entry.mac_address = normalize_mac(mac_address)
+                if info:
+                    entry.info = info
+            self._dirty = True
+            return entry
+
+    def update_from_info(self, ip, info, now=None):
+        """用 /api/info 的内容记录设备（只保存不随命令变化的字段）"""
+        static = {k: v for k, v in info.items() if k not in _STATE_FIELDS}
+        return self.update(str(info.get("device_id", "")), ip, info.get("device_name", ""),
+                           info.get("mac_address", ""), static, now)
+
+    def get(self, device_id):
+        with self._lock:
+            return self._by_id.get(device_id)
+
+    def by_ip(self, ip):
+        with self._lock:
+            for entry in self._by_id.values():
+                if entry.ip == ip:
+                    return entry
+        return None
+
+    def remove(self, device_id):
+        with self._lock:
+            if self._by_id.pop(device_id, None) is not None:
+                self._dirty = True
+
+    def entries(self):
+        """按最后在线时间从新到旧排列的全部设备"""
+        with self._lock:
+            return sorted(self._by_id.values(), key=lambda entry: -entry.last_seen)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    # ========== 启动校验 ==========
+
+    def validate(self, on_result=None, arp_table=None, connect_timeout=VALIDATE_CONNECT_TIMEOUT,
+                 info_timeout=VALIDATE_INFO_TIMEOUT, concurrency=VALIDATE_CONCURRENCY):
+        """并发探测全部已知设备（同步，在后台线程中调用），返回 [ValidationResult, ...]
+
+        每台设备探测最后的IP；邻居表中该MAC对应其他IP时同时探测新IP。
+        /api/info 的 device_id 一致才算找到，在线设备的地址和最后在线时间写回注册表。
+        """
+        return asyncio.run(self.validate_async(on_result, arp_table, connect_timeout, info_timeout,
+                                               concurrency))
+
+    async def validate_async(self, on_result=None, arp_table=None,
+                             connect_timeout=VALIDATE_CONNECT_TIMEOUT, info_timeout=VALIDATE_INFO_TIMEOUT,
+                             concurrency=VALIDATE_CONCURRENCY):
+        """validate 的协程版本（在调用者的事件循环中运行，取消即停止探测）"""
+        if arp_table is None:
+            arp_table = read_arp_table()
+        return await self._validate_async(self.entries(), arp_table, on_result,
+                                          connect_timeout, info_timeout, concurrency)
+
+    async def _validate_async(self, entries, arp_table, on_result, connect_timeout,
+                              info_timeout, concurrency):
+        from esp32_scanner import SubnetScanner
+
+        semaphore = asyncio.Semaphore(concurrency)
+        scanners = {}
+
+        def scanner_for(port):
+            if port not in scanners:
+                scanners[port] = SubnetScanner(port=port, connect_timeout=connect_timeout,
+                                               info_timeout=info_timeout)
+            return scanners[port]
+
+        async def probe(host, port):
+            async with semaphore:
+                return await scanner_for(port).probe(host)
+
+        async def check(entry):
+            host, port = split_address(entry.ip)
+            candidates = [host]
+            arp_ip = arp_table.get(entry.mac_address)
+            if arp_ip and arp_ip != host:
+                candidates.insert(0, arp_ip)  # 邻居表中的新地址优先
+
+            results = await asyncio.gather(*(probe(ip, port) for ip in candidates))
+            result = None
+            for candidate, scan in zip(candidates, results):
+                if scan is not None and scan.info is not None \
+                        and str(scan.info.get("device_id", "")) == entry.device_id:
+                    address = candidate if entry.ip == host else f"{candidate}:{port}"
+                    status = ONLINE if candidate == host else MOVED
+                    result = ValidationResult(entry, status, address, entry.ip, scan.info,
+                                              scan.connect_time)
+                    break
+            if result is None:
+                result = ValidationResult(entry, OFFLINE, entry.ip, entry.ip)
+            else:
+                self.update_from_info(result.ip, result.info)
+            if on_result:
+                on_result(result)
+            return result
+
+        return await asyncio.gather(*(check(entry) for entry in entries))
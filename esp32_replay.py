@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESP32 设备流量录制和回放
+
+功能特性：
+1. 录制所有发出的 /api/control、/api/broadcast 请求和收到的UDP广播，
+   每条记录带单调时钟时间戳、HTTP状态码和延迟
+2. 紧凑的只追加二进制日志，程序中断时已写入的记录仍可读取
+3. 按原速、N倍速或最快速度把请求流重新发往设备或模拟器，
+   每台设备的请求保持原顺序，不同设备并行回放
+4. 对比回放和录制时的状态码和延迟
+
+日志格式（小端）：
+    文件头: 魔数 "E32R", 版本(uint8), 录制开始的墙上时间(float64)
+    记录:   类型(uint8), 相对开始的秒数(float64), 状态码(int16, -1为无响应),
+            延迟秒(float32, 广播为NaN), 设备地址长度(uint16), 内容长度(uint16),
+            设备地址(UTF-8), 内容（请求为 "路径?查询参数"，广播为原始数据报）
+
+作者: ESP32开发团队
+版本: 1.0.0
+日期: 2025-11-06
+"""
+
+import math
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import parse_qsl
+
+from esp32_bench import LatencyHistogram
+
+MAGIC = b"E32R"
+LOG_VERSION = 1
+HEADER = struct.Struct("<4sBd")
+RECORD = struct.Struct("<BdhfHH")
+
+KIND_REQUEST = 1
+KIND_ANNOUNCEMENT = 2
+
+NO_STATUS = -1
+RECORD_PATHS = ("/api/control", "/api/broadcast")   # 只录制会改变设备状态的请求
+FLUSH_INTERVAL = 1.0
+MAX_MISMATCH_EXAMPLES = 20
+
+# 一条录制记录: 类型, 相对开始的秒数, 设备地址, 内容, 状态码, 延迟秒
+TrafficRecord = namedtuple("TrafficRecord", ["kind", "time", "device", "payload", "status", "latency"])
+
+
+class TrafficRecorder:
+    """流量录制器（线程安全），挂到 DeviceClient.recorder 和 AnnouncementListener.recorder"""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self.bytes_written = 0
+        self._start = time.perf_counter()
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(HEADER.pack(MAGIC, LOG_VERSION, time.time()))
+        else:
+            # 追加到已有日志：沿用文件头中的开始时间，时间戳保持连续
+            with open(path, "rb") as f:
+                _, _, started = _read_header(f)
+            self._start -= time.time() - started
+
+    def _write(self, kind, when, device, payload, status, latency):
+        device = device.encode("utf-8")
+        record = RECORD.pack(kind, when - self._start, status, latency, len(device), len(payload))
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(record + device + payload)
+            self.count += 1
+            self.bytes_written += len(record) + len(device) + len(payload)
+            now = time.monotonic()
+            if now - self._last_flush >= FLUSH_INTERVAL:
+                self._file.flush()
+                self._last_flush = now
+
+    def record_request(self, device, path, query, status, start, latency):
+        """记录一次HTTP请求（start 为 time.perf_counter() 发送时刻，status 为None表示无响应）"""
+        if path not in RECORD_PATHS:
+            return
+        payload = (f"{path}?{query}" if query else path).encode("utf-8")
+        self._write(KIND_REQUEST, start, device,
+                    payload, NO_STATUS if status is None else status, latency)
+
+    def record_announcement(self, ip, data):
+        """记录一条收到的UDP数据报"""
+        self._write(KIND_ANNOUNCEMENT, time.perf_counter(), ip, bytes(data[:65535]), NO_STATUS,
+                    math.nan)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _read_header(f):
+    data = f.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise ValueError("不是流量录制文件（文件过短）")
+    magic, version, started = HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ValueError("不是流量录制文件")
+    if version != LOG_VERSION:
+        raise ValueError(f"不支持的录制文件版本 {version}")
+    return magic, version, started
+
+
+def read_log(path):
+    """读取录制文件，返回 (录制开始的墙上时间, [TrafficRecord, ...])
+
+    文件末尾不完整的记录（录制被中断）会被忽略。
+    """
+    records = []
+    with open(path, "rb") as f:
+        _, _, started = _read_header(f)
+        data = f.read()
+    offset = 0
+    size = RECORD.size
+    while offset + size <= len(data):
+        kind, when, status, latency, device_len, payload_len = RECORD.unpack_from(data, offset)
+        end = offset + size + device_len + payload_len
+        if end > len(data):
+            break
+        device = data[offset + size:offset + size + device_len].decode("utf-8", "replace")
+        payload = data[offset + size + device_len:end]
+        if kind == KIND_REQUEST:
+            payload = payload.decode("utf-8", "replace")
+        records.append(TrafficRecord(kind, when, device, payload,
+                                     None if status == NO_STATUS else status,
+                                     None if latency != latency else latency))
+        offset = end
+    records.sort(key=lambda record: record.time)
+    return started, records
+
+
+class ReplayReport:
+    """回放结果和与录制的对比"""
+
+    def __init__(self, speed):
+        self.speed = speed
+        self.requests = 0
+        self.matched = 0                  # 状态码与录制一致的请求
+        self.mismatches = []              # [(记录, 回放状态码), ...] 前若干个示例
+        self.mismatch_count = 0
+        self.announcements_sent = 0
+        self.announcements_skipped = 0
+        self.recorded_duration = 0.0
+        self.elapsed = 0.0
+        self.recorded_latency = LatencyHistogram()
+        self.replay_latency = LatencyHistogram()
+        self.lateness = LatencyHistogram()   # 实际发送时刻相对计划时刻的延后
+        self._lock = threading.Lock()
+
+    def add(self, record, status, latency, lateness):
+        with self._lock:
+            self.requests += 1
+            self.lateness.record(max(0.0, lateness))
+            if record.latency is not None and record.status is not None:
+                self.recorded_latency.record(record.latency)
+            if status is not None:
+                self.replay_latency.record(latency)
+            if status == record.status:
+                self.matched += 1
+            else:
+                self.mismatch_count += 1
+                if len(self.mismatches) < MAX_MISMATCH_EXAMPLES:
+                    self.mismatches.append((record, status))
+
+    def to_dict(self):
+        return {
+            "speed": self.speed,
+            "requests": self.requests,
+            "matched": self.matched,
+            "mismatched": self.mismatch_count,
+            "announcements_sent": self.announcements_sent,
+            "announcements_skipped": self.announcements_skipped,
+            "recorded_duration": self.recorded_duration,
+            "elapsed": self.elapsed,
+            "recorded_latency_ms": self.recorded_latency.summary_ms(),
+            "replay_latency_ms": self.replay_latency.summary_ms(),
+            "lateness_ms": self.lateness.summary_ms(),
+        }
+
+    def summary(self):
+        speed = "最快速度" if not self.speed else f"{self.speed:g}倍速"
+        text = (f"回放 {self.requests} 个请求（{speed}，录制时长 {self.recorded_duration:.1f}秒，"
+                f"回放耗时 {self.elapsed:.1f}秒）: 状态码一致 {self.matched}，"
+                f"不一致 {self.mismatch_count}")
+        if self.recorded_latency.count and self.replay_latency.count:
+            text += (f" | 延迟p50 录制 {self.recorded_latency.percentile(50) / 1000:.1f}ms "
+                     f"回放 {self.replay_latency.percentile(50) / 1000:.1f}ms"
+                     f" | p99 录制 {self.recorded_latency.percentile(99) / 1000:.1f}ms "
+                     f"回放 {self.replay_latency.percentile(99) / 1000:.1f}ms")
+        if self.announcements_sent or self.announcements_skipped:
+            text += f" | UDP广播 发送 {self.announcements_sent} 跳过 {self.announcements_skipped}"
+        return text
+
+
+class Replayer:
+    """按录制的时间间隔重新发送请求
+
+    get_client(地址) 返回 DeviceClient；target 为None时发往录制时的设备，
+    为字符串时全部发往该地址，也可以是 {录制地址: 目标地址} 映射。
+    speed 为回放倍速，0 表示不等待、按最快速度发送。
+    udp_target 为 (主机, 端口) 时把录制的UDP广播也重新发出。
+    """
+
+    def __init__(self, get_client, speed=1.0, target=None, udp_target=None):
+        if speed < 0:
+            raise ValueError("speed 不能小于0")
+        self.get_client = get_client
+        self.speed = speed
+        self.target = target
+        self.udp_target = udp_target
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def _target_for(self, device):
+        if self.target is None:
+            return device
+        if isinstance(self.target, str):
+            return self.target
+        return self.target.get(device, device)
+
+    def _wait_until(self, start, offset):
+        """等到计划发送时刻，返回发送时刻相对计划的延后（秒）"""
+        if not self.speed:
+            return 0.0
+        deadline = start + offset / self.speed
+        now = time.perf_counter()
+        if now < deadline and self._stop.wait(deadline - now):
+            return 0.0
+        return time.perf_counter() - deadline
+
+    def _replay_requests(self, address, records, start, report):
+        client = self.get_client(address)
+        for record in records:
+            lateness = self._wait_until(start, record.time)
+            if self._stop.is_set():
+                return
+            path, _, query = record.payload.partition("?")
+            params = dict(parse_qsl(query, keep_blank_values=True))
+            sent = time.perf_counter()
+            try:
+                response = client.get(path, params, idempotent=False)
+                status = response.status_code
+                timing = getattr(response, "timing", None)
+                latency = timing.total if timing else time.perf_counter() - sent
+            except Exception:
+                status, latency = None, time.perf_counter() - sent
+            report.add(record, status, latency, lateness)
+
+    def _replay_announcements(self, records, start, report):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        try:
+            for record in records:
+                self._wait_until(start, record.time)
+                if self._stop.is_set():
+                    return
+                try:
+                    sock.sendto(record.payload, self.udp_target)
+                    report.announcements_sent += 1
+                except OSError:
+                    report.announcements_skipped += 1
+        finally:
+            sock.close()
+
+    def run(self, records):
+        """回放记录（阻塞到全部发送完成），返回 ReplayReport"""
+        report = ReplayReport(self.speed)
+        self._stop.clear()
+        if records:
+            report.recorded_duration = records[-1].time - records[0].time
+            base = records[0].time
+            records = [record._replace(time=record.time - base) for record in records]
+
+        # 每台目标设备一个线程，保持该设备的请求顺序
+        streams = {}
+        announcements = []
+        for record in records:
+            if record.kind == KIND_REQUEST:
+                streams.setdefault(self._target_for(record.device), []).append(record)
+            elif self.udp_target is not None:
+                announcements.append(record)
+            else:
+                report.announcements_skipped += 1
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=self._replay_requests, args=(address, stream, start, report),
+                                    name=f"replay-{address}", daemon=True)
+                   for address, stream in streams.items()]
+        if announcements:
+            threads.append(threading.Thread(target=self._replay_announcements,
+                                            args=(announcements, start, report),
+                                            name="replay-udp", daemon=True))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        report.elapsed = time.perf_counter() - start
+        return report
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESP32 测试报告导出
+
+功能特性：
+1. 流式导出 JSON、CSV、JUnit XML 报告，不在内存中保存全部记录
+2. 按接口和按设备统计延迟百分位、状态码和错误分类
+3. 报告包含运行元数据（设备 /api/info 信息、测试工具版本、主机信息）
+
+结果从 ResultStore 逐条读取一遍（完整历史来自JSONL文件）。JUnit需要在开头
+写出用例总数，用例正文先写入临时文件，统计完成后再拼接。
+
+作者: ESP32开发团队
+版本: 1.0.0
+日期: 2025-11-06
+"""
+
+import csv
+import json
+import os
+import platform
+import shutil
+import socket
+import sys
+import tempfile
+from datetime import datetime
+from xml.sax.saxutils import quoteattr
+
+from esp32_bench import LatencyHistogram
+
+REPORT_FORMATS = ("json", "csv", "junit")
+CSV_COLUMNS = ("timestamp", "test_name", "result", "outcome", "device", "endpoint",
+               "status", "latency")
+MAX_ERROR_KINDS = 50
+ERROR_TEXT_LIMIT = 120
+LATENCY_BATCH = 4096
+
+
+def error_kind(row):
+    """错误分类：HTTP错误按状态码，其他按错误信息"""
+    status = row.get("status")
+    if status is not None and status != 200:
+        return f"HTTP {status}"
+    text = row["result"]
+    if text.startswith("失败: "):
+        text = text[4:]
+    return text[:ERROR_TEXT_LIMIT] or "失败"
+
+
+class GroupStats:
+    """一组记录（同一接口或同一设备）的统计"""
+
+    def __init__(self):
+        self.requests = 0
+        self.success = 0
+        self.failure = 0
+        self.status_codes = {}
+        self.latency = LatencyHistogram()
+        self._pending = []  # 未写入直方图的延迟，攒批后一次写入
+
+    def add(self, row):
+        self.requests += 1
+        if row["outcome"] == "success":
+            self.success += 1
+        elif row["outcome"] == "failure":
+            self.failure += 1
+        status = row.get("status")
+        if status is not None:
+            self.status_codes[status] = self.status_codes.get(status, 0) + 1
+        latency = row.get("latency")
+        if latency is not None:
+            self._pending.append(latency)
+            if len(self._pending) >= LATENCY_BATCH:
+                self.flush()
+
+    def flush(self):
+        if self._pending:
+            self.latency.record_many(self._pending)
+            self._pending = []
+
+    def to_dict(self):
+        self.flush()
+        return {
+            "requests": self.requests,
+            "success": self.success,
+            "failure": self.failure,
+            "status_codes": {str(k): v for k, v in sorted(self.status_codes.items())},
+            "latency_ms": self.latency.summary_ms() if self.latency.count else None,
+        }
+
+
+class ReportStats:
+    """单遍增量统计"""
+
+    def __init__(self):
+        self.total = 0
+        self.outcomes = {"success": 0, "failure": 0, "info": 0}
+        self.endpoints = {}
+        self.devices = {}
+        self.errors = {}
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+    def add(self, row):
+        self.total += 1
+        self.outcomes[row["outcome"]] += 1
+        if self.first_timestamp is None:
+            self.first_timestamp = row["timestamp"]
+        self.last_timestamp = row["timestamp"]
+
+        if row["outcome"] == "failure":
+            kind = error_kind(row)
+            if kind not in self.errors and len(self.errors) >= MAX_ERROR_KINDS:
+                kind = "其他"
+            self.errors[kind] = self.errors.get(kind, 0) + 1
+
+        # 只有实际发出的请求参与按接口/设备统计
+        if row.get("endpoint"):
+            group = self.endpoints.get(row["endpoint"])
+            if group is None:
+                group = self.endpoints[row["endpoint"]] = GroupStats()
+            group.add(row)
+        if row.get("device"):
+            group = self.devices.get(row["device"])
+            if group is None:
+                group = self.devices[row["device"]] = GroupStats()
+            group.add(row)
+
+    def duration(self):
+        if self.first_timestamp is None:
+            return 0.0
+        return self.last_timestamp - self.first_timestamp
+
+    def to_dict(self):
+        return {
+            "total": self.total,
+            "outcomes": self.outcomes,
+            "duration": self.duration(),
+            "endpoints": {k: v.to_dict() for k, v in sorted(self.endpoints.items())},
+            "devices": {k: v.to_dict() for k, v in sorted(self.devices.items())},
+            "errors": dict(sorted(self.errors.items(), key=lambda item: -item[1])),
+        }
+
+
+def build_metadata(version, device_ip="", device_info=None):
+    """运行元数据"""
+    return {
+        "tool": "ESP32S3 SuperMini API测试工具",
+        "version": version,
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "host": socket.gethostname(),
+        "platform": platform.platform(),
+        "python": sys.version.split()[0],
+        "device_ip": device_ip,
+        "device_info": device_info or {},
+    }
+
+
+def _open_json(path, metadata):
+    f = open(path, "w", encoding="utf-8")
+    f.write('{\n"metadata": ')
+    f.write(json.dumps(metadata, ensure_ascii=False))
+    f.write(',\n"results": [\n')
+    return f
+
+
+def _close_json(f, count, stats):
+    f.write("\n" if count else "")
+    f.write('],\n"summary": ')
+    f.write(json.dumps(stats.to_dict(), ensure_ascii=False))
+    f.write("\n}\n")
+    f.close()
+
+
+def _junit_testcase(row, device):
+    """单个JUnit用例，信息记录返回None"""
+    if row["outcome"] == "info":
+        return None
+    classname = quoteattr(row.get("device") or device)
+    latency = row.get("latency") or 0.0
+    head = f'<testcase classname={classname} name={quoteattr(row["test_name"])} time="{latency:.6f}"'
+    if row["outcome"] == "failure":
+        return (f'{head}><failure message={quoteattr(row["result"])} '
+                f'type={quoteattr(error_kind(row))}/></testcase>\n')
+    return f"{head}/>\n"
+
+
+def _write_junit(path, body_file, stats, metadata):
+    """JUnit XML：头部需要用例总数，用例正文先写入临时文件，统计完成后拼接"""
+    judged = stats.outcomes["success"] + stats.outcomes["failure"]
+    device = metadata.get("device_ip") or "esp32"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write(f'<testsuites tests="{judged}" failures="{stats.outcomes["failure"]}">\n')
+        f.write(f'<testsuite name={quoteattr("ESP32 API " + device)} tests="{judged}" '
+                f'failures="{stats.outcomes["failure"]}" errors="0" '
+                f'time="{stats.duration():.3f}" '
+                f'timestamp={quoteattr(metadata["generated_at"])} '
+                f'hostname={quoteattr(metadata["host"])}>\n')
+        f.write("<properties>\n")
+        f.write(f'<property name="version" value={quoteattr(str(metadata["version"]))}/>\n')
+        for key, value in sorted(metadata["device_info"].items()):
+            f.write(f'<property name={quoteattr("device." + key)} value={quoteattr(str(value))}/>\n')
+        f.write("</properties>\n")
+        body_file.seek(0)
+        shutil.copyfileobj(body_file, f)
+        f.write("</testsuite>\n</testsuites>\n")
+
+
+def write_reports(store, basename, metadata, formats=REPORT_FORMATS):
+    """把结果存储导出为多种格式（单遍读取），返回 (文件名列表, ReportStats)"""
+    formats = [fmt for fmt in REPORT_FORMATS if fmt in formats]
+    stats = ReportStats()
+    files = []
+    device = metadata.get("device_ip") or "esp32"
+
+    json_file = csv_file = writer = junit_body = None
+    if "json" in formats:
+        files.append(f"{basename}.json")
+        json_file = _open_json(files[-1], metadata)
+    if "csv" in formats:
+        files.append(f"{basename}.csv")
+        csv_file = open(files[-1], "w", encoding="utf-8", newline="")
+        writer = csv.writer(csv_file)
+        writer.writerow(CSV_COLUMNS)
+    if "junit" in formats:
+        files.append(f"{basename}.xml")
+        directory = os.path.dirname(os.path.abspath(files[-1]))
+        junit_body = tempfile.TemporaryFile("w+", encoding="utf-8", dir=directory)
+
+    count = 0
+    try:
+        for row, line in store.rows_with_lines():
+            stats.add(row)
+            if json_file is not None:
+                # JSONL行本身就是合法的JSON对象，直接写入
+                if count:
+                    json_file.write(",\n")
+                json_file.write(line.rstrip("\n"))
+            if writer is not None:
+                writer.writerow([row.get(column) for column in CSV_COLUMNS])
+            if junit_body is not None:
+                testcase = _junit_testcase(row, device)
+                if testcase is not None:
+                    junit_body.write(testcase)
+            count += 1
+
+        if junit_body is not None:
+            _write_junit(files[-1], junit_body, stats, metadata)
+    finally:
+        if csv_file is not None:
+            csv_file.close()
+        if json_file is not None:
+            _close_json(json_file, count, stats)
+        if junit_body is not None:
+            junit_body.close()
+
+    return files, stats
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESP32 测试结果存储
+
+功能特性：
+1. 结构化结果记录（时间戳、设备、接口、状态码、延迟、结果类型）
+2. 内存中只保留固定条数的最近记录（环形缓冲区）
+3. 完整历史以JSONL格式追加写入磁盘
+4. 计数和延迟百分位随记录增量更新，无需重新遍历
+
+作者: ESP32开发团队
+版本: 1.0.0
+日期: 2025-11-06
+"""
+
+import enum
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from esp32_bench import LatencyHistogram
+
+DEFAULT_CAPACITY = 10000
+FLUSH_INTERVAL = 1.0  # JSONL文件最长刷新间隔（秒）
+
+
+class Outcome(enum.IntEnum):
+    """结果类型"""
+    SUCCESS = 0
+    FAILURE = 1
+    INFO = 2      # 开始/完成/信息等不计成败的记录
+
+
+def outcome_of(result):
+    """根据结果文本推断结果类型（兼容 "成功"/"失败: ..." 等写法）"""
+    if "成功" in result:
+        return Outcome.SUCCESS
+    if "失败" in result:
+        return Outcome.FAILURE
+    return Outcome.INFO
+
+
+class ResultRecord:
+    """单条测试结果"""
+
+    __slots__ = ("timestamp", "test_name", "result", "outcome", "device", "endpoint",
+                 "status", "latency")
+
+    def __init__(self, test_name, result, outcome=None, device="", endpoint="",
+                 status=None, latency=None, timestamp=None):
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.test_name = test_name
+        self.result = result
+        self.outcome = outcome_of(result) if outcome is None else Outcome(outcome)
+        self.device = device
+        self.endpoint = endpoint
+        self.status = status      # HTTP状态码，未发送请求时为None
+        self.latency = latency    # 请求耗时（秒），未发送请求时为None
+
+    @property
+    def ok(self):
+        return self.outcome == Outcome.SUCCESS
+
+    @property
+    def time_text(self):
+        """显示用的时间字符串"""
+        return datetime.fromtimestamp(self.timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+    def to_dict(self):
+        return {
+            "timestamp": self.timestamp,
+            "test_name": self.test_name,
+            "result": self.result,
+            "outcome": self.outcome.name.lower(),
+            "device": self.device,
+            "endpoint": self.endpoint,
+            "status": self.status,
+            "latency": self.latency,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["test_name"], data["result"], Outcome[data["outcome"].upper()],
+                   data.get("device", ""), data.get("endpoint", ""), data.get("status"),
+                   data.get("latency"), data["timestamp"])
+
+
+class ResultStore:
+    """有界结果存储：内存环形缓冲区 + 可选的JSONL完整历史"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, spill_path=None):
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self._recent = deque(maxlen=capacity)
+        self._spill = None
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+        self._spill_start = self._spill_size()  # 本次历史在JSONL文件中的起始字节位置
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.total = 0
+        self.counts = {outcome: 0 for outcome in Outcome}
+        self.latency = LatencyHistogram()
+
+    def append(self, record):
+        """添加一条记录"""
+        with self._lock:
+            self._recent.append(record)
+            self.total += 1
+            self.counts[record.outcome] += 1
+            if self.spill_path is not None:
+                self._write(record)
+        if record.latency is not None:
+            self.latency.record(record.latency)
+        return record
+
+    def _write(self, record):
+        if self._spill is None:
+            self._spill = open(self.spill_path, "a", encoding="utf-8")
+        self._spill.write(json.dumps(record.to_dict(), ensure_ascii=False) + "\n")
+        now = time.monotonic()
+        if now - self._last_flush >= FLUSH_INTERVAL:
+            self._spill.flush()
+            self._last_flush = now
+
+    def _spill_size(self):
+        """JSONL文件当前长度（调用方持有锁或尚未开始写入）"""
+        if self.spill_path is None:
+            return 0
+        if self._spill is not None:
+            self._spill.flush()
+            return self._spill.tell()
+        try:
+            return os.path.getsize(self.spill_path)
+        except OSError:
+            return 0
+
+    def flush(self):
+        with self._lock:
+            if self._spill is not None:
+                self._spill.flush()
+
+    def close(self):
+        with self._lock:
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
+
+    def clear(self):
+        """清空内存记录和统计（磁盘历史另起一段，不会被删除）"""
+        with self._lock:
+            self._recent.clear()
+            self._spill_start = self._spill_size()
+            self._reset_stats()
+
+    def recent(self, n=None):
+        """最近的记录（最多 capacity 条）"""
+        with self._lock:
+            records = list(self._recent)
+        return records if n is None else records[-n:]
+
+    def rows_with_lines(self):
+        """按时间顺序遍历完整历史: (字典, JSON文本行)
+        有JSONL文件时从文件读取，否则为内存中的记录"""
+        if self.spill_path is None:
+            for record in self.recent():
+                row = record.to_dict()
+                yield row, json.dumps(row, ensure_ascii=False) + "\n"
+            return
+        if self.total == 0:
+            return
+        # 只读到开始遍历时已完整写入的位置：其他线程仍在追加，缓冲区随时可能写出半行
+        with self._lock:
+            start, end = self._spill_start, self._spill_size()
+        loads = json.loads
+        with open(self.spill_path, "rb") as f:
+            f.seek(start)  # 跳过文件中已有的和清空之前的记录
+            remaining = end - start
+            while remaining > 0:
+                raw = f.readline(remaining)
+                if not raw:
+                    break
+                remaining -= len(raw)
+                line = raw.decode("utf-8")
+                yield loads(line), line
+
+    def rows(self):
+        """按时间顺序遍历完整历史（字典形式）"""
+        for row, _ in self.rows_with_lines():
+            yield row
+
+    def history(self):
+        """按时间顺序遍历完整历史（ResultRecord形式）"""
+        if self.spill_path is None:
+            yield from self.recent()
+            return
+        for row in self.rows():
+            yield ResultRecord.from_dict(row)
+
+    def percentile(self, p):
+        """请求延迟第p百分位（秒）"""
+        return self.latency.percentile(p) / 1000000.0
+
+    @property
+    def success_count(self):
+        return self.counts[Outcome.SUCCESS]
+
+    @property
+    def failure_count(self):
+        return self.counts[Outcome.FAILURE]
+
+    def __len__(self):
+        return self.total
+
+    def __bool__(self):
+        return self.total > 0
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESP32 局域网设备扫描引擎
+
+功能特性：
+1. 解析本机真实网卡和CIDR网段（Linux使用ip命令，Windows使用ipconfig）
+2. 使用asyncio并发TCP:80探测整个网段，并发数有上限
+3. 仅对应答的主机请求 /api/info
+4. 扫描结果通过回调流式返回
+5. 主动发现：并发请求候选地址（网段、已知设备、邻居表）的 /api/discover，
+   应答和无应答地址都按TTL缓存，再次发现时只重新探测过期的地址
+
+作者: ESP32开发团队
+版本: 1.0.0
+日期: 2025-11-06
+"""
+
+import asyncio
+import ipaddress
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+from esp32_registry import normalize_mac, read_arp_table, split_address
+
+DEFAULT_PORT = 80
+DEFAULT_CONCURRENCY = 256
+DEFAULT_CONNECT_TIMEOUT = 0.5
+DEFAULT_INFO_TIMEOUT = 2.0
+DEFAULT_MAX_HOSTS = 4096
+
+# 主动发现
+DISCOVER_PATH = "/api/discover"
+DISCOVER_CACHE_FILENAME = "discover_cache.json"
+DISCOVER_CACHE_VERSION = 1
+DEFAULT_DISCOVER_TTL = 600.0   # 设备应答的缓存时间（秒）
+DEFAULT_MISS_TTL = 120.0       # 无应答地址的缓存时间（秒）
+TTL_JITTER = 0.25              # 每个地址的TTL随机缩短最多25%，过期的地址分散到多次发现中
+
+# 本机网段: 网卡名称, 本机IP, IPv4Network
+LocalNetwork = namedtuple("LocalNetwork", ["interface", "address", "network"])
+
+# 扫描结果: IP地址, /api/info内容(非ESP32设备为None), TCP连接耗时(秒)
+ScanResult = namedtuple("ScanResult", ["ip", "info", "connect_time"])
+
+# 主动发现结果: 地址（非默认端口时带端口）, /api/discover内容, TCP连接耗时(秒), 是否来自缓存
+DiscoverResult = namedtuple("DiscoverResult", ["ip", "info", "connect_time", "cached"])
+
+
+def _parse_ip_addr(output):
+    """解析 `ip -o -4 addr show` 的输出"""
+    networks = []
+    for line in output.splitlines():
+        match = re.search(r'^\d+:\s+(\S+)\s+inet\s+(\d+\.\d+\.\d+\.\d+)/(\d+)', line)
+        if not match:
+            continue
+        interface, address, prefix = match.groups()
+        network = ipaddress.IPv4Network(f"{address}/{prefix}", strict=False)
+        networks.append(LocalNetwork(interface.split('@')[0], address, network))
+    return networks
+
+
+def _parse_ipconfig(output):
+    """解析Windows `ipconfig` 的输出"""
+    networks = []
+    addresses = re.findall(r'IPv4 Address[^\d]*(\d+\.\d+\.\d+\.\d+)', output)
+    masks = re.findall(r'Subnet Mask[^\d]*(\d+\.\d+\.\d+\.\d+)', output)
+    for address, mask in zip(addresses, masks):
+        network = ipaddress.IPv4Network(f"{address}/{mask}", strict=False)
+        networks.append(LocalNetwork("", address, network))
+    return networks
+
+
+def _default_route_network():
+    """无法解析网卡时，根据默认路由的出口IP推断/24网段"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # UDP connect不会发送数据，只用于选择出口网卡
+        sock.connect(("8.8.8.8", 80))
+        address = sock.getsockname()[0]
+    except OSError:
+        return []
+    finally:
+        sock.close()
+    return [LocalNetwork("", address, ipaddress.IPv4Network(f"{address}/24", strict=False))]
+
+
+def get_local_networks():
+    """获取本机可扫描的IPv4网段（排除回环和链路本地地址）"""
+    networks = []
+    try:
+        if sys.platform.startswith("win"):
+            result = subprocess.run(['ipconfig'], capture_output=True, text=True)
+            networks = _parse_ipconfig(result.stdout)
+        else:
+            result = subprocess.run(['ip', '-o', '-4', 'addr', 'show'], capture_output=True, text=True)
+            networks = _parse_ip_addr(result.stdout)
+    except (OSError, ValueError):
+        networks = []
+
+    networks = [n for n in networks
+                if not n.network.is_loopback and not n.network.is_link_local]
+    if not networks:
+        networks = _default_route_network()
+    return networks
+
+
+def iter_hosts(networks, max_hosts=DEFAULT_MAX_HOSTS):
+    """按顺序生成待扫描主机（跳过本机IP，去重，限制主机总数）"""
+    seen = set(n.address for n in networks)
+    count = 0
+    for local in networks:
+        network = local.network
+        # 超大网段只扫描本机所在的一段，避免误扫整个 /8
+        if network.num_addresses > max_hosts:
+            prefix = 32 - max(1, (max_hosts - 1).bit_length())
+            network = ipaddress.IPv4Network(f"{local.address}/{prefix}", strict=False)
+        for host in network.hosts():
+            ip = str(host)
+            if ip in seen:
+                continue
+            seen.add(ip)
+            yield ip
+            count += 1
+            if count >= max_hosts:
+                return
+
+
+def parse_http_response(data):
+    """解析HTTP响应，返回 (状态码, 响应体bytes)"""
+    head, _, body = data.partition(b"\r\n\r\n")
+    status_line = head.split(b"\r\n", 1)[0].decode("latin-1")
+    parts = status_line.split(" ", 2)
+    if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+        raise ValueError(f"无效的HTTP响应: {status_line!r}")
+    return int(parts[1]), body
+
+
+class SubnetScanner:
+    """并发子网扫描器"""
+
+    def __init__(self, port=DEFAULT_PORT, concurrency=DEFAULT_CONCURRENCY,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, info_timeout=DEFAULT_INFO_TIMEOUT,
+                 max_hosts=DEFAULT_MAX_HOSTS, path="/api/info"):
+        self.port = port
+        self.path = path        # 连接成功后请求的JSON接口
+        self.concurrency = concurrency
+        self.connect_timeout = connect_timeout
+        self.info_timeout = info_timeout
+        self.max_hosts = max_hosts
+        self.hosts_probed = 0
+
+    def scan(self, networks=None, on_result=None):
+        """同步扫描（在后台线程中调用），返回全部结果"""
+        return asyncio.run(self.scan_async(networks, on_result))
+
+    async def scan_async(self, networks=None, on_result=None):
+        """扫描网段中所有主机，每发现一个应答主机就调用 on_result(ScanResult)"""
+        if networks is None:
+            networks = get_local_networks()
+
+        hosts = iter_hosts(networks, self.max_hosts)
+        results = []
+        self.hosts_probed = 0
+
+        async def worker():
+            # 所有worker共享同一个主机迭代器，天然限制并发数
+            for ip in hosts:
+                self.hosts_probed += 1
+                result = await self.probe(ip)
+                if result is None:
+                    continue
+                results.append(result)
+                if on_result:
+                    on_result(result)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        return results
+
+    async def probe(self, ip):
+        """TCP探测单个主机，连接成功后通过同一连接获取 /api/info（或 path 指定的接口）"""
+        start = time.perf_counter()
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(ip, self.port), self.connect_timeout)
+        except (OSError, asyncio.TimeoutError):
+            return None
+        connect_time = time.perf_counter() - start
+
+        info = None
+        try:
+            info = await asyncio.wait_for(self._fetch_info(ip, reader, writer), self.info_timeout)
+        except (OSError, ValueError, asyncio.TimeoutError):
+            # 端口开放但不是ESP32设备
+            info = None
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+        return ScanResult(ip, info, connect_time)
+
+    async def _fetch_info(self, ip, reader, writer):
+        """发送 GET /api/info 并解析JSON"""
+        host = ip if self.port == DEFAULT_PORT else f"{ip}:{self.port}"
+        request = f"GET {self.path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n"
+        writer.write(request.encode("ascii"))
+        await writer.drain()
+
+        status, body = parse_http_response(await reader.read())
+        if status != 200:
+            return None
+        info = json.loads(body.decode("utf-8"))
+        return info if isinstance(info, dict) else None
+
+
+def discover_candidates(networks=None, known=(), arp_table=None, port=DEFAULT_PORT,
+                        max_hosts=DEFAULT_MAX_HOSTS):
+    """主动发现的候选地址：已知设备地址、邻居表中的主机、网段中的全部主机（按此顺序去重）
+
+    known 为已知设备地址（可带端口），其余地址不是默认端口时加上 port。
+    """
+    if arp_table is None:
+        arp_table = read_arp_table()
+    suffix = "" if port == DEFAULT_PORT else f":{port}"
+    candidates = dict.fromkeys(known)
+    for ip in arp_table.values():
+        candidates.setdefault(ip + suffix, None)
+    if networks:
+        for ip in iter_hosts(networks, max_hosts):
+            candidates.setdefault(ip + suffix, None)
+    return list(candidates)
+
+
+class DiscoverCache:
+    """/api/discover 应答缓存（线程安全）
+
+    设备应答和无应答的地址都记录探测时间，查询时按各自的TTL判断是否过期；
+    邻居表显示该地址的MAC变了时立即过期。path 为None时只保存在内存中。
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._entries = {}   # 地址 -> [应答JSON或None, MAC, TCP连接耗时, 探测时间, TTL提前比例]
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def load(self):
+        """从文件读取（文件不存在或损坏时从空缓存开始），返回条目数"""
+        if self.path is None:
+            return 0
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != DISCOVER_CACHE_VERSION:
+                return 0
+            entries = {address: [entry["info"], entry["mac"], entry["connect_time"], entry["checked"],
+                                 entry["jitter"]]
+                       for address, entry in data["entries"].items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return 0
+        with self._lock:
+            self._entries = entries
+        return len(entries)
+
+    def save(self):
+        """有修改时写入文件（先写临时文件再替换）"""
+        if self.path is None:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"version": DISCOVER_CACHE_VERSION,
+                    "entries": {address: {"info": info, "mac": mac, "connect_time": connect_time,
+                                          "checked": checked, "jitter": jitter}
+                                for address, (info, mac, connect_time, checked, jitter)
+                                in self._entries.items()}}
+            self._dirty = False
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".discover-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def lookup(self, address, ttl, miss_ttl, arp_mac="", now=None):
+        """未过期时返回 (应答JSON或None, TCP连接耗时)，需要重新探测时返回None
+
+        设备应答按 ttl、无应答按 miss_ttl 过期，每个地址的过期时间有固定的随机提前量。
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(address)
+        if entry is None:
+            return None
+        info, mac, connect_time, checked, jitter = entry
+        limit = (ttl if info is not None else miss_ttl) * (1.0 - jitter)
+        if now - checked >= limit or now < checked or (arp_mac and arp_mac != mac):
+            return None
+        return info, connect_time
+
+    def store(self, address, info, mac, connect_time, now=None):
+        """记录一次探测结果（info 为None表示无应答）"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._entries[address] = [info, normalize_mac(mac), connect_time, now,
+                                      random.uniform(0.0, TTL_JITTER)]
+            self._dirty = True
+
+    def invalidate(self, address=None):
+        """使一个地址（None 为全部）的缓存过期"""
+        with self._lock:
+            if address is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(address, None)
+            self._dirty = True
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ActiveDiscovery:
+    """通过 /api/discover 主动发现设备，结果经 DiscoverCache 缓存"""
+
+    def __init__(self, cache=None, concurrency=DEFAULT_CONCURRENCY,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, info_timeout=DEFAULT_INFO_TIMEOUT,
+                 ttl=DEFAULT_DISCOVER_TTL, miss_ttl=DEFAULT_MISS_TTL):
+        self.cache = cache if cache is not None else DiscoverCache()
+        self.concurrency = concurrency
+        self.connect_timeout = connect_timeout
+        self.info_timeout = info_timeout
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+
+        # 最近一次发现的统计
+        self.probed = 0
+        self.cache_hits = 0
+
+    def discover(self, candidates, arp_table=None, on_result=None, force=False):
+        """同步发现（在后台线程中调用），返回找到的设备 [DiscoverResult, ...]"""
+        return asyncio.run(self.discover_async(candidates, arp_table, on_result, force))
+
+    async def discover_async(self, candidates, arp_table=None, on_result=None, force=False):
+        """缓存未过期的地址直接返回缓存结果，其余地址并发探测；每找到一个设备调用 on_result
+
+        force 为True时忽略缓存，全部重新探测。
+        """
+        if arp_table is None:
+            arp_table = read_arp_table()
+        arp_by_ip = {ip: mac for mac, ip in arp_table.items()}
+        results = []
+        self.probed = 0
+        self.cache_hits = 0
+
+        def found(result):
+            results.append(result)
+            if on_result:
+                on_result(result)
+
+        stale = []
+        now = time.time()
+        for address in candidates:
+            host, _ = split_address(address, DEFAULT_PORT)
+            cached = None if force else self.cache.lookup(address, self.ttl, self.miss_ttl,
+                                                          arp_by_ip.get(host, ""), now)
+            if cached is None:
+                stale.append(address)
+                continue
+            self.cache_hits += 1
+            info, connect_time = cached
+            if info is not None:
+                found(DiscoverResult(address, info, connect_time, True))
+
+        scanners = {}
+        addresses = iter(stale)
+
+        async def worker():
+            # 所有worker共享同一个地址迭代器，天然限制并发数
+            for address in addresses:
+                host, port = split_address(address, DEFAULT_PORT)
+                if port not in scanners:
+                    scanners[port] = SubnetScanner(port=port, connect_timeout=self.connect_timeout,
+                                                   info_timeout=self.info_timeout, path=DISCOVER_PATH)
+                self.probed += 1
+                scan = await scanners[port].probe(host)
+                info = scan.info if scan is not None else None
+                if info is not None and "device_id" not in info:
+                    info = None   # 端口开放但不是ESP32设备
+                connect_time = scan.connect_time if scan is not None else None
+                if info is None:
+                    self.cache.store(address, None, arp_by_ip.get(host, ""), connect_time)
+                    continue
+                self.cache.store(address, info, info.get("mac_address", ""), connect_time)
+                found(DiscoverResult(address, info, connect_time, False))
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(stale)))))
+        return results
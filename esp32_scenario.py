@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESP32 测试场景文件
+
+功能特性：
+1. JSON/YAML 场景格式：控制、广播、信息断言、等待、循环和参数扫描
+2. 每个步骤可以带 /api/info 字段断言和延迟预算（超出预算记为失败）
+3. 加载时一次性校验并编译成扁平的步骤程序（SuiteStep 列表），
+   执行时不再解析，由 SuiteRunner 在一台或多台设备上运行
+
+场景示例（YAML）：
+
+    name: 颜色回归
+    defaults: {wait: 0.2, budget_ms: 300}
+    steps:
+      - info: true
+        expect: {wifi_status: true}
+      - control: {color: 3}
+        expect: {rgb_color: 3, hsv_mode: false}
+      - loop: 2
+        steps:
+          - sweep: {hue: {start: 0, stop: 360, step: 60}}
+            control: {saturation: 100, value: 100}
+      - wait: 1.0
+      - broadcast: enable
+      - assert: {broadcast_enabled: true}
+        budget_ms: 100
+
+作者: ESP32开发团队
+版本: 1.0.0
+日期: 2025-11-06
+"""
+
+import itertools
+import json
+import os
+
+from esp32_suite import SuiteStep
+
+try:
+    import yaml
+except ImportError:  # PyYAML为可选依赖，缺失时只支持JSON场景
+    yaml = None
+
+CONTROL_PARAMS = ("hue", "saturation", "value", "color", "brightness", "duration", "power")
+BROADCAST_ACTIONS = ("enable", "disable")
+STEP_ACTIONS = ("control", "broadcast", "info", "assert", "wait", "loop")
+STEP_OPTIONS = ("name", "wait", "budget_ms", "expect", "sweep", "steps")
+MAX_PROGRAM_STEPS = 100000   # 展开循环和扫描后的步骤上限
+
+
+class ScenarioError(ValueError):
+    """场景格式错误（带出错位置）"""
+
+    def __init__(self, path, message):
+        super().__init__(f"{path}: {message}")
+        self.path = path
+
+
+class Scenario:
+    """编译后的场景"""
+
+    def __init__(self, name, program, source=""):
+        self.name = name
+        self.program = program      # [SuiteStep, ...]
+        self.source = source
+
+    @property
+    def duration(self):
+        """全部等待时间之和（秒，不含请求耗时）"""
+        return sum(step.wait for step in self.program)
+
+    def __len__(self):
+        return len(self.program)
+
+
+def _number(value, path, minimum=None):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ScenarioError(path, f"应为数字，实际为 {value!r}")
+    if minimum is not None and value < minimum:
+        raise ScenarioError(path, f"不能小于 {minimum}")
+    return value
+
+
+def _check_expect(expect, path):
+    if not isinstance(expect, dict) or not expect:
+        raise ScenarioError(path, "应为非空的 {字段: 值} 映射")
+    for field, expected in expect.items():
+        if isinstance(expected, dict):
+            unknown = set(expected) - {"min", "max"}
+            if unknown or not expected:
+                raise ScenarioError(f"{path}.{field}", "范围断言只支持 min/max")
+            for key, bound in expected.items():
+                _number(bound, f"{path}.{field}.{key}")
+    return dict(expect)
+
+
+def _check_control(params, path):
+    if not isinstance(params, dict):
+        raise ScenarioError(path, "应为 {参数: 值} 映射")
+    for key, value in params.items():
+        if key not in CONTROL_PARAMS:
+            raise ScenarioError(f"{path}.{key}", f"未知参数（可选: {', '.join(CONTROL_PARAMS)}）")
+        if key == "power":
+            if value not in ("on", "off"):
+                raise ScenarioError(f"{path}.power", "应为 on 或 off")
+        else:
+            _number(value, f"{path}.{key}")
+    return dict(params)
+
+
+def _sweep_values(spec, path):
+    """扫描参数的取值列表：[v1, v2, ...] 或 {start, stop, step}（不包含 stop）"""
+    if isinstance(spec, list):
+        if not spec:
+            raise ScenarioError(path, "取值列表不能为空")
+        return spec
+    if isinstance(spec, dict):
+        unknown = set(spec) - {"start", "stop", "step"}
+        if unknown or "stop" not in spec:
+            raise ScenarioError(path, "范围应为 {start, stop, step}")
+        start = _number(spec.get("start", 0), f"{path}.start")
+        stop = _number(spec["stop"], f"{path}.stop")
+        step = _number(spec.get("step", 1), f"{path}.step")
+        if step == 0:
+            raise ScenarioError(f"{path}.step", "不能为0")
+        values = []
+        value = start
+        while (value < stop) if step > 0 else (value > stop):
+            values.append(value)
+            value = start + step * len(values)
+            if len(values) > MAX_PROGRAM_STEPS:
+                raise ScenarioError(path, "取值过多")
+        if not values:
+            raise ScenarioError(path, "范围为空")
+        return values
+    raise ScenarioError(path, "应为取值列表或 {start, stop, step}")
+
+
+def _format_params(params):
+    return " ".join(f"{k}={v}" for k, v in params.items())
+
+
+class _Compiler:
+    """把嵌套的场景步骤展开成扁平的 SuiteStep 列表"""
+
+    def __init__(self, defaults):
+        self.default_wait = _number(defaults.get("wait", 0.0), "defaults.wait", 0)
+        budget = defaults.get("budget_ms")
+        self.default_budget = None if budget is None else \
+            _number(budget, "defaults.budget_ms", 0) / 1000.0
+        self.program = []
+
+    def emit(self, step):
+        if len(self.program) >= MAX_PROGRAM_STEPS:
+            raise ScenarioError("steps", f"展开后超过 {MAX_PROGRAM_STEPS} 个步骤")
+        self.program.append(step)
+
+    def add_wait(self, seconds, path):
+        """等待并入前一个步骤的完成后等待时间"""
+        if not self.program:
+            raise ScenarioError(path, "场景不能以等待开始")
+        last = self.program[-1]
+        self.program[-1] = last._replace(wait=last.wait + seconds)
+
+    def compile_steps(self, steps, path, suffix=""):
+        if not isinstance(steps, list):
+            raise ScenarioError(path, "应为步骤列表")
+        for i, step in enumerate(steps):
+            self.compile_step(step, f"{path}[{i}]", suffix)
+
+    def compile_step(self, step, path, suffix):
+        if not isinstance(step, dict):
+            raise ScenarioError(path, "步骤应为映射")
+        actions = [key for key in STEP_ACTIONS if key in step]
+        unknown = set(step) - set(STEP_ACTIONS) - set(STEP_OPTIONS)
+        if unknown:
+            raise ScenarioError(path, f"未知字段 {', '.join(sorted(unknown))}")
+
+        # 单独的 wait 是等待步骤，和其他动作一起时是该步骤完成后的等待
+        if actions == ["wait"]:
+            self.add_wait(_number(step["wait"], f"{path}.wait", 0), path)
+            return
+        actions = [key for key in actions if key != "wait"]
+        if len(actions) != 1:
+            raise ScenarioError(path, f"每个步骤需要且只能有一个动作（{', '.join(STEP_ACTIONS)}）")
+        action = actions[0]
+
+        if action == "loop":
+            count = step["loop"]
+            if isinstance(count, bool) or not isinstance(count, int) or count < 1:
+                raise ScenarioError(f"{path}.loop", "循环次数应为正整数")
+            if "steps" not in step:
+                raise ScenarioError(path, "循环需要 steps")
+            # 循环本身不发送请求，名称、预算和断言只能写在 steps 中的步骤上
+            for key in ("name", "budget_ms", "expect", "sweep"):
+                if key in step:
+                    raise ScenarioError(f"{path}.{key}", "循环步骤不支持该字段（请写在 steps 中的步骤上）")
+            for n in range(count):
+                self.compile_steps(step["steps"], f"{path}.steps", f"{suffix} [第{n + 1}轮]")
+            if "wait" in step:
+                self.add_wait(_number(step["wait"], f"{path}.wait", 0), path)
+            return
+        if "steps" in step:
+            raise ScenarioError(f"{path}.steps", "只有循环步骤可以包含 steps")
+
+        wait = _number(step.get("wait", self.default_wait), f"{path}.wait", 0)
+        budget = self.default_budget
+        if "budget_ms" in step:
+            budget = _number(step["budget_ms"], f"{path}.budget_ms", 0) / 1000.0
+        expect = _check_expect(step["expect"], f"{path}.expect") if "expect" in step else None
+
+        if action == "control":
+            base = _check_control(step["control"], f"{path}.control")
+            sweeps = self.sweeps(step.get("sweep"), f"{path}.sweep")
+            for values in sweeps:
+                _check_control(values, f"{path}.sweep")
+                params = dict(base)
+                params.update(values)
+                name = step.get("name") or f"控制 {_format_params(params)}"
+                if values and step.get("name"):
+                    name += f" ({_format_params(values)})"
+                self.emit(SuiteStep(name + suffix, "control", (), params, 0.0, None, budget))
+                if expect:
+                    # 控制后读取 /api/info 检查设备状态
+                    self.emit(SuiteStep(f"检查 {name}{suffix}", "info", (), {}, 0.0, expect, budget))
+                self.add_wait(wait, path)
+            return
+        if "sweep" in step:
+            raise ScenarioError(f"{path}.sweep", "只有控制步骤可以扫描参数")
+
+        if action == "broadcast":
+            action_value = step["broadcast"]
+            if action_value not in BROADCAST_ACTIONS:
+                raise ScenarioError(f"{path}.broadcast", f"应为 {' 或 '.join(BROADCAST_ACTIONS)}")
+            name = step.get("name") or f"广播 {action_value}"
+            self.emit(SuiteStep(name + suffix, "broadcast", (action_value,), {}, 0.0, None, budget))
+            if expect:
+                self.emit(SuiteStep(f"检查 {name}{suffix}", "info", (), {}, 0.0, expect, budget))
+        elif action == "info":
+            name = step.get("name") or "读取设备信息"
+            self.emit(SuiteStep(name + suffix, "info", (), {}, 0.0, expect, budget))
+        else:  # assert
+            if expect is not None:
+                raise ScenarioError(path, "assert 步骤的断言直接写在 assert 中")
+            expect = _check_expect(step["assert"], f"{path}.assert")
+            name = step.get("name") or f"断言 {_format_params(expect)}"
+            self.emit(SuiteStep(name + suffix, "info", (), {}, 0.0, expect, budget))
+        self.add_wait(wait, path)
+
+    def sweeps(self, sweep, path):
+        """扫描参数的所有组合（多个参数时为笛卡尔积），没有扫描时为 [{}]"""
+        if sweep is None:
+            return [{}]
+        if not isinstance(sweep, dict) or not sweep:
+            raise ScenarioError(path, "应为 {参数: 取值} 映射")
+        names = list(sweep)
+        lists = [_sweep_values(sweep[name], f"{path}.{name}") for name in names]
+        combos = 1
+        for values in lists:
+            combos *= len(values)
+        if combos > MAX_PROGRAM_STEPS:
+            raise ScenarioError(path, f"组合数 {combos} 超过上限")
+        return [dict(zip(names, values)) for values in itertools.product(*lists)]
+
+
+def compile_scenario(data, source=""):
+    """校验并编译场景（已解析的字典），返回 Scenario"""
+    if not isinstance(data, dict):
+        raise ScenarioError("<root>", "场景应为映射")
+    unknown = set(data) - {"name", "defaults", "steps", "description"}
+    if unknown:
+        raise ScenarioError("<root>", f"未知字段 {', '.join(sorted(unknown))}")
+    if "steps" not in data:
+        raise ScenarioError("<root>", "缺少 steps")
+    defaults = data.get("defaults") or {}
+    if not isinstance(defaults, dict) or set(defaults) - {"wait", "budget_ms"}:
+        raise ScenarioError("defaults", "只支持 wait 和 budget_ms")
+
+    compiler = _Compiler(defaults)
+    compiler.compile_steps(data["steps"], "steps")
+    if not compiler.program:
+        raise ScenarioError("steps", "场景中没有可执行的步骤")
+    name = data.get("name") or os.path.splitext(os.path.basename(source))[0] or "场景"
+    return Scenario(str(name), compiler.program, source)
+
+
+def load_scenario(path):
+    """读取并编译场景文件（.json，或安装了PyYAML时的 .yaml/.yml）"""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if os.path.splitext(path)[1].lower() in (".yaml", ".yml"):
+        if yaml is None:
+            raise ScenarioError(path, "读取YAML场景需要安装 PyYAML（pip install pyyaml）")
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise ScenarioError(path, f"YAML格式错误: {e}") from None
+    else:
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise ScenarioError(path, f"JSON格式错误: {e}") from None
+    return compile_scenario(data, path)
@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESP32 设备模拟器
+
+按 wifi_config_new.ino 中 setupWebServer() 注册的路由模拟固件的HTTP接口
+和UDP组播广播，用于在没有开发板的情况下测试、压测测试工具。
+
+功能特性：
+1. /api/control、/api/info、/api/discover、/api/broadcast、/status、/rgb 及HTML页面
+2. JSON格式、参数解析（toInt/toFloat）和处理顺序与固件一致
+3. 与Arduino WebServer一样一次只服务一个客户端，服务时间和抖动可配置
+4. 启用广播后每5秒向 224.0.0.1:8888 发送与 handleBroadcast 相同的设备信息，10分钟后自动关闭
+5. 单进程在回环地址上启动数千个虚拟设备
+
+用法:
+    python esp32_simulator.py --count 100 --base-ip 127.0.1.1 --port 80
+
+作者: ESP32开发团队
+版本: 1.0.0
+日期: 2025-11-06
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import random
+import socket
+import threading
+import time
+from urllib.parse import parse_qsl, urlsplit
+
+from esp32_state import DeviceState, arduino_float
+
+MULTICAST_GROUP = "224.0.0.1"
+UDP_PORT = 8888
+BROADCAST_INTERVAL = 5.0      # 固件 broadcastInterval (5秒)
+BROADCAST_TIMEOUT = 600.0     # 固件 broadcastTimeout (10分钟)
+IDENTIFY_TIME = 5.0           # handleIdentify 闪烁5次，每次1秒
+MAX_HEADER_SIZE = 8192
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found"}
+
+COLOR_NAMES = {0: "彩虹模式", 1: "红色", 2: "橙色", 3: "黄色",
+               4: "绿色", 5: "青色", 6: "蓝色", 7: "紫色"}
+
+
+def html_page(title, body):
+    """生成简化的HTML页面"""
+    return ("<!DOCTYPE html><html><head><meta charset='utf-8'><title>" + title +
+            "</title></head><body><div class='container'><h1>" + title + "</h1>" +
+            body + "</div></body></html>")
+
+
+class VirtualDevice(DeviceState):
+    """单个虚拟ESP32设备的固件状态和路由处理"""
+
+    def __init__(self, ip, port=80, device_id=None, device_name="ESP32_RGB_Device", mac=None):
+        super().__init__()
+        self.ip = ip
+        self.port = port
+        chip_id = random.getrandbits(48)
+        # 固件: String((uint32_t)(chipid >> 32), HEX) + String((uint32_t)chipid, HEX)
+        self.device_id = device_id or f"{chip_id >> 32:x}{chip_id & 0xFFFFFFFF:x}"
+        self.device_name = device_name
+        self.mac_address = mac or ":".join(f"{(chip_id >> (8 * i)) & 0xFF:02X}" for i in range(6))
+
+        # 与固件全局变量同名同默认值（灯光状态见 DeviceState）
+        self.wifi_connected = True
+        self.broadcast_start_time = 0.0
+        self.last_broadcast = None
+
+        # 一次只处理一个客户端
+        self.lock = None
+        self.requests_handled = 0
+        self.announcements_sent = 0
+        self.udp_socket = None
+
+    @property
+    def address(self):
+        """客户端使用的地址（非80端口时带端口号）"""
+        return self.ip if self.port == 80 else f"{self.ip}:{self.port}"
+
+    # ---------- 路由 ----------
+
+    def handle(self, path, args):
+        """处理请求，返回 (状态码, Content-Type, 响应体, 响应前阻塞秒数, 响应后阻塞秒数)"""
+        route = {
+            "/": self.handle_root,
+            "/setwifi": self.handle_set_wifi,
+            "/scan": self.handle_wifi_scan,
+            "/control": self.handle_rgb_control,
+            "/rgb": self.handle_rgb_api,
+            "/status": self.handle_status,
+            "/identify": self.handle_identify,
+            "/api/control": self.handle_api_control,
+            "/api/info": self.handle_api_info,
+            "/api/discover": self.handle_discover,
+            "/api/broadcast": self.handle_broadcast_api,
+            "/broadcast": self.handle_broadcast_web,
+            "/hsv": self.handle_hsv_picker,
+        }.get(path)
+        self.requests_handled += 1
+        if route is None:
+            return 404, "text/plain", "页面未找到", 0.0, 0.0
+        result = route(args)
+        if len(result) == 3:
+            return result + (0.0, 0.0)
+        return result
+
+    def handle_api_control(self, args):
+        """handleApiControl：按固件顺序处理 hue/saturation/value/color/brightness/duration/power"""
+        updated, delay = self.apply_control(args)
+        if updated:
+            return (200, "application/json",
+                    "{\"status\":\"success\",\"message\":\"RGB设置已更新\"}", delay, 0.0)
+        return (400, "application/json",
+                "{\"status\":\"error\",\"message\":\"缺少有效参数\"}", delay, 0.0)
+
+    def handle_rgb_api(self, args):
+        """handleRgbApi：/rgb 接口（power/color/brightness）"""
+        if self.apply_rgb(args):
+            return 200, "text/plain", "RGB设置已更新"
+        return 400, "text/plain", "缺少有效参数"
+
+    def info_json(self):
+        """handleApiInfo 的JSON（字段顺序和数字格式与固件一致）"""
+        b = lambda flag: "true" if flag else "false"
+        return ("{"
+                "\"device_id\":\"" + self.device_id + "\","
+                "\"device_name\":\"" + self.device_name + "\","
+                "\"ip_address\":\"" + self.ip + "\","
+                "\"mac_address\":\"" + self.mac_address + "\","
+                "\"wifi_status\":" + b(self.wifi_connected) + ","
+                "\"rgb_enabled\":" + b(self.rgb_enabled) + ","
+                "\"rgb_color\":" + str(self.current_rgb_color) + ","
+                "\"rgb_brightness\":" + str(self.rgb_brightness) + ","
+                "\"hsv_mode\":" + b(self.use_hsv_mode) + ","
+                "\"hsv_hue\":" + arduino_float(self.hsv_hue) + ","
+                "\"hsv_saturation\":" + arduino_float(self.hsv_saturation) + ","
+                "\"hsv_value\":" + arduino_float(self.hsv_value) + ","
+                "\"broadcast_enabled\":" + b(self.broadcast_enabled) +
+                "}")
+
+    def handle_api_info(self, args):
+        return 200, "application/json", self.info_json()
+
+    def handle_discover(self, args):
+        """handleDiscover"""
+        body = ("{"
+                "\"device_id\":\"" + self.device_id + "\","
+                "\"device_name\":\"" + self.device_name + "\","
+                "\"ip_address\":\"" + self.ip + "\","
+                "\"mac_address\":\"" + self.mac_address + "\","
+                "\"broadcast_enabled\":" + ("true" if self.broadcast_enabled else "false") +
+                "}")
+        return 200, "application/json", body
+
+    def handle_broadcast_api(self, args):
+        """handleBroadcastApi"""
+        if "action" not in args:
+            return 400, "application/json", "{\"status\":\"error\",\"message\":\"缺少action参数\"}"
+        action = args["action"]
+        if action == "enable":
+            self.enable_broadcast()
+            return 200, "application/json", "{\"status\":\"success\",\"message\":\"UDP广播已启用\"}"
+        if action == "disable":
+            self.broadcast_enabled = False
+            return 200, "application/json", "{\"status\":\"success\",\"message\":\"UDP广播已禁用\"}"
+        return 400, "application/json", "{\"status\":\"error\",\"message\":\"无效的操作参数\"}"
+
+    def enable_broadcast(self):
+        """enableBroadcast：已启用时不重置计时"""
+        if not self.broadcast_enabled:
+            self.broadcast_enabled = True
+            self.broadcast_start_time = time.monotonic()
+            self.last_broadcast = None  # 立即发送第一次广播
+
+    def handle_identify(self, args):
+        """handleIdentify：先响应，再闪烁5秒（期间不处理其他请求）"""
+        return 200, "text/plain", "设备识别中...请观察RGB灯闪烁", 0.0, IDENTIFY_TIME
+
+    def handle_status(self, args):
+        """handleStatus"""
+        status = "<div>"
+        status += "<p><strong>WiFi状态:</strong> " + ("已连接" if self.wifi_connected else "未连接") + "</p>"
+        if self.wifi_connected:
+            status += "<p><strong>SSID:</strong> SIMULATOR</p>"
+            status += "<p><strong>IP地址:</strong> " + self.ip + "</p>"
+        status += "<p><strong>LED控制:</strong> 系统状态模式</p>"
+        status += "<p><strong>LED模式:</strong> 常亮（连接成功）</p>"
+        status += "<p><strong>RGB状态:</strong> " + ("开启" if self.rgb_enabled else "关闭") + "</p>"
+        if self.rgb_enabled:
+            status += "<p><strong>RGB颜色:</strong> " + COLOR_NAMES.get(self.current_rgb_color, "未知") + "</p>"
+        status += "<p><strong>RGB亮度:</strong> " + str(self.rgb_brightness) + "%</p>"
+        status += "<p><strong>设备ID:</strong> " + self.device_id + "</p>"
+        status += "<p><strong>设备名称:</strong> " + self.device_name + "</p>"
+        status += "<p><strong>BLE状态:</strong> 等待连接</p>"
+        status += "<p><strong>UDP广播状态:</strong> " + ("启用中" if self.broadcast_enabled else "已关闭") + "</p>"
+        if self.broadcast_enabled:
+            remaining = BROADCAST_TIMEOUT - (time.monotonic() - self.broadcast_start_time)
+            status += "<p><strong>广播剩余时间:</strong> " + str(max(0, int(remaining))) + "秒</p>"
+        status += "</div>"
+        return 200, "text/html", status
+
+    def handle_root(self, args):
+        body = ("<p>设备ID: " + self.device_id + "</p>"
+                "<p>BLE设备名称: ESP32-" + self.device_id[:4] + "</p>"
+                "<p>UDP广播状态: " + ("启用中" if self.broadcast_enabled else "已关闭") + "</p>")
+        return 200, "text/html", html_page("ESP32 WiFi配置", body)
+
+    def handle_set_wifi(self, args):
+        return 200, "text/html", html_page("WiFi配置", "<p>模拟器不支持配网</p>")
+
+    def handle_wifi_scan(self, args):
+        return 200, "text/html", html_page("WiFi扫描结果", "<table></table>")
+
+    def handle_rgb_control(self, args):
+        return 200, "text/html", html_page("RGB灯控制", "")
+
+    def handle_broadcast_web(self, args):
+        body = "<p>UDP广播状态: " + ("启用中" if self.broadcast_enabled else "已关闭") + "</p>"
+        return 200, "text/html", html_page("UDP广播控制", body)
+
+    def handle_hsv_picker(self, args):
+        return 200, "text/html", html_page("HSV调光板", "")
+
+    # ---------- UDP广播 ----------
+
+    def announcement(self):
+        """handleBroadcast/broadcastIP 发送的JSON"""
+        return ("{"
+                "\"device_id\":\"" + self.device_id + "\","
+                "\"device_name\":\"" + self.device_name + "\","
+                "\"ip_address\":\"" + self.ip + "\","
+                "\"mac_address\":\"" + self.mac_address + "\""
+                "}")
+
+    def poll_broadcast(self, now):
+        """handleBroadcast：超时关闭，到期发送一次组播"""
+        if not self.broadcast_enabled:
+            return
+        if now - self.broadcast_start_time > BROADCAST_TIMEOUT:
+            self.broadcast_enabled = False
+            return
+        if self.last_broadcast is None or now - self.last_broadcast > BROADCAST_INTERVAL:
+            self.send_announcement()
+            self.last_broadcast = now
+
+    def send_announcement(self):
+        """以设备IP为源地址发送组播"""
+        if self.udp_socket is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            sock.bind((self.ip, 0))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(self.ip))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+            self.udp_socket = sock
+        try:
+            self.udp_socket.sendto(self.announcement().encode("utf-8"), (MULTICAST_GROUP, UDP_PORT))
+            self.announcements_sent += 1
+        except OSError:
+            pass
+
+    def close(self):
+        if self.udp_socket is not None:
+            self.udp_socket.close()
+            self.udp_socket = None
+
+
+def allocate_addresses(base_ip, count):
+    """从 base_ip 开始分配 count 个地址（跳过 .0 和 .255）"""
+    addresses = []
+    current = ipaddress.IPv4Address(base_ip)
+    while len(addresses) < count:
+        last_octet = int(current) & 0xFF
+        if last_octet not in (0, 255):
+            addresses.append(str(current))
+        current += 1
+    return addresses
+
+
+class DeviceSimulator:
+    """在一个进程内运行多个虚拟设备"""
+
+    def __init__(self, count=1, base_ip="127.0.1.1", port=80, service_time=0.005,
+                 jitter=0.002, keep_alive=False, broadcast=False):
+        self.port = port
+        self.service_time = service_time
+        self.jitter = jitter
+        # Arduino WebServer 每个响应都带 Connection: close
+        self.keep_alive = keep_alive
+        self.devices = [VirtualDevice(ip, port) for ip in allocate_addresses(base_ip, count)]
+        self.by_ip = {device.ip: device for device in self.devices}
+        if broadcast:
+            for device in self.devices:
+                device.enable_broadcast()
+
+        self.loop = None
+        self._servers = []
+        self._thread = None
+        self._ready = threading.Event()
+        self._stopping = None
+
+    @property
+    def addresses(self):
+        return [device.address for device in self.devices]
+
+    def _service_delay(self):
+        """单次请求的服务时间"""
+        if self.jitter <= 0:
+            return max(0.0, self.service_time)
+        return max(0.0, random.gauss(self.service_time, self.jitter))
+
+    async def _handle_connection(self, device, reader, writer):
+        """处理一个TCP连接"""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    return
+                request_line, _, header_block = head.decode("latin-1").partition("\r\n")
+                parts = request_line.split(" ")
+                if len(parts) < 2:
+                    return
+                method, target = parts[0], parts[1]
+
+                headers = {}
+                for line in header_block.split("\r\n"):
+                    name, sep, value = line.partition(":")
+                    if sep:
+                        headers[name.strip().lower()] = value.strip()
+                body = b""
+                length = int(headers.get("content-length", "0") or 0)
+                if length:
+                    body = await reader.readexactly(length)
+
+                url = urlsplit(target)
+                args = {}
+                # Arduino arg(name) 返回第一个同名参数
+                pairs = parse_qsl(url.query, keep_blank_values=True)
+                if method == "POST" and body:
+                    pairs += parse_qsl(body.decode("utf-8", "replace"), keep_blank_values=True)
+                for key, value in pairs:
+                    args.setdefault(key, value)
+
+                async with device.lock:
+                    await asyncio.sleep(self._service_delay())
+                    status, content_type, text, before, after = device.handle(url.path, args)
+                    if before:
+                        await asyncio.sleep(before)
+                    payload = text.encode("utf-8")
+                    connection = "keep-alive" if self.keep_alive else "close"
+                    writer.write((f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                                  f"Content-Type: {content_type}\r\n"
+                                  f"Content-Length: {len(payload)}\r\n"
+                                  f"Connection: {connection}\r\n\r\n").encode("latin-1") + payload)
+                    await writer.drain()
+                    if after:
+                        await asyncio.sleep(after)
+
+                if not self.keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _broadcast_loop(self):
+        """周期检查各设备的广播状态"""
+        while True:
+            now = time.monotonic()
+            for device in self.devices:
+                device.poll_broadcast(now)
+            await asyncio.sleep(0.1)
+
+    async def start_async(self):
+        """在当前事件循环中启动所有虚拟设备"""
+        self.loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        for device in self.devices:
+            device.lock = asyncio.Lock()
+            server = await asyncio.start_server(
+                lambda r, w, d=device: self._handle_connection(d, r, w),
+                host=device.ip, port=self.port, backlog=64, limit=MAX_HEADER_SIZE)
+            self._servers.append(server)
+        self._broadcast_task = asyncio.ensure_future(self._broadcast_loop())
+
+    async def serve_async(self):
+        """运行直到 stop() 被调用"""
+        await self.start_async()
+        self._ready.set()
+        await self._stopping.wait()
+        self._broadcast_task.cancel()
+        for server in self._servers:
+            server.close()
+        for device in self.devices:
+            device.close()
+
+    def start(self):
+        """在后台线程中运行，返回后设备已可访问"""
+        raise_fd_limit(len(self.devices) * 2 + 256)
+        self._thread = threading.Thread(target=lambda: asyncio.run(self.serve_async()), daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        """停止后台线程"""
+        if self.loop is not None and self._stopping is not None:
+            self.loop.call_soon_threadsafe(self._stopping.set)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def raise_fd_limit(needed):
+    """需要时提高文件描述符软限制（每个虚拟设备占用一个监听套接字）"""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ESP32 设备模拟器")
+    parser.add_argument("--count", type=int, default=1, help="虚拟设备数量")
+    parser.add_argument("--base-ip", default="127.0.1.1", help="第一个设备的回环地址")
+    parser.add_argument("--port", type=int, default=80, help="HTTP端口（默认80，与固件一致）")
+    parser.add_argument("--service-time", type=float, default=0.005, help="每个请求的服务时间（秒）")
+    parser.add_argument("--jitter", type=float, default=0.002, help="服务时间抖动（标准差，秒）")
+    parser.add_argument("--keep-alive", action="store_true", help="保持连接（固件默认每次关闭连接）")
+    parser.add_argument("--broadcast", action="store_true", help="启动时启用UDP广播")
+    args = parser.parse_args(argv)
+
+    simulator = DeviceSimulator(args.count, args.base_ip, args.port, args.service_time,
+                                args.jitter, args.keep_alive, args.broadcast)
+    raise_fd_limit(args.count * 2 + 256)
+    devices = simulator.devices
+    print(f"启动 {len(devices)} 个虚拟设备: {devices[0].address} ... {devices[-1].address}")
+    try:
+        asyncio.run(simulator.serve_async())
+    except KeyboardInterrupt:
+        print("模拟器已停止")
+
+
+if __name__ == "__main__":
+    main()
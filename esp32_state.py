@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESP32 设备状态模型
+
+功能特性：
+1. 与固件一致的参数解析（String::toInt/toFloat）和灯光状态更新规则
+   （handleApiControl / handleRgbApi），模拟器和客户端镜像共用
+2. 客户端状态镜像：命令成功后乐观更新，定期用 /api/info 校准
+3. 判断命令是否会改变设备状态，不会改变的命令可以不发送
+4. 记录变化的字段，界面只重绘变化的部分
+5. 合并命令：把同一设备的多个 /api/control 参数组合合并成尽量少的请求，
+   按顺序发送后设备状态与逐个发送相同
+
+作者: ESP32开发团队
+版本: 1.0.0
+日期: 2025-11-06
+"""
+
+import re
+import threading
+import time
+from urllib.parse import parse_qsl
+
+# 状态属性 -> /api/info 字段
+INFO_FIELDS = (
+    ("rgb_enabled", "rgb_enabled"),
+    ("current_rgb_color", "rgb_color"),
+    ("rgb_brightness", "rgb_brightness"),
+    ("use_hsv_mode", "hsv_mode"),
+    ("hsv_hue", "hsv_hue"),
+    ("hsv_saturation", "hsv_saturation"),
+    ("hsv_value", "hsv_value"),
+    ("broadcast_enabled", "broadcast_enabled"),
+)
+FLOAT_FIELDS = ("hsv_hue", "hsv_saturation", "hsv_value")
+
+# handleApiControl 处理参数的顺序
+CONTROL_ORDER = ("hue", "saturation", "value", "color", "brightness", "duration", "power")
+HSV_PARAMS = ("hue", "saturation", "value")
+
+
+def arduino_to_int(text):
+    """模拟 Arduino String::toInt()（atol，解析开头的整数，失败为0）"""
+    match = re.match(r'\s*[+-]?\d+', text)
+    return int(match.group()) if match else 0
+
+
+def arduino_to_float(text):
+    """模拟 Arduino String::toFloat()（atof，解析开头的数字，失败为0）"""
+    match = re.match(r'\s*[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?', text)
+    return float(match.group()) if match else 0.0
+
+
+def arduino_float(value):
+    """模拟 Arduino String(float)，保留两位小数"""
+    return f"{value:.2f}"
+
+
+def query_args(params):
+    """把控制参数转换为固件收到的字符串参数（与 DeviceClient 的编码一致）"""
+    from esp32_client import build_query
+
+    return dict(parse_qsl(build_query(params), keep_blank_values=True))
+
+
+class DeviceState:
+    """固件灯光状态（属性与固件全局变量同名同默认值）"""
+
+    def __init__(self):
+        self.rgb_enabled = True
+        self.current_rgb_color = 0
+        self.rgb_brightness = 50
+        self.hsv_hue = 0.0
+        self.hsv_saturation = 100.0
+        self.hsv_value = 100.0
+        self.use_hsv_mode = False
+        self.broadcast_enabled = False
+
+    def apply_control(self, args):
+        """handleApiControl：按固件顺序处理 hue/saturation/value/color/brightness/duration/power
+
+        args 为字符串参数字典，返回 (是否有有效参数, 固件阻塞的秒数)
+        """
+        updated = False
+        delay = 0.0
+
+        if "hue" in args:
+            hue = arduino_to_float(args["hue"])
+            if 0 <= hue <= 360:
+                self.hsv_hue = hue
+                self.use_hsv_mode = True
+                updated = True
+
+        if "saturation" in args:
+            saturation = arduino_to_float(args["saturation"])
+            if 0 <= saturation <= 100:
+                self.hsv_saturation = saturation
+                self.use_hsv_mode = True
+                updated = True
+
+        if "value" in args:
+            value = arduino_to_float(args["value"])
+            if 0 <= value <= 100:
+                self.hsv_value = value
+                self.use_hsv_mode = True
+                updated = True
+
+        if "color" in args:
+            color = arduino_to_int(args["color"])
+            if -1 <= color <= 7:
+                self.current_rgb_color = color
+                self.use_hsv_mode = False
+                updated = True
+
+        if "brightness" in args:
+            brightness = arduino_to_int(args["brightness"])
+            if 0 <= brightness <= 100:
+                self.rgb_brightness = brightness
+                updated = True
+
+        if "duration" in args:
+            duration = arduino_to_int(args["duration"])
+            if duration > 0:
+                # 固件在处理函数内 delay(duration)，期间无法响应其他请求
+                if "color" in args or "brightness" in args or "hue" in args:
+                    delay = duration / 1000.0
+                updated = True
+
+        if "power" in args:
+            power = args["power"]
+            if power == "on":
+                self.rgb_enabled = True
+                updated = True
+            elif power == "off":
+                self.rgb_enabled = False
+                updated = True
+
+        return updated, delay
+
+    def apply_rgb(self, args):
+        """handleRgbApi：/rgb 接口（power/color/brightness），返回是否有有效参数"""
+        updated = False
+
+        if "power" in args:
+            power = args["power"]
+            if power == "on":
+                self.rgb_enabled = True
+                updated = True
+            elif power == "off":
+                self.rgb_enabled = False
+                updated = True
+
+        if "color" in args:
+            color = arduino_to_int(args["color"])
+            if -1 <= color <= 7:
+                self.current_rgb_color = color
+                updated = True
+
+        if "brightness" in args:
+            brightness = arduino_to_int(args["brightness"])
+            if 0 <= brightness <= 100:
+                self.rgb_brightness = brightness
+                updated = True
+
+        return updated
+
+    def info_fields(self):
+        """当前状态对应的 /api/info 字段（浮点数与固件一样保留两位小数）"""
+        fields = {}
+        for attr, field in INFO_FIELDS:
+            value = getattr(self, attr)
+            fields[field] = round(value, 2) if attr in FLOAT_FIELDS else value
+        return fields
+
+    def load_info(self, info):
+        """用 /api/info 的内容设置状态（缺少的字段保持不变）"""
+        for attr, field in INFO_FIELDS:
+            if field in info:
+                value = info[field]
+                setattr(self, attr, float(value) if attr in FLOAT_FIELDS else value)
+
+    def copy(self):
+        state = DeviceState.__new__(DeviceState)
+        for attr, _ in INFO_FIELDS:
+            setattr(state, attr, getattr(self, attr))
+        return state
+
+
+class DeviceMirror:
+    """客户端设备状态镜像（线程安全）"""
+
+    def __init__(self):
+        self.state = DeviceState()
+        self.static_info = {}    # device_id、ip_address 等不随命令变化的字段
+        self.known = False       # 是否已经用 /api/info 校准过
+        self.last_sync = None
+        self.suppressed = 0      # 因状态未变化而跳过的命令数
+        self._changed = set()
+        self._lock = threading.Lock()
+
+    def _record_changes(self, before):
+        after = self.state.info_fields()
+        self._changed.update(k for k, v in after.items() if before.get(k) != v)
+
+    def is_redundant(self, params):
+        """命令是否不会改变设备状态（镜像未校准或带 duration 时总是发送）"""
+        if "duration" in params:
+            return False
+        args = query_args(params)
+        with self._lock:
+            if not self.known:
+                return False
+            predicted = self.state.copy()
+            updated, _ = predicted.apply_control(args)
+            # 无效参数仍然发送，让设备返回错误
+            redundant = updated and predicted.info_fields() == self.state.info_fields()
+            if redundant:
+                self.suppressed += 1
+            return redundant
+
+    def apply_control(self, params):
+        """/api/control 成功后乐观更新"""
+        args = query_args(params)
+        with self._lock:
+            before = self.state.info_fields()
+            self.state.apply_control(args)
+            self._record_changes(before)
+
+    def apply_broadcast(self, action):
+        """/api/broadcast 成功后乐观更新"""
+        with self._lock:
+            before = self.state.info_fields()
+            if action in ("enable", "disable"):
+                self.state.broadcast_enabled = action == "enable"
+            self._record_changes(before)
+
+    def reconcile(self, info):
+        """用 /api/info 校准镜像，返回与镜像不一致的字段列表"""
+        with self._lock:
+            before = self.state.info_fields()
+            drift = []
+            if self.known:
+                drift = [field for _, field in INFO_FIELDS
+                         if field in info and before[field] != info[field]]
+            self.state.load_info(info)
+            static = {k: v for k, v in info.items() if k not in before}
+            self._changed.update(k for k, v in static.items() if self.static_info.get(k) != v)
+            self.static_info = static
+            self._record_changes(before)
+            self.known = True
+            self.last_sync = time.monotonic()
+            return drift
+
+    def info(self):
+        """镜像中的设备信息（与 /api/info 字段顺序一致）"""
+        with self._lock:
+            info = dict(self.static_info)
+            info.update(self.state.info_fields())
+        return info
+
+    def drain_changes(self):
+        """取出上次调用以来变化的字段名"""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+        return changed
+
+
+def _valid_param(key, value):
+    """单个参数是否会被固件接受（只接受 duration 以外的已知参数）"""
+    if key not in CONTROL_ORDER or key == "duration":
+        return False
+    updated, _ = DeviceState().apply_control(query_args({key: value}))
+    return updated
+
+
+def _merge_segment(segment):
+    """合并一段不含屏障的命令，返回 1 或 2 个请求
+
+    每个参数取最后一次的值；HSV模式由最后出现的 HSV 参数或 color 决定。
+    固件在同一请求中先处理 HSV 参数再处理 color，所以最后是 HSV 参数而前面出现过
+    color 时，color 单独放在前一个请求中。
+    """
+    latest = {}
+    mode = None
+    for params in segment:
+        for key in CONTROL_ORDER:
+            if key in params:
+                latest[key] = params[key]
+                if key in HSV_PARAMS:
+                    mode = "hsv"
+                elif key == "color":
+                    mode = "color"
+    if not latest:
+        return []
+    requests = []
+    if mode == "hsv" and "color" in latest:
+        requests.append({"color": latest.pop("color")})
+    requests.append({key: latest[key] for key in CONTROL_ORDER if key in latest})
+    return requests
+
+
+class CommandBuilder:
+    """把同一设备的多个 /api/control 参数组合合并成尽量少的请求
+
+    命令按加入顺序生效。build() 返回的请求按顺序发送后，设备状态（/api/info 的灯光字段）
+    与逐个发送全部命令相同：
+    - 每个参数取最后一次的值，power 与其他参数相互独立（固件最后处理 power）
+    - 最后决定HSV模式的是 HSV 参数而之前出现过 color 时需要两个请求，其余情况一个请求
+    - 带 duration（固件阻塞并在结束后熄灯）、未知参数或无效值的命令是屏障：
+      原样单独发送，前后的命令不跨过它合并，设备对它的应答（如400）保持不变
+    """
+
+    def __init__(self, commands=()):
+        self._commands = []
+        for params in commands:
+            self.add(**params)
+
+    def add(self, **params):
+        """加入一条命令（值为None的参数忽略），返回自身以便连续调用"""
+        params = {key: value for key, value in params.items() if value is not None}
+        if params:
+            self._commands.append(params)
+        return self
+
+    def clear(self):
+        self._commands = []
+
+    def __len__(self):
+        return len(self._commands)
+
+    def build(self):
+        """合并后的请求参数列表（按顺序发送）"""
+        requests = []
+        segment = []
+        for params in self._commands:
+            if all(_valid_param(key, value) for key, value in params.items()):
+                segment.append(params)
+                continue
+            requests.extend(_merge_segment(segment))
+            segment = []
+            requests.append(dict(params))
+        requests.extend(_merge_segment(segment))
+        return requests
+
+
+def apply_sequence(state, commands):
+    """把命令逐个应用到状态上（模拟逐个发送），返回状态"""
+    for params in commands:
+        state.apply_control(query_args(params))
+    return state
+
+
+def combined_mismatch(commands, state=None):
+    """对比逐个发送和合并发送后的状态，返回不一致的 /api/info 字段（一致时为空列表）"""
+    state = state or DeviceState()
+    sequential = apply_sequence(state.copy(), commands).info_fields()
+    combined = apply_sequence(state.copy(), CommandBuilder(commands).build()).info_fields()
+    return [field for field in sequential if sequential[field] != combined[field]]
+
+
+def random_commands(rng, count, invalid=0.1, duration=0.05):
+    """随机的控制命令序列（含无效值和少量 duration），用于验证 CommandBuilder"""
+    commands = []
+    for _ in range(count):
+        params = {}
+        for key in rng.sample(("hue", "saturation", "value", "color", "brightness", "power"),
+                              rng.randint(1, 3)):
+            if rng.random() < invalid:
+                params[key] = {"hue": 400, "saturation": -5, "value": 101, "color": 9,
+                               "brightness": 150, "power": "toggle"}[key]
+            elif key == "hue":
+                params[key] = rng.choice((rng.randint(0, 360), round(rng.uniform(0, 360), 2)))
+            elif key in ("saturation", "value", "brightness"):
+                params[key] = rng.randint(0, 100)
+            elif key == "color":
+                params[key] = rng.randint(-1, 7)
+            else:
+                params[key] = rng.choice(("on", "off"))
+        if rng.random() < duration:
+            params["duration"] = 1
+        commands.append(params)
+    return commands
+
+
+def random_state(rng):
+    """随机的设备灯光状态"""
+    state = DeviceState()
+    state.rgb_enabled = rng.random() < 0.5
+    state.current_rgb_color = rng.randint(-1, 7)
+    state.rgb_brightness = rng.randint(0, 100)
+    state.hsv_hue = float(rng.randint(0, 360))
+    state.hsv_saturation = float(rng.randint(0, 100))
+    state.hsv_value = float(rng.randint(0, 100))
+    state.use_hsv_mode = rng.random() < 0.5
+    return state
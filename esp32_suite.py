@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESP32 设备群完整测试调度
+
+功能特性：
+1. 在多台设备上同时运行完整测试序列，总耗时接近单台设备的耗时
+2. 每台设备同一时间只有一个在途请求，全部设备共享一个全局并发上限
+3. 在引擎事件循环中运行：每台设备一个协程，步骤之间的等待不占用线程
+4. 每台设备有总超时，连续失败达到上限时放弃该设备，不影响其他设备
+5. 步骤可以带 /api/info 字段断言和延迟预算，超出预算记为失败
+6. 汇总每台设备的通过/失败和请求延迟
+7. stop() 或取消协程时立即中断在途请求，已完成的步骤仍然返回
+
+作者: ESP32开发团队
+版本: 1.0.0
+日期: 2025-11-06
+"""
+
+import asyncio
+import time
+from collections import namedtuple
+
+import esp32_trace
+from esp32_bench import LatencyHistogram
+
+DEFAULT_CONCURRENCY = 64
+DEFAULT_DEVICE_TIMEOUT = 60.0
+DEFAULT_MAX_FAILURES = 3   # 连续失败达到该次数时放弃该设备的剩余步骤
+
+# 数值断言的容差（固件浮点数保留两位小数）
+EXPECT_TOLERANCE = 0.01
+
+# 测试步骤: 名称, AsyncDeviceClient 方法名, 位置参数, 关键字参数, 完成后等待的秒数,
+# 响应JSON字段断言（字段 -> 值 或 {"min": x, "max": y}）, 延迟预算（秒）
+SuiteStep = namedtuple("SuiteStep", ["name", "method", "args", "kwargs", "wait", "expect", "budget"],
+                       defaults=(None, None))
+
+# 单个步骤的结果
+StepResult = namedtuple("StepResult", ["name", "ok", "status", "latency", "error"])
+
+
+def full_test_steps(delay=0.5, broadcast_wait=2.0, colors=None, hsv_points=None):
+    """完整测试序列（与 TesterEngine.run_full_test 相同的步骤）"""
+    from esp32_core import COLOR_SEQUENCE, FULL_TEST_HSV_POINTS
+
+    steps = [SuiteStep("基础连接测试", "info", (), {}, 0.0)]
+    for color in colors or COLOR_SEQUENCE:
+        steps.append(SuiteStep(f"颜色{color}测试", "control", (), {"color": color}, delay))
+    for hue, sat, val in hsv_points or FULL_TEST_HSV_POINTS:
+        steps.append(SuiteStep(f"HSV测试 H{hue}° S{sat}% V{val}%", "control", (),
+                               {"hue": hue, "saturation": sat, "value": val}, delay))
+    steps.append(SuiteStep("启用广播", "broadcast", ("enable",), {}, broadcast_wait))
+    steps.append(SuiteStep("禁用广播", "broadcast", ("disable",), {}, 0.0))
+    return steps
+
+
+def check_expect(data, expect):
+    """检查响应字段，返回第一个不满足的断言描述，全部满足时返回空字符串"""
+    for field, expected in expect.items():
+        if field not in data:
+            return f"缺少字段 {field}"
+        actual = data[field]
+        if isinstance(expected, dict):
+            low, high = expected.get("min"), expected.get("max")
+            if not isinstance(actual, (int, float)) or isinstance(actual, bool) \
+                    or (low is not None and actual < low) or (high is not None and actual > high):
+                return f"{field}={actual!r} 不在范围 [{low}, {high}]"
+        elif isinstance(expected, (int, float)) and not isinstance(expected, bool) \
+                and isinstance(actual, (int, float)) and not isinstance(actual, bool):
+            if abs(actual - expected) > EXPECT_TOLERANCE:
+                return f"{field}={actual!r}，期望 {expected!r}"
+        elif actual != expected:
+            return f"{field}={actual!r}，期望 {expected!r}"
+    return ""
+
+
+class DeviceRun:
+    """一台设备的测试过程和结果"""
+
+    def __init__(self, ip, total_steps):
+        self.ip = ip
+        self.total_steps = total_steps
+        self.results = []
+        self.latency = LatencyHistogram()
+        self.aborted = ""          # 提前结束的原因
+        self.started = None
+        self.finished = None
+        self.failures_in_row = 0
+
+    @property
+    def passed(self):
+        return sum(1 for r in self.results if r.ok)
+
+    @property
+    def failed(self):
+        return len(self.results) - self.passed
+
+    @property
+    def ok(self):
+        return not self.aborted and self.failed == 0 and len(self.results) == self.total_steps
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+    def first_error(self):
+        if self.aborted:
+            return self.aborted
+        for r in self.results:
+            if not r.ok:
+                return f"{r.name}: {r.error}"
+        return ""
+
+
+class SuiteRunner:
+    """在多台设备上并发运行测试步骤
+
+    get_client(ip) 返回该设备的 AsyncDeviceClient；每台设备一个协程按顺序执行步骤，
+    全部设备共享 concurrency 个在途请求。run 是协程；每次运行使用新的 SuiteRunner，
+    stop() 之后（包括 run 开始之前调用）不再执行新的步骤。
+    """
+
+    def __init__(self, get_client, concurrency=DEFAULT_CONCURRENCY,
+                 device_timeout=DEFAULT_DEVICE_TIMEOUT, max_failures=DEFAULT_MAX_FAILURES):
+        self.get_client = get_client
+        self.concurrency = concurrency
+        self.device_timeout = device_timeout
+        self.max_failures = max_failures
+        self._stopped = False
+        self._loop = None
+        self._tasks = []
+
+    def stop(self):
+        """停止运行（可在任意线程调用）：取消全部设备协程，在途请求立即中断"""
+        self._stopped = True
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._cancel_devices)
+
+    def _cancel_devices(self):
+        for task in self._tasks:
+            task.cancel()
+
+    async def _execute(self, ip, step):
+        with esp32_trace.span(step.name, "suite", {"ip": ip}):
+            return await self._execute_step(ip, step)
+
+    async def _execute_step(self, ip, step):
+        start = time.perf_counter()
+        try:
+            response = await getattr(self.get_client(ip), step.method)(*step.args, **step.kwargs)
+        except Exception as e:
+            return StepResult(step.name, False, None, time.perf_counter() - start, str(e))
+        timing = getattr(response, "timing", None)
+        latency = timing.total if timing else time.perf_counter() - start
+        status = response.status_code
+        if status != 200:
+            return StepResult(step.name, False, status, latency, f"HTTP {status}")
+        if step.budget is not None and latency > step.budget:
+            return StepResult(step.name, False, status, latency,
+                              f"超出延迟预算 {latency * 1000:.1f}ms > {step.budget * 1000:g}ms")
+        if step.expect:
+            try:
+                data = response.json()
+            except ValueError:
+                return StepResult(step.name, False, status, latency, "响应不是JSON")
+            error = check_expect(data, step.expect)
+            if error:
+                return StepResult(step.name, False, status, latency, f"断言失败: {error}")
+        return StepResult(step.name, True, status, latency, "")
+
+    async def run(self, ips, steps, on_step=None, on_device=None):
+        """运行到所有设备完成，按输入顺序返回 [DeviceRun, ...]
+
+        on_step(ip, step, StepResult) 和 on_device(DeviceRun) 在事件循环中调用。
+        取消该协程时各设备记为“已停止”（仍调用 on_device），然后抛出 CancelledError。
+        """
+        steps = list(steps)
+        runs = [DeviceRun(ip, len(steps)) for ip in dict.fromkeys(ips)]
+        self._loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        self._tasks = [asyncio.ensure_future(self._run_device(run, steps, semaphore, on_step, on_device))
+                       for run in runs]
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            self._tasks = []
+            self._loop = None
+        return runs
+
+    async def _run_device(self, run, steps, semaphore, on_step, on_device):
+        """一台设备的全部步骤（总超时、停止和取消都在这里结束该设备）"""
+        run.started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._run_steps(run, steps, semaphore, on_step),
+                                   self.device_timeout)
+        except asyncio.TimeoutError:
+            run.aborted = f"超时（{self.device_timeout:g}秒）"
+        except asyncio.CancelledError:
+            # 由 stop() 或外层取消引起；外层取消时 gather 仍会抛出 CancelledError
+            run.aborted = "已停止"
+        run.finished = time.monotonic()
+        if on_device:
+            on_device(run)
+
+    async def _run_steps(self, run, steps, semaphore, on_step):
+        for i, step in enumerate(steps):
+            if self._stopped:
+                run.aborted = "已停止"
+                return
+            async with semaphore:
+                result = await self._execute(run.ip, step)
+            run.results.append(result)
+            run.latency.record(result.latency)
+            if on_step:
+                on_step(run.ip, step, result)
+
+            run.failures_in_row = 0 if result.ok else run.failures_in_row + 1
+            if run.failures_in_row >= self.max_failures:
+                run.aborted = f"连续 {run.failures_in_row} 个步骤失败"
+                return
+            if step.wait and i + 1 < len(steps):
+                await asyncio.sleep(step.wait)
+
+
+def summarize_runs(runs):
+    """汇总: (通过设备数, 失败设备数, 全部请求的延迟直方图)"""
+    latency = LatencyHistogram()
+    passed = 0
+    for run in runs:
+        latency.merge(run.latency)
+        if run.ok:
+            passed += 1
+    return passed, len(runs) - passed, latency
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESP32 测试工具性能追踪
+
+功能特性：
+1. 按需开启的 span / counter / instant 接口，记录到内存中的有界事件缓冲区
+2. 未开启时每个埋点只有一次全局变量检查，几乎没有开销
+3. 导出 Chrome trace-event JSON，可以直接在 Perfetto（ui.perfetto.dev）
+   或 chrome://tracing 中打开
+4. 设备请求带连接/首字节/总耗时分段，界面回调和工作线程任务按线程分行显示，
+   便于区分界面卡顿、设备处理耗时和网络耗时
+
+用法：
+    import esp32_trace
+
+    esp32_trace.start()
+    with esp32_trace.span("扫描", "worker"):
+        ...
+    esp32_trace.stop().export("trace.json")
+
+作者: ESP32开发团队
+版本: 1.0.0
+日期: 2025-11-06
+"""
+
+import asyncio
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+DEFAULT_MAX_EVENTS = 1000000
+
+# 当前的追踪器，None 表示未开启（埋点只检查这个变量）
+_tracer = None
+
+
+class Tracer:
+    """追踪事件缓冲区（deque.append 是线程安全的，记录时不加锁）"""
+
+    def __init__(self, max_events=DEFAULT_MAX_EVENTS):
+        self.max_events = max_events
+        self.recorded = 0
+        self._events = deque(maxlen=max_events)
+        self._threads = {}
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+        self._async_ids = itertools.count(1)
+
+    @property
+    def dropped(self):
+        """缓冲区满后被丢弃的最早事件数"""
+        return max(0, self.recorded - self.max_events)
+
+    def _tid(self):
+        tid = threading.get_ident()
+        if tid not in self._threads:
+            self._threads[tid] = threading.current_thread().name
+        return tid
+
+    def complete(self, name, cat, start, duration, args=None):
+        """记录一个已结束的span（start 为 time.perf_counter() 时刻，单位秒）"""
+        self.recorded += 1
+        self._events.append(("X", name, cat, start, duration, self._tid(), args))
+
+    def async_complete(self, name, cat, start, duration, args=None):
+        """记录一个已结束的协程span（同一线程中可相互重叠，导出为异步事件）"""
+        self.recorded += 1
+        self._events.append(("A", name, cat, start, duration, next(self._async_ids), args))
+
+    def instant(self, name, cat="event", args=None):
+        self.recorded += 1
+        self._events.append(("i", name, cat, time.perf_counter(), 0.0, self._tid(), args))
+
+    def counter(self, name, values):
+        """记录计数器当前值，values 为 {序列名: 数值}"""
+        self.recorded += 1
+        self._events.append(("C", name, "counter", time.perf_counter(), 0.0, self._tid(), values))
+
+    def export(self, path):
+        """写出 Chrome trace-event JSON，返回写出的事件数"""
+        events = list(self._events)
+        origin = self._origin
+        pid = self._pid
+        with open(path, "w", encoding="utf-8") as f:
+            f.write('{"displayTimeUnit": "ms", "otherData": ')
+            f.write(json.dumps({"tool": "ESP32S3 SuperMini API测试工具", "dropped": self.dropped},
+                               ensure_ascii=False))
+            f.write(',\n"traceEvents": [\n')
+            for tid, name in list(self._threads.items()):
+                f.write(json.dumps({"ph": "M", "name": "thread_name", "pid": pid, "tid": tid,
+                                    "args": {"name": name}}, ensure_ascii=False))
+                f.write(",\n")
+            for i, (ph, name, cat, start, duration, tid, args) in enumerate(events):
+                if i:
+                    f.write(",\n")
+                if ph == "A":
+                    # 协程span: 成对的异步开始/结束事件，按id分行显示
+                    begin = {"ph": "b", "name": name, "cat": cat, "pid": pid, "id": tid,
+                             "ts": round((start - origin) * 1e6, 3)}
+                    if args:
+                        begin["args"] = args
+                    end = {"ph": "e", "name": name, "cat": cat, "pid": pid, "id": tid,
+                           "ts": round((start + duration - origin) * 1e6, 3)}
+                    f.write(json.dumps(begin, ensure_ascii=False, default=str) + ",\n")
+                    f.write(json.dumps(end, ensure_ascii=False))
+                    continue
+                event = {"ph": ph, "name": name, "cat": cat, "pid": pid, "tid": tid,
+                         "ts": round((start - origin) * 1e6, 3)}
+                if ph == "X":
+                    event["dur"] = round(duration * 1e6, 3)
+                elif ph == "i":
+                    event["s"] = "t"
+                if args:
+                    event["args"] = args
+                f.write(json.dumps(event, ensure_ascii=False, default=str))
+            f.write("\n]}\n")
+        return len(events)
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "cat", "args", "start")
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args = dict(self.args or {}, error=exc_type.__name__)
+        self.tracer.complete(self.name, self.cat, self.start, time.perf_counter() - self.start,
+                             self.args)
+
+
+class _NullSpan:
+    """未开启追踪时的空span"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return None
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def start(max_events=DEFAULT_MAX_EVENTS):
+    """开启追踪，返回新的 Tracer（已开启时返回当前的）"""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(max_events)
+    return _tracer
+
+
+def stop():
+    """停止追踪，返回 Tracer（用于导出），未开启时返回None"""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def get_tracer():
+    """当前的追踪器，未开启时为None"""
+    return _tracer
+
+
+def span(name, cat="task", args=None):
+    """with 语句中使用的span"""
+    tracer = _tracer
+    if tracer is None:
+        return _NULL_SPAN
+    return _Span(tracer, name, cat, args)
+
+
+def counter(name, **values):
+    tracer = _tracer
+    if tracer is not None:
+        tracer.counter(name, values)
+
+
+def instant(name, cat="event", **args):
+    tracer = _tracer
+    if tracer is not None:
+        tracer.instant(name, cat, args or None)
+
+
+def traced(name=None, cat="ui"):
+    """装饰器：把每次调用记录为一个span（未开启时直接调用原函数），也可用于协程函数"""
+    def decorate(func):
+        label = name or func.__qualname__
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                tracer = _tracer
+                if tracer is None:
+                    return await func(*args, **kwargs)
+                start_time = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    tracer.async_complete(label, cat, start_time, time.perf_counter() - start_time)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None:
+                return func(*args, **kwargs)
+            start_time = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                tracer.complete(label, cat, start_time, time.perf_counter() - start_time)
+        return wrapper
+    return decorate
+
+
+def trace_request(method, path, start, connect, response, total, status, attempts):
+    """设备请求的分段span：总耗时、TCP连接和首字节（由 DeviceClient 在请求结束后调用）"""
+    tracer = _tracer
+    if tracer is None:
+        return
+    name = f"{method} {path}"
+    tracer.complete(name, "http", start, total, {"status": status, "attempts": attempts})
+    if connect > 0:
+        tracer.complete("连接", "http", start, connect)
+    if response > 0:
+        tracer.complete("首字节", "http", start, min(response, total))
@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ESP32 UDP广播接收基准测试
+
+功能特性：
+1. 在独立进程中按目标速率发送合成组播广播（开环，不受接收端速度影响），
+   内容与固件 handleBroadcast/broadcastIP 拼接的JSON相同（esp32_simulator.VirtualDevice），
+   末尾附加序号字段 "seq"（设备发现只读取已知字段，会忽略它）
+2. 每台虚拟设备从自己的回环地址发送，可配置速率、设备数、设备名长度变化、
+   改名比例和格式错误数据报比例（截断、非JSON、缺少device_id、超长）
+3. 接收端使用真实的 AnnouncementListener，另有一个线程按界面的刷新周期
+   取出设备变更和原始消息（与 flush_discovery 相同的工作，不含Tk控件）
+4. 统计接收吞吐量、按序号计算的丢包/重复/乱序、接收延迟、消息显示到界面的延迟、
+   新设备出现在界面上的延迟、界面刷新耗时和接收线程每个数据报的CPU时间
+5. 结果可保存为JSON基线，之后的运行与基线对比并判断是否退化
+
+作者: ESP32开发团队
+版本: 1.0.0
+日期: 2025-11-06
+"""
+
+import json
+import multiprocessing
+import random
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from esp32_bench import LatencyHistogram
+from esp32_discovery import BUFFER_SIZE, MULTICAST_GROUP, AnnouncementListener, parse_announcement
+
+# 与界面 flush_discovery 相同的刷新参数（esp32_api_tester 依赖Tk，这里不导入）
+UI_FLUSH_FPS = 10
+UI_FLUSH_INTERVAL = 1.0 / UI_FLUSH_FPS
+UI_MESSAGES_PER_FLUSH = 20
+
+DEFAULT_PORT = 18888          # 默认不用8888，避免和网络中的真实设备混在一起
+DEFAULT_BASE_IP = "127.0.1.1"
+START_DELAY = 0.2             # 发送进程就绪后到开始发送的时间
+DRAIN_GRACE = 0.5             # 发送结束后等待在途数据报的时间
+SENDER_TIMEOUT = 30.0
+
+MALFORMED_KINDS = ("truncated", "not_json", "no_device_id", "oversized")
+MAX_NAME_EXTRA = 48           # 设备名变化时追加的最大字符数
+NAME_CHARS = "abcdefghijklmnopqrstuvwxyz0123456789_-客厅卧室灯带"
+
+# 与基线对比时视为退化的阈值
+LOSS_TOLERANCE = 0.001        # 丢包率增加超过0.1个百分点
+THROUGHPUT_DROP = 0.10        # 吞吐量下降超过10%
+LATENCY_GROWTH = 0.25         # p99延迟增加超过25%（且超过 LATENCY_SLACK_MS）
+LATENCY_SLACK_MS = 1.0
+CPU_GROWTH = 0.25             # 每个数据报的CPU时间增加超过25%
+
+# 基准测试配置: 速率(个/秒), 设备数, 时长(秒), 名称变化的设备比例, 改名广播比例,
+# 格式错误数据报比例, 端口, 组播组, 第一个设备的回环地址, 随机种子
+FloodConfig = namedtuple("FloodConfig", ["rate", "devices", "duration", "name_variation", "churn",
+                                         "malformed", "port", "group", "base_ip", "seed"],
+                         defaults=(100, 5.0, 0.0, 0.0, 0.0, DEFAULT_PORT, MULTICAST_GROUP,
+                                   DEFAULT_BASE_IP, 1))
+
+
+def _device_identities(config):
+    """每台虚拟设备的 (device_id, 设备名, MAC)，同一种子总是相同"""
+    rng = random.Random(config.seed)
+    identities = []
+    for _ in range(config.devices):
+        chip_id = rng.getrandbits(48)
+        device_id = f"{chip_id >> 32:x}{chip_id & 0xFFFFFFFF:x}"
+        mac = ":".join(f"{(chip_id >> (8 * i)) & 0xFF:02X}" for i in range(6))
+        name = "ESP32_RGB_Device"
+        if rng.random() < config.name_variation:
+            name += "_" + "".join(rng.choice(NAME_CHARS) for _ in range(rng.randint(1, MAX_NAME_EXTRA)))
+        identities.append((device_id, name, mac))
+    return identities
+
+
+def _malformed_packet(kind, payload, rng):
+    if kind == "truncated":
+        return payload[:rng.randrange(1, len(payload))]
+    if kind == "not_json":
+        return bytes(rng.getrandbits(8) for _ in range(rng.randint(1, 64)))
+    if kind == "no_device_id":
+        return payload.replace(b'"device_id"', b'"device"', 1)
+    # 超过接收缓冲区，接收时被截断
+    return payload[:-1] + b',"padding":"' + b"x" * BUFFER_SIZE + b'"}'
+
+
+def _send_flood(config, conn):
+    """发送进程：打开每台设备的套接字，等待开始时刻，然后按计划发送
+
+    通过 conn 先发送 "ready"，收到开始时刻（time.perf_counter，Linux上为系统范围的单调时钟）
+    后开始发送，结束时发回统计字典。
+    """
+    import socket
+
+    from esp32_simulator import VirtualDevice, allocate_addresses, raise_fd_limit
+
+    stats = {"sent": 0, "valid_sent": 0, "malformed_sent": 0, "send_errors": 0, "late_sends": 0,
+             "first_valid": [-1] * config.devices, "error": ""}
+    sockets = []
+    try:
+        raise_fd_limit(config.devices + 64)
+        prefixes = []
+        renamed = []
+        for ip, (device_id, name, mac) in zip(allocate_addresses(config.base_ip, config.devices),
+                                              _device_identities(config)):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sockets.append(sock)
+            sock.bind((ip, 0))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(ip))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+            # 固件JSON去掉结尾的 "}"，发送时追加 ,"seq":N}
+            prefixes.append(VirtualDevice(ip, device_id=device_id, device_name=name,
+                                          mac=mac).announcement().encode("utf-8")[:-1])
+            renamed.append(VirtualDevice(ip, device_id=device_id, device_name=name + "_renamed",
+                                         mac=mac).announcement().encode("utf-8")[:-1])
+    except OSError as e:
+        for sock in sockets:
+            sock.close()
+        stats["error"] = f"无法创建发送套接字: {e}"
+        conn.send(stats)
+        return
+
+    conn.send("ready")
+    start_at = conn.recv()
+    rng = random.Random(config.seed + 1)
+    destination = (config.group, config.port)
+    total = int(config.rate * config.duration)
+    interval = 1.0 / config.rate
+    devices = config.devices
+    first_valid = stats["first_valid"]
+
+    def send(i):
+        device = i % devices
+        if config.malformed and rng.random() < config.malformed:
+            kind = MALFORMED_KINDS[stats["malformed_sent"] % len(MALFORMED_KINDS)]
+            packet = _malformed_packet(kind, prefixes[device] + b',"seq":%d}' % i, rng)
+            valid = False
+        else:
+            prefix = renamed[device] if config.churn and rng.random() < config.churn else prefixes[device]
+            packet = prefix + b',"seq":%d}' % i
+            valid = True
+        try:
+            sockets[device].sendto(packet, destination)
+        except OSError:
+            stats["send_errors"] += 1
+            return
+        stats["sent"] += 1
+        if valid:
+            stats["valid_sent"] += 1
+            if first_valid[device] < 0:
+                first_valid[device] = i
+        else:
+            stats["malformed_sent"] += 1
+
+    try:
+        delay = start_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        i = 0
+        while i < total:
+            now = time.perf_counter()
+            due = min(total, int((now - start_at) / interval) + 1)
+            if due <= i:
+                time.sleep(start_at + i * interval - now)
+                continue
+            # 一次补发多个说明发送端落后于计划（睡眠精度或调度延迟）
+            stats["late_sends"] += due - i - 1
+            while i < due:
+                send(i)
+                i += 1
+    finally:
+        for sock in sockets:
+            sock.close()
+    conn.send(stats)
+
+
+class _ArrivalProbe:
+    """挂到 AnnouncementListener.recorder 上，只记录到达时刻和原始数据（结束后再分析）"""
+
+    def __init__(self):
+        self.arrivals = []
+
+    def record_announcement(self, ip, data):
+        self.arrivals.append((time.perf_counter(), data))
+
+
+def _seq_of(text):
+    """从广播文本中取出附加的序号，没有时返回None"""
+    pos = text.rfind('"seq":')
+    if pos < 0:
+        return None
+    try:
+        return int(text[pos + 6:text.find("}", pos)])
+    except ValueError:
+        return None
+
+
+class FloodBenchmark:
+    """运行一次UDP广播洪泛测试，返回结果字典"""
+
+    def __init__(self, config):
+        if config.rate <= 0 or config.devices <= 0 or config.duration <= 0:
+            raise ValueError("速率、设备数和时长必须大于0")
+        self.config = config
+        self._stop = threading.Event()
+        self._start_at = 0.0
+        self._interval = 1.0 / config.rate
+        self.listener = None
+
+        # 界面刷新线程的统计
+        self.flush_time = LatencyHistogram()
+        self.ui_latency = LatencyHistogram()
+        self.ui_cpu = 0.0
+        self.flush_count = 0
+        self.messages_skipped = 0
+        self.first_shown = {}     # device_id -> 首次出现在界面的时刻
+
+    def _intended(self, seq):
+        return self._start_at + seq * self._interval
+
+    def _flush(self):
+        """与界面 flush_discovery 相同的工作：设备变更、每秒一次的离线检查、最近的原始消息"""
+        listener = self.listener
+        start = time.perf_counter()
+        cpu = time.thread_time()
+        changes = listener.index.drain_changes()
+        # 只构造界面会插入的行和文本，不创建控件
+        rows = [(device.ip, device.device_id, device.device_name, "在线") for device, _ in changes]
+        self.flush_count += 1
+        if self.flush_count % UI_FLUSH_FPS == 0:
+            now = time.monotonic()
+            for device in listener.index:
+                device.age(now)
+        messages = listener.drain_messages()
+        shown = messages[-UI_MESSAGES_PER_FLUSH:]
+        text = "\n".join(f"来自 {ip}: {line}" for ip, line in shown)
+        # rows/text 只用来计入界面格式化的开销，基准测试不显示它们
+        del rows, text
+        end = time.perf_counter()
+        self.ui_cpu += time.thread_time() - cpu
+        self.flush_time.record(end - start)
+
+        self.messages_skipped += len(messages) - len(shown)
+        for device, old_ip in changes:
+            if old_ip is None:
+                self.first_shown.setdefault(device.device_id, end)
+        for _, line in shown:
+            seq = _seq_of(line)
+            if seq is not None:
+                self.ui_latency.record(end - self._intended(seq))
+
+    def _ui_loop(self):
+        while not self._stop.wait(UI_FLUSH_INTERVAL):
+            self._flush()
+        self._flush()
+
+    def run(self):
+        config = self.config
+        probe = _ArrivalProbe()
+        self.listener = listener = AnnouncementListener(group=config.group, port=config.port,
+                                                        interfaces=["127.0.0.1"])
+        listener.recorder = probe
+        listener.start()
+        ui_thread = threading.Thread(target=self._ui_loop, name="udpbench-ui", daemon=True)
+
+        parent_conn, child_conn = multiprocessing.Pipe()
+        sender = multiprocessing.Process(target=_send_flood, args=(config, child_conn),
+                                         name="udpbench-sender", daemon=True)
+        try:
+            sender.start()
+            if not parent_conn.poll(SENDER_TIMEOUT):
+                raise RuntimeError("发送进程没有就绪")
+            message = parent_conn.recv()
+            if message != "ready":
+                raise OSError(message["error"])
+            cpu_start = listener.cpu_time()
+            self._start_at = time.perf_counter() + START_DELAY
+            ui_thread.start()
+            parent_conn.send(self._start_at)
+            if not parent_conn.poll(config.duration + SENDER_TIMEOUT):
+                raise RuntimeError("发送进程没有结束")
+            sent = parent_conn.recv()
+            time.sleep(DRAIN_GRACE)
+            cpu_end = listener.cpu_time()
+            self._stop.set()
+            ui_thread.join()
+        finally:
+            self._stop.set()
+            listener.stop()
+            sender.join(timeout=2.0)
+            if sender.is_alive():
+                sender.terminate()
+        cpu = None if cpu_start is None or cpu_end is None else cpu_end - cpu_start
+        return self._result(sent, probe.arrivals, cpu)
+
+    def _result(self, sent, arrivals, listener_cpu):
+        config = self.config
+        total = int(config.rate * config.duration)
+        seen = bytearray(total)
+        receive_latency = LatencyHistogram()
+        unique = duplicates = reordered = malformed = 0
+        highest = -1
+        for when, data in arrivals:
+            info = parse_announcement(data)
+            seq = info.get("seq") if info is not None else None
+            if not isinstance(seq, int) or not 0 <= seq < total:
+                malformed += 1
+                continue
+            if seen[seq]:
+                duplicates += 1
+                continue
+            seen[seq] = 1
+            unique += 1
+            if seq < highest:
+                reordered += 1
+            highest = max(highest, seq)
+            receive_latency.record(max(0.0, when - self._intended(seq)))
+
+        discovery_latency = LatencyHistogram()
+        for (device_id, _, _), first in zip(_device_identities(config), sent["first_valid"]):
+            shown = self.first_shown.get(device_id)
+            if shown is not None and first >= 0:
+                discovery_latency.record(max(0.0, shown - self._intended(first)))
+
+        received = len(arrivals)
+        window = arrivals[-1][0] - self._start_at if arrivals else 0.0
+        lost = max(0, sent["valid_sent"] - unique)
+        return {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "config": config._asdict(),
+            "sent": sent["sent"],
+            "valid_sent": sent["valid_sent"],
+            "malformed_sent": sent["malformed_sent"],
+            "send_errors": sent["send_errors"],
+            "late_sends": sent["late_sends"],
+            "received": received,
+            "malformed_received": malformed,
+            "unique": unique,
+            "lost": lost,
+            "loss_ratio": lost / sent["valid_sent"] if sent["valid_sent"] else 0.0,
+            "duplicates": duplicates,
+            "reordered": reordered,
+            "throughput": received / window if window > 0 else 0.0,
+            "devices_discovered": len(self.first_shown),
+            "receive_latency_ms": receive_latency.summary_ms(),
+            "ui_latency_ms": self.ui_latency.summary_ms(),
+            "discovery_latency_ms": discovery_latency.summary_ms(),
+            "ui_flush_ms": self.flush_time.summary_ms(),
+            "ui_flushes": self.flush_count,
+            "messages_skipped": self.messages_skipped,
+            "cpu_per_packet_us": listener_cpu / received * 1e6 if listener_cpu is not None and received
+            else None,
+            "ui_cpu_per_packet_us": self.ui_cpu / received * 1e6 if received else None,
+        }
+
+
+def run_flood(config):
+    """运行一次洪泛测试，返回结果字典"""
+    return FloodBenchmark(config).run()
+
+
+def format_flood(result):
+    """格式化为文本摘要"""
+    config = result["config"]
+    rx = result["receive_latency_ms"]
+    ui = result["ui_latency_ms"]
+    found = result["discovery_latency_ms"]
+    cpu = result["cpu_per_packet_us"]
+    lines = [
+        f"UDP广播洪泛 {config['rate']:g}/s, {config['devices']} 台设备, {config['duration']:g}s "
+        f"(格式错误 {config['malformed']:.0%}, 改名 {config['churn']:.0%}, "
+        f"名称变化 {config['name_variation']:.0%})",
+        f"发送: {result['sent']} (有效 {result['valid_sent']}, 格式错误 {result['malformed_sent']}, "
+        f"发送失败 {result['send_errors']}, 补发 {result['late_sends']})",
+        f"接收: {result['received']} | 吞吐量: {result['throughput']:.0f} 个/秒 | "
+        f"丢包: {result['lost']} ({result['loss_ratio']:.2%}) | 重复: {result['duplicates']} | "
+        f"乱序: {result['reordered']}",
+        f"接收延迟(ms): p50={rx['p50']:.2f} p99={rx['p99']:.2f} max={rx['max']:.2f}",
+        f"界面显示延迟(ms): p50={ui['p50']:.1f} p99={ui['p99']:.1f} max={ui['max']:.1f}",
+        f"新设备出现在界面(ms): p50={found['p50']:.1f} p99={found['p99']:.1f} "
+        f"({result['devices_discovered']}/{config['devices']} 台)",
+        f"界面刷新耗时(ms): p50={result['ui_flush_ms']['p50']:.2f} p99={result['ui_flush_ms']['p99']:.2f} | "
+        f"接收线程CPU: {'-' if cpu is None else f'{cpu:.1f}'} µs/个",
+    ]
+    return "\n".join(lines)
+
+
+def export_flood(results, filename=None):
+    """把一组结果保存为JSON基线，返回文件名"""
+    if filename is None:
+        filename = f"esp32_udpbench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump({"runs": results}, f, ensure_ascii=False, indent=2)
+    return filename
+
+
+def load_flood(filename):
+    """读取 export_flood 保存的基线，返回结果列表"""
+    with open(filename, encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or not isinstance(data.get("runs"), list):
+        raise ValueError(f"{filename} 不是UDP基准测试结果文件")
+    return data["runs"]
+
+
+def compare_flood(baseline, current):
+    """对比同一配置的两次结果，返回 (文本, [退化说明, ...])"""
+    regressions = []
+    lines = [f"{'指标':<16}{'基线':>10}{'当前':>10}{'变化':>10}"]
+
+    def row(label, a, b, regressed):
+        if a is None or b is None:
+            return
+        change = (b - a) / a * 100 if a else 0.0
+        mark = "  退化" if regressed else ""
+        lines.append(f"{label:<16}{a:>10.2f}{b:>10.2f}{change:>+9.1f}%{mark}")
+        if regressed:
+            regressions.append(f"{label}: {a:.2f} -> {b:.2f}")
+
+    a, b = baseline["loss_ratio"] * 100, current["loss_ratio"] * 100
+    row("丢包率(%)", a, b, b > a + LOSS_TOLERANCE * 100)
+    a, b = baseline["throughput"], current["throughput"]
+    row("吞吐量(个/秒)", a, b, b < a * (1 - THROUGHPUT_DROP))
+    for label, key in (("接收p99(ms)", "receive_latency_ms"), ("界面p99(ms)", "ui_latency_ms"),
+                       ("新设备p99(ms)", "discovery_latency_ms")):
+        a, b = baseline[key]["p99"], current[key]["p99"]
+        row(label, a, b, b > a * (1 + LATENCY_GROWTH) and b - a > LATENCY_SLACK_MS)
+    a, b = baseline["cpu_per_packet_us"], current["cpu_per_packet_us"]
+    row("CPU(µs/个)", a, b, a is not None and b is not None and b > a * (1 + CPU_GROWTH))
+    return "\n".join(lines), regressions
+
+
+def find_baseline(baseline_runs, result):
+    """在基线中找到与结果配置相同的运行，找不到时返回None"""
+    config = dict(result["config"])
+    for run in baseline_runs:
+        if run.get("config") == config:
+            return run
+    return None
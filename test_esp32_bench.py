@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+esp32_bench 结果导出与基线对比的测试
+
+运行: python -m pytest test_esp32_bench.py
+"""
+
+import pytest
+
+from esp32_bench import compare_results, export_result, load_result
+
+
+def _result(p50, throughput, rate=50.0):
+    latency = {"p50": p50, "p90": p50 * 2, "p99": p50 * 3, "p99.9": p50 * 4, "max": p50 * 5}
+    return {"endpoint": "info", "mode": "open-loop", "target_rate": rate, "concurrency": 4,
+            "latency_ms": latency, "throughput": throughput}
+
+
+def test_exported_result_loads_as_baseline(tmp_path):
+    result = _result(10.0, 50.0)
+    filename = export_result(result, str(tmp_path / "fw.json"))
+    assert load_result(filename) == result
+
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / "udp.json"
+    path.write_text('{"runs": []}', encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_result(str(path))
+
+
+def test_compare_reports_change_and_config_mismatch():
+    lines = compare_results(_result(10.0, 50.0), _result(12.0, 40.0)).splitlines()
+    assert not any(line.startswith("注意") for line in lines)
+    assert "+20.0%" in lines[1]
+    assert "-20.0%" in lines[-1]
+    lines = compare_results(_result(10.0, 50.0), _result(10.0, 50.0, rate=100.0)).splitlines()
+    assert lines[0].startswith("注意: 目标速率不同")
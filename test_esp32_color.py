@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+esp32_color 批量转换与标量转换的逐像素一致性测试
+
+运行: python -m pytest test_esp32_color.py
+"""
+
+import random
+
+import pytest
+
+from esp32_color import LUT_SHAPE, hsv_to_rgb, hsv_to_rgb_array, hsv_to_rgb_lut, rgb_to_hsv, rgb_to_hsv_array
+
+np = pytest.importorskip("numpy")
+
+
+def test_lut_matches_scalar_on_full_integer_grid():
+    h, s, v = np.meshgrid(np.arange(LUT_SHAPE[0]), np.arange(LUT_SHAPE[1]), np.arange(LUT_SHAPE[2]),
+                          indexing="ij")
+    actual = hsv_to_rgb_lut(h, s, v).reshape(-1, 3).tolist()
+    expected = [hsv_to_rgb(hue, sat, val)
+                for hue in range(LUT_SHAPE[0])
+                for sat in range(LUT_SHAPE[1])
+                for val in range(LUT_SHAPE[2])]
+    assert [tuple(rgb) for rgb in actual] == expected
+
+
+def test_lut_wraps_and_clamps_integer_input_like_scalar():
+    h = [-360, -1, 360, 719, 45]
+    s = [-10, 50, 150, 100, 0]
+    v = [100, -5, 100, 200, 50]
+    actual = [tuple(rgb) for rgb in hsv_to_rgb_lut(h, s, v).tolist()]
+    assert actual == [hsv_to_rgb(*args) for args in zip(h, s, v)]
+
+
+def test_float_array_matches_scalar_including_out_of_range():
+    rng = random.Random(5)
+    points = [(rng.uniform(-720, 1080), rng.uniform(-50, 150), rng.uniform(-50, 150))
+              for _ in range(200000)]
+    # 扇区边界、负零和超出范围的边界值
+    for hue in (-360.0, -60.0, -0.0, 0.0, 59.999999, 60.0, 119.99, 120.0, 180.0, 240.0, 300.0,
+                359.999999, 360.0, 420.5):
+        for sat in (-1.0, 0.0, 33.3, 100.0, 100.5):
+            for val in (-1.0, 0.0, 66.6, 100.0, 250.0):
+                points.append((hue, sat, val))
+    h, s, v = (np.array(column) for column in zip(*points))
+    actual = [tuple(rgb) for rgb in hsv_to_rgb_array(h, s, v).tolist()]
+    assert actual == [hsv_to_rgb(*point) for point in points]
+
+
+def test_rgb_to_hsv_array_matches_scalar():
+    rng = random.Random(7)
+    colors = [(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(200000)]
+    # 灰阶、单通道和两通道相等（max 分支的并列情况）
+    colors += [(n, n, n) for n in range(256)]
+    colors += [(n, 0, 0) for n in range(256)] + [(0, n, 0) for n in range(256)] + \
+              [(0, 0, n) for n in range(256)]
+    colors += [(n, n, 0) for n in range(256)] + [(0, n, n) for n in range(256)] + \
+              [(n, 0, n) for n in range(256)]
+    actual = [tuple(hsv) for hsv in rgb_to_hsv_array(np.array(colors)).tolist()]
+    assert actual == [rgb_to_hsv(*rgb) for rgb in colors]
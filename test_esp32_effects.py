@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+esp32_effects 过期帧合并策略的测试
+
+运行: python -m pytest test_esp32_effects.py
+"""
+
+import time
+
+from esp32_effects import POLICY_MERGE, EffectPlayer
+from esp32_state import DeviceState, apply_sequence
+
+
+def test_merge_policy_keeps_sequential_state():
+    # color 帧之后是 HSV 帧：合并成一个请求会让设备停在预设颜色模式
+    frames = [{"color": 3}, {"hue": 10, "saturation": 50}, {"value": 20}, {"color": 5}, {"hue": 100}] * 4
+    sent = []
+
+    def send(params):
+        sent.append(params)
+        time.sleep(0.03)
+
+    stats = EffectPlayer(send, fps=100, policy=POLICY_MERGE).play(frames)
+    assert stats.merged > 0
+    assert len(sent) < len(frames)
+    expected = apply_sequence(DeviceState(), frames).info_fields()
+    assert apply_sequence(DeviceState(), sent).info_fields() == expected
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+esp32_results.ResultStore 的JSONL历史测试
+
+运行: python -m pytest test_esp32_results.py
+"""
+
+from esp32_results import ResultRecord, ResultStore
+
+
+def _names(store):
+    return [row["test_name"] for row in store.rows()]
+
+
+def test_history_skips_existing_file_content(tmp_path):
+    path = tmp_path / "results.jsonl"
+    path.write_text('{"test_name": "上次运行", "timestamp": 0}\n', encoding="utf-8")
+    store = ResultStore(spill_path=str(path))
+    store.append(ResultRecord("第一条", "成功"))
+    store.append(ResultRecord("第二条", "失败"))
+    assert _names(store) == ["第一条", "第二条"]
+    store.close()
+
+
+def test_clear_skips_by_file_offset_not_timestamp(tmp_path):
+    store = ResultStore(capacity=1, spill_path=str(tmp_path / "results.jsonl"))
+    store.append(ResultRecord("清空前", "成功"))
+    # 清空前创建、清空后追加的记录，以及时钟回拨后的记录都属于新的历史
+    created_before = ResultRecord("清空前创建", "成功")
+    store.clear()
+    store.append(created_before)
+    store.append(ResultRecord("时钟回拨", "成功", timestamp=1.0))
+    assert _names(store) == ["清空前创建", "时钟回拨"]
+    assert [record.test_name for record in store.history()] == ["清空前创建", "时钟回拨"]
+    store.close()
+
+
+def test_history_stops_at_offset_when_iteration_starts(tmp_path):
+    store = ResultStore(spill_path=str(tmp_path / "results.jsonl"))
+    for n in range(3):
+        store.append(ResultRecord(f"记录{n}", "成功"))
+    rows = store.rows()
+    assert next(rows)["test_name"] == "记录0"
+    # 遍历期间继续追加（含未刷新的半行）不影响本次遍历
+    store.append(ResultRecord("遍历期间追加", "成功"))
+    store._spill.write('{"test_name": "半')
+    store._spill.flush()
+    assert [row["test_name"] for row in rows] == ["记录1", "记录2"]
+    store.close()
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+esp32_scenario 场景编译的校验测试
+
+运行: python -m pytest test_esp32_scenario.py
+"""
+
+import pytest
+
+from esp32_scenario import ScenarioError, compile_scenario
+
+
+def test_loop_compiles_inner_steps():
+    inner = [{"control": {"hue": 10}, "expect": {"hsv_hue": 10}}]
+    once = compile_scenario({"steps": inner})
+    scenario = compile_scenario({"steps": [{"loop": 2, "steps": inner, "wait": 0.5}]})
+    assert len(scenario) == 2 * len(once)
+    assert scenario.duration == pytest.approx(2 * once.duration + 0.5)
+
+
+@pytest.mark.parametrize("key, value", [
+    ("name", "循环"),
+    ("budget_ms", 100),
+    ("expect", {"rgb_color": 3}),
+    ("sweep", {"hue": [0, 60]}),
+])
+def test_loop_rejects_step_options(key, value):
+    step = {"loop": 2, "steps": [{"control": {"color": 3}}], key: value}
+    with pytest.raises(ScenarioError) as excinfo:
+        compile_scenario({"steps": [step]})
+    assert excinfo.value.path == f"steps[0].{key}"
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+esp32_state.CommandBuilder 合并命令的测试：状态模型上的随机验证，以及在模拟器上
+逐个发送与合并发送后 /api/info 状态一致
+
+运行: python -m pytest test_esp32_state.py
+"""
+
+import random
+
+import pytest
+
+from esp32_client import DeviceClient
+from esp32_simulator import DeviceSimulator
+from esp32_state import INFO_FIELDS, CommandBuilder, DeviceState, combined_mismatch, random_commands, random_state
+
+LIGHT_FIELDS = [field for _, field in INFO_FIELDS if field != "broadcast_enabled"]
+
+
+def test_random_commands_match_sequential_state():
+    rng = random.Random(25)
+    for _ in range(3000):
+        commands = random_commands(rng, rng.randint(1, 12))
+        assert combined_mismatch(commands, random_state(rng)) == []
+
+
+def test_valid_commands_merge_into_one_request():
+    commands = [{"hue": 10}, {"saturation": 20, "power": "on"}, {"hue": 30, "brightness": 40}]
+    assert CommandBuilder(commands).build() == [
+        {"hue": 30, "saturation": 20, "brightness": 40, "power": "on"}]
+
+
+def test_color_then_hsv_is_split():
+    # 固件在同一请求中先处理 HSV 再处理 color，合成一个请求会停在预设颜色模式
+    commands = [{"color": 3}, {"hue": 10}]
+    assert CommandBuilder(commands).build() == [{"color": 3}, {"hue": 10}]
+    assert combined_mismatch(commands) == []
+    state = DeviceState()
+    state.apply_control({"color": "3", "hue": "10"})
+    assert not state.use_hsv_mode
+
+
+def test_hsv_then_color_stays_one_request():
+    commands = [{"hue": 10, "value": 50}, {"color": 3}]
+    assert CommandBuilder(commands).build() == [{"hue": 10, "value": 50, "color": 3}]
+    assert combined_mismatch(commands) == []
+
+
+@pytest.mark.parametrize("barrier", [
+    {"hue": 20, "duration": 1},
+    {"hue": 20, "blink": 1},
+    {"hue": 400},
+    {"color": 9, "value": 30},
+    {"power": "toggle"},
+])
+def test_barrier_is_sent_alone(barrier):
+    commands = [{"hue": 10}, {"saturation": 30}, barrier, {"value": 40}, {"power": "on"}]
+    assert CommandBuilder(commands).build() == [
+        {"hue": 10, "saturation": 30}, barrier, {"value": 40, "power": "on"}]
+    assert combined_mismatch(commands) == []
+    assert combined_mismatch(commands, random_state(random.Random(1))) == []
+
+
+def test_none_values_are_ignored():
+    builder = CommandBuilder().add(hue=None).add(hue=5, value=None)
+    assert len(builder) == 1
+    assert builder.build() == [{"hue": 5}]
+
+
+@pytest.fixture(scope="module")
+def devices():
+    simulator = DeviceSimulator(count=2, base_ip="127.0.1.221", port=18085,
+                                service_time=0.0, jitter=0.0).start()
+    try:
+        yield DeviceClient(simulator.addresses[0]), DeviceClient(simulator.addresses[1])
+    finally:
+        simulator.stop()
+
+
+def _send(client, requests):
+    for params in requests:
+        client.control(**params)
+
+
+def _light_state(client):
+    info = client.info().json()
+    return {field: info.get(field) for field in LIGHT_FIELDS}
+
+
+def test_simulator_sequential_and_combined_agree(devices):
+    sequential, combined = devices
+    rng = random.Random(2025)
+    for _ in range(60):
+        state = random_state(rng)
+        hsv = {"hue": state.hsv_hue, "saturation": state.hsv_saturation, "value": state.hsv_value}
+        color = {"color": state.current_rgb_color}
+        setup = [color, hsv] if state.use_hsv_mode else [hsv, color]
+        setup.append({"brightness": state.rgb_brightness, "power": "on" if state.rgb_enabled else "off"})
+        for client in devices:
+            _send(client, CommandBuilder(setup).build())
+
+        commands = random_commands(rng, rng.randint(1, 10))
+        requests = CommandBuilder(commands).build()
+        _send(sequential, commands)
+        _send(combined, requests)
+        assert len(requests) <= len(commands)
+        assert _light_state(sequential) == _light_state(combined), (commands, requests)
+
+
+def test_simulator_color_then_hsv(devices):
+    sequential, combined = devices
+    commands = [{"color": 2, "power": "on"}, {"hue": 200, "saturation": 80}]
+    _send(sequential, commands)
+    _send(combined, CommandBuilder(commands).build())
+    assert _light_state(combined)["hsv_mode"] is True
+    assert _light_state(sequential) == _light_state(combined)
+
+
+def test_simulator_barriers(devices):
+    sequential, combined = devices
+    commands = [{"hue": 10, "power": "on"}, {"hue": 20, "duration": 1}, {"saturation": 30},
+                {"blink": 1}, {"value": 101}, {"color": 4}, {"hue": 400}, {"value": 60}]
+    _send(sequential, commands)
+    _send(combined, CommandBuilder(commands).build())
+    assert _light_state(sequential) == _light_state(combined)
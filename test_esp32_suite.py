@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+esp32_suite.SuiteRunner 在引擎事件循环中运行的测试：停止、取消和设备超时都立即中断在途请求
+
+运行: python -m pytest test_esp32_suite.py
+"""
+
+import concurrent.futures
+import time
+
+import pytest
+
+from esp32_async import AsyncDeviceClient, EngineLoop
+from esp32_simulator import DeviceSimulator
+from esp32_suite import SuiteRunner, SuiteStep, full_test_steps
+
+
+@pytest.fixture(scope="module")
+def simulator():
+    simulator = DeviceSimulator(count=3, base_ip="127.0.1.231", port=18086,
+                                service_time=0.0, jitter=0.0).start()
+    try:
+        yield simulator
+    finally:
+        simulator.stop()
+
+
+@pytest.fixture
+def engine_loop():
+    loop = EngineLoop()
+    loop.start()
+    try:
+        yield loop
+    finally:
+        loop.stop()
+
+
+@pytest.fixture
+def slow(simulator):
+    simulator.service_time = 3.0
+    try:
+        yield simulator
+    finally:
+        simulator.service_time = 0.0
+
+
+def _runner(**options):
+    clients = {}
+
+    def get_client(ip):
+        if ip not in clients:
+            clients[ip] = AsyncDeviceClient(ip, retries=0)
+        return clients[ip]
+
+    return SuiteRunner(get_client, **options)
+
+
+def test_runs_all_steps_on_every_device(simulator, engine_loop):
+    steps = full_test_steps(delay=0.0, broadcast_wait=0.0)
+    finished = []
+    runs = engine_loop.run(_runner().run(simulator.addresses, steps, on_device=finished.append))
+    assert [run.ip for run in runs] == simulator.addresses
+    assert all(run.ok and run.passed == len(steps) for run in runs)
+    assert sorted(run.ip for run in finished) == sorted(simulator.addresses)
+
+
+def test_stop_interrupts_in_flight_requests(slow, engine_loop):
+    runner = _runner()
+    finished = []
+    future = engine_loop.submit(runner.run(slow.addresses, [SuiteStep("信息", "info", (), {}, 0.0)],
+                                           on_device=finished.append))
+    time.sleep(0.3)
+    start = time.monotonic()
+    runner.stop()
+    runs = future.result(2.0)
+    assert time.monotonic() - start < 1.0
+    assert [run.aborted for run in runs] == ["已停止"] * len(slow.addresses)
+    assert len(finished) == len(slow.addresses)
+
+
+def test_cancel_reports_devices_then_raises(slow, engine_loop):
+    finished = []
+    future = engine_loop.submit(_runner().run(slow.addresses, [SuiteStep("信息", "info", (), {}, 0.0)],
+                                              on_device=finished.append), group="suite")
+    time.sleep(0.3)
+    engine_loop.cancel("suite")
+    with pytest.raises(concurrent.futures.CancelledError):
+        future.result(2.0)
+    assert [run.aborted for run in finished] == ["已停止"] * len(slow.addresses)
+
+
+def test_device_timeout_cancels_request(slow, engine_loop):
+    start = time.monotonic()
+    runs = engine_loop.run(_runner(device_timeout=0.3).run(
+        slow.addresses[:1], [SuiteStep("信息", "info", (), {}, 0.0)]), timeout=2.0)
+    assert time.monotonic() - start < 1.0
+    assert runs[0].aborted.startswith("超时")
+
+
+def test_client_timeout_is_not_retried(slow, engine_loop):
+    # 使用默认 retries：超时不能被当作连接错误重试
+    client = AsyncDeviceClient(slow.addresses[0], timeout=0.5)
+    start = time.monotonic()
+    with pytest.raises(TimeoutError, match="请求超时"):
+        engine_loop.run(client.info(), timeout=5.0)
+    assert time.monotonic() - start < 1.0
+    assert client.last_timing.attempts == 1
+    assert client.error_count == 1